@@ -1,6 +1,5 @@
-from services.training_service import TrainingManager
-from services.task_monitor import TaskMonitor
-from ui.interface import create_ui
+from config import Config
+import argparse
 import threading
 import signal
 import sys
@@ -11,9 +10,17 @@ def signal_handler(signum, frame):
     sys.exit(0)
 
 class Application:
-    def __init__(self):
+    def __init__(self, mode: str = Config.APP_MODE):
+        # 各运行模式只导入自己用到的模块，monitor 模式不加载 Gradio
+        from services.training_service import TrainingManager
+
+        self.mode = mode
         self.training_manager = TrainingManager()
-        self.task_monitor = TaskMonitor()
+        # ui 模式下监控由独立进程（python -m services.task_monitor）运行
+        self.task_monitor = None
+        if mode == "all":
+            from services.task_monitor import TaskMonitor
+            self.task_monitor = TaskMonitor()
         self.monitor_thread = None
         self._running = True
         
@@ -43,12 +50,16 @@ class Application:
     def start(self):
         """启动应用"""
         try:
-            # 启动监控线程
-            print("启动监控线程...")
-            self.start_monitor()
+            if self.task_monitor is not None:
+                # 启动监控线程
+                print("启动监控线程...")
+                self.start_monitor()
+            else:
+                print("仅运行界面，任务监控由独立进程运行")
             
             # 创建并启动 Gradio 界面
             print("启动 Gradio 界面...")
+            from ui.interface import create_ui
             demo = create_ui(self.training_manager)
             demo.queue()  # 移除 concurrency_count 参数
             demo.launch(
@@ -67,8 +78,25 @@ class Application:
             self._running = False
 
 def main():
-    """主程序入口"""
-    app = Application()
+    """主程序入口
+
+    运行模式（--mode 或环境变量 APP_MODE）：
+        all      界面与监控线程在同一进程中运行（默认）
+        ui       只运行界面，监控由独立进程运行，二者可分别扩缩和重启
+        monitor  只运行监控，等同于 python -m services.task_monitor
+
+    启动时不创建数据库表，部署或升级后先执行一次 python pg_db.py migrate。
+    """
+    parser = argparse.ArgumentParser(description="LoRA 训练任务管理")
+    parser.add_argument("--mode", choices=["all", "ui", "monitor"], default=Config.APP_MODE)
+    args = parser.parse_args()
+
+    if args.mode == "monitor":
+        from services.task_monitor import main as run_monitor
+        run_monitor()
+        return
+
+    app = Application(args.mode)
     app.start()
 
 if __name__ == "__main__":
@@ -2,7 +2,12 @@ import os
 
 class Config:
     """应用配置类"""
-    TOOLKIT_URL = os.getenv('TOOLKIT_URL', 'http://172.25.0.1:7861')
+    TOOLKIT_URL = os.getenv('TOOLKIT_URL', 'http://172.25.0.1:7861').rstrip('/')
+    # 训练节点列表（逗号分隔），新任务分配给负载最低的节点；未设置时只使用 TOOLKIT_URL
+    TOOLKIT_URLS = [url.strip().rstrip('/') for url in os.getenv('TOOLKIT_URLS', TOOLKIT_URL).split(',') if url.strip()]
+    TOOLKIT_PROBE_INTERVAL = 15  # 训练节点健康状态与容量的探测间隔（秒）
+    TOOLKIT_PROBE_TIMEOUT = 5  # 探测训练节点的超时时间（秒）
+    TOOLKIT_DEFAULT_CAPACITY = int(os.getenv('TOOLKIT_DEFAULT_CAPACITY', 1))  # 不支持 /capacity 的节点按此估计可同时训练的任务数
     GET_FILES_URL = os.getenv('GET_FILES_URL', 'http://localhost:8000')
     DB_HOST = os.getenv('DB_HOST', '120.79.187.70')  # 添加数据库主机配置
     DATABASE_URL = os.getenv(
@@ -11,8 +16,45 @@ class Config:
     )
     VALID_IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png']
     VALID_CONFIG_EXTENSIONS = ['.yaml', '.yml']
-    MONITOR_INTERVAL = 10  # 监控间隔时间（秒）
-    REQUEST_TIMEOUT = 30  # 请求超时时间（秒）
+    APP_MODE = os.getenv('APP_MODE', 'all')  # app.py 运行模式：all 界面与监控线程，ui 只运行界面，monitor 只运行监控
+    MONITOR_INTERVAL = 10  # 认领待监控任务、续期租约、写入心跳的间隔时间（秒）
+    MONITOR_HEARTBEAT_TIMEOUT = int(os.getenv('MONITOR_HEARTBEAT_TIMEOUT', 30))  # 监控进程超过该时长没有心跳视为已停止（秒）
+    MONITOR_HEARTBEAT_RETENTION = 86400  # 已停止的监控进程心跳记录保留时长（秒）
+    MONITOR_LEASE_SECONDS = int(os.getenv('MONITOR_LEASE_SECONDS', 60))  # 任务租约时长（秒），进程失联超过该时长后任务由其他进程接管
+    MONITOR_MAX_CLAIMED = int(os.getenv('MONITOR_MAX_CLAIMED', 1000))  # 单个监控进程最多同时持有的任务数
+    MONITOR_CLAIM_BATCH = int(os.getenv('MONITOR_CLAIM_BATCH', 200))  # 每次最多认领的任务数，多个监控进程据此分摊任务
+    MONITOR_CONCURRENCY = int(os.getenv('MONITOR_CONCURRENCY', 20))  # 同时进行的状态查询数
+    MONITOR_BATCH_SIZE = int(os.getenv('MONITOR_BATCH_SIZE', 50))  # 每批查询后在一个事务中提交的任务数
+    MONITOR_BATCH_WINDOW = 1.0  # 有任务到期时，把该时间内即将到期的任务合并到同一批（秒）
+    MONITOR_POLL_INTERVALS = {  # 各状态的 (初始, 最大) 轮询间隔（秒），状态不变时按倍数退避
+        'pending': (5, 30),
+        'training': (10, 120),
+        'run_before': (5, 120),  # get_files 未确认接收下载作业时重新发送的间隔
+    }
+    MONITOR_DISPATCH_RECHECK = int(os.getenv('MONITOR_DISPATCH_RECHECK', 600))  # get_files 已接收下载作业后，任务仍未进入 running 时重新发送的间隔（秒）
+    MONITOR_BACKOFF_FACTOR = 1.5  # 轮询间隔退避倍数
+    MONITOR_NEAR_DONE_INTERVAL = 3  # 预计即将训练完成时的轮询间隔（秒）
+    MONITOR_NEAR_DONE_RATIO = 0.8  # 已训练时长达到预计时长的该比例后视为即将完成
+    REQUEST_TIMEOUT = 30  # 调用 toolkit 接口的读取超时时间（秒），连接超时与上传下载的超时见 http_client
+    PREPROCESS_MAX_SIZE = int(os.getenv('PREPROCESS_MAX_SIZE', 1024))  # 上传前将图片长边缩小到该尺寸以内（像素）
+    PREPROCESS_JPEG_QUALITY = 95  # 重新编码 JPEG 的质量
+    PREPROCESS_WORKERS = int(os.getenv('PREPROCESS_WORKERS', os.cpu_count() or 1))  # 图片预处理进程数
+    UPLOAD_RESERVATION_TTL = int(os.getenv('UPLOAD_RESERVATION_TTL', 3600))  # 上传中的任务超过该时长未续期视为遗留，释放其名称（秒）
+    UPLOAD_RESERVATION_RENEW_INTERVAL = int(os.getenv('UPLOAD_RESERVATION_RENEW_INTERVAL', 300))  # 预处理与上传期间续期任务名称占用的间隔（秒），须小于 UPLOAD_RESERVATION_TTL
+    UPLOAD_SLOTS = int(os.getenv('UPLOAD_SLOTS', 2))  # 同时进行的训练提交（预处理与上传）数
+    UPLOAD_MAX_QUEUED = int(os.getenv('UPLOAD_MAX_QUEUED', 50))  # 排队中的提交总数上限
+    UPLOAD_MAX_QUEUED_PER_USER = int(os.getenv('UPLOAD_MAX_QUEUED_PER_USER', 3))  # 每个用户排队中的提交数上限
+    UPLOAD_BANDWIDTH_LIMIT = int(float(os.getenv('UPLOAD_BANDWIDTH_LIMIT_MB', 0)) * 1024 * 1024)  # 上传到 toolkit 的总带宽上限（字节/秒），0 表示不限
+    UPLOAD_QUEUE_REFRESH = 1.0  # 排队期间刷新排队位置的间隔（秒）
+    UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 64 * 1024))  # 上传训练文件时每次读取的字节数
+    UPLOAD_BUNDLE_FORMAT = os.getenv('UPLOAD_BUNDLE_FORMAT', '')  # 整体上传时的打包格式：tar、tar.zst（需安装 zstandard），留空为逐个文件的多部分上传
+    STATUS_PROBE_BATCH = int(os.getenv('STATUS_PROBE_BATCH', 100))  # 每次批量状态查询包含的任务数
+    STATUS_PROBE_RECHECK = 300  # toolkit 不支持批量状态接口时，重新探测的间隔（秒）
+    TOOLKIT_PROTOCOL_RECHECK = int(os.getenv('TOOLKIT_PROTOCOL_RECHECK', 300))  # toolkit 不支持按内容寻址或打包上传接口时，重新探测的间隔（秒）
+    TASK_PAGE_SIZE = int(os.getenv('TASK_PAGE_SIZE', 20))  # 任务列表每页行数
+    TASK_LIST_POLL_INTERVAL = 3  # 页面读取共享任务列表的间隔（秒），不访问数据库
+    TASK_LIST_REFRESH_INTERVAL = 10  # 未收到 NOTIFY 时共享任务列表的兜底刷新间隔（秒）
+    RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', 256))  # 任务结果缓存的条目数
 
     # 高级设置默认值（确保所有数值都是整数）
     ADVANCED_SETTINGS = {
@@ -5,12 +5,19 @@
 @Date : 2024/12/21 09:43
 """
 # pip install fastapi uvicorn sqlalchemy psycopg2-binary==2.9.9 -i https://pypi.tuna.tsinghua.edu.cn/simple
+import base64
+import hashlib
+import os
 import threading
-import requests
+import time
+from contextlib import contextmanager
 import zipfile
-import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 import uvicorn
 from typing import Dict
 from pydantic import BaseModel
@@ -18,6 +25,23 @@ from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
+from http_client import create_sync_session, sync_request
+from lora_store import (
+    LORA_DIR, STORAGE_MODE, ARCHIVE_MODE, LoraStore, load_manifest, save_manifest, safe_member_parts
+)
+
+# 下载与解压时每次读写的缓冲区大小（字节），峰值内存与压缩包大小无关
+DOWNLOAD_BUFFER_SIZE = int(os.getenv("DOWNLOAD_BUFFER_SIZE", 1024 * 1024))
+# 所有下载线程共用的 HTTP 会话（连接池、keep-alive、重试预算与熔断见 http_client）
+http_session = create_sync_session()
+# 本地模型存储的磁盘预算（GB），超出后按最近访问时间淘汰冷门任务
+LORA_DISK_BUDGET = int(float(os.getenv("LORA_DISK_BUDGET_GB", 200)) * 1024 ** 3)
+# 读取模型文件时，同一任务两次写入 last_accessed_at 的最小间隔（秒）
+ACCESS_UPDATE_INTERVAL = float(os.getenv("ACCESS_UPDATE_INTERVAL", 60))
+
+# 内容寻址的模型存储，相同文件在多个任务间只保存一份
+store = LoraStore(LORA_DIR, DOWNLOAD_BUFFER_SIZE)
+
 # 创建 FastAPI 应用
 app = FastAPI(title="File Service")
 
@@ -36,85 +60,515 @@ class FileRequest(BaseModel):
     task_id: int        # 任务ID
     toolkit_url: str    # Toolkit URL
 
-def get_file(database_url: str, task_id: int, toolkit_url: str):
-    async def callback(database_url: str, task_id: int, toolkit_url: str):
-        print(f"执行任务 ID: {task_id}")
-        
+# download_archive 的返回值
+DOWNLOADED = "downloaded"        # 下载了新的压缩包
+NOT_MODIFIED = "not_modified"    # 本地压缩包与 toolkit 上的一致，无需重新下载
+DOWNLOAD_FAILED = "failed"       # toolkit 返回失败
+
+class ChecksumError(Exception):
+    """下载内容与 toolkit 提供的校验和不一致"""
+
+def _expected_sha256(headers):
+    """从响应头中取出 toolkit 提供的 SHA-256（十六进制），没有时返回 None
+
+    支持 X-Content-SHA256: <hex> 与 Digest / Repr-Digest: sha-256=<base64>
+    """
+    value = headers.get('X-Content-SHA256')
+    if value:
+        return value.strip().lower()
+    for name in ('Repr-Digest', 'Digest'):
+        for item in headers.get(name, '').split(','):
+            algorithm, _, encoded = item.strip().partition('=')
+            if algorithm.lower() == 'sha-256' and encoded:
+                try:
+                    return base64.b64decode(encoded.strip(':')).hex()
+                except ValueError:
+                    return None
+    return None
+
+def _hash_file(path: str, digest) -> None:
+    """将已有文件内容计入摘要"""
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_BUFFER_SIZE), b''):
+            digest.update(chunk)
+
+def download_archive(toolkit_url: str, job_name: str, zip_path: str, progress=None) -> str:
+    """流式下载任务压缩包，支持断点续传与条件请求
+
+    - 本地已有完整压缩包（或其文件已写入模型存储）且记录了 ETag 时发送 If-None-Match，
+      toolkit 返回 304 则无需下载；
+    - 未完成的下载保存在 zip_path + ".part"，下次请求通过 Range + If-Range 续传，
+      toolkit 返回 200 时说明内容已变化，从头下载；
+    - 连接与读取超时使用 http_client 的 HTTP_CONNECT_TIMEOUT / HTTP_READ_TIMEOUT；
+    - 下载完成后按 toolkit 提供的 SHA-256 校验（未提供时校验压缩包 CRC），
+      校验通过后落盘并原子地重命名为 zip_path。
+
+    Args:
+        progress: 可选的进度回调，参数为 (已下载字节数, 总字节数或 None)
+
+    Returns:
+        str: DOWNLOADED、NOT_MODIFIED 或 DOWNLOAD_FAILED
+    """
+    directory = os.path.dirname(zip_path) or "."
+    os.makedirs(directory, exist_ok=True)
+    part_path = zip_path + ".part"
+    manifest = load_manifest(job_name)
+
+    headers = {}
+    resume_from = 0
+    if manifest.get("etag") and (os.path.exists(zip_path) or store.is_available(job_name)):
+        headers['If-None-Match'] = manifest["etag"]
+    partial_etag = manifest.get("partial_etag")
+    if partial_etag and os.path.exists(part_path):
+        resume_from = os.path.getsize(part_path)
+        headers['Range'] = f"bytes={resume_from}-"
+        headers['If-Range'] = partial_etag
+
+    response = sync_request(
+        http_session, "POST", f'{toolkit_url}/get_zip/',
+        json={"job_name": job_name},
+        headers=headers,
+        stream=True
+    )
+    if response.status_code == 416 and 'Range' in headers:
+        # 续传范围无效（例如 .part 已完整但尚未重命名），丢弃 .part 从头下载
+        response.close()
+        print(f"{job_name} 无法从第 {resume_from} 字节续传，重新下载")
+        os.remove(part_path)
+        manifest.pop("partial_etag", None)
+        save_manifest(job_name, manifest)
+        del headers['Range'], headers['If-Range']
+        resume_from = 0
+        response = sync_request(
+            http_session, "POST", f'{toolkit_url}/get_zip/',
+            json={"job_name": job_name},
+            headers=headers,
+            stream=True
+        )
+
+    with response:
+        if response.status_code == 304:
+            print(f"{job_name} 压缩包未变化，跳过下载")
+            return NOT_MODIFIED
+        if response.status_code not in (200, 206):
+            print(f"请求失败，状态码: {response.status_code}")
+            return DOWNLOAD_FAILED
+
+        digest = hashlib.sha256()
+        if response.status_code == 206:
+            # 续传：已下载部分计入摘要后追加写入
+            _hash_file(part_path, digest)
+            mode = 'ab'
+            print(f"{job_name} 从第 {resume_from} 字节继续下载")
+        else:
+            resume_from = 0
+            mode = 'wb'
+
+        etag = response.headers.get('ETag')
+        manifest["partial_etag"] = etag
+        save_manifest(job_name, manifest)
+
+        length = response.headers.get('Content-Length')
+        total = resume_from + int(length) if length and length.isdigit() else None
+        transferred = resume_from
+
+        # 中途失败时保留 .part 文件，供下次续传
+        with open(part_path, mode) as f:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_BUFFER_SIZE):
+                if chunk:
+                    f.write(chunk)
+                    digest.update(chunk)
+                    transferred += len(chunk)
+                    if progress is not None:
+                        progress(transferred, total)
+            f.flush()
+            os.fsync(f.fileno())
+
+        sha256 = digest.hexdigest()
+        expected = _expected_sha256(response.headers)
+
+    try:
+        if expected is not None and expected != sha256:
+            raise ChecksumError(f"{job_name} 校验和不一致: 期望 {expected}，实际 {sha256}")
+        if expected is None:
+            with zipfile.ZipFile(part_path, 'r') as zip_ref:
+                bad_member = zip_ref.testzip()
+            if bad_member is not None:
+                raise ChecksumError(f"{job_name} 压缩包成员 {bad_member} CRC 校验失败")
+    except (ChecksumError, zipfile.BadZipFile):
+        os.remove(part_path)
+        manifest.pop("partial_etag", None)
+        save_manifest(job_name, manifest)
+        raise
+
+    os.replace(part_path, zip_path)
+    same_content = manifest.get("sha256") == sha256
+    manifest.update({
+        "etag": etag,
+        "sha256": sha256,
+        "size": transferred,
+        "extracted": manifest.get("extracted", False) and same_content,
+        "downloaded_at": time.time()
+    })
+    manifest.pop("partial_etag", None)
+    save_manifest(job_name, manifest)
+    return DOWNLOADED
+
+class EngineRegistry:
+    """数据库引擎缓存类
+
+    按连接字符串复用引擎（及其连接池），连接池大小有上限并在取用前检测连接可用；
+    引擎数量超过上限或空闲超时后按 LRU 释放。
+    """
+    def __init__(self, max_engines: int = 4, pool_size: int = 2, max_overflow: int = 4,
+                 idle_timeout: float = 600):
+        self.max_engines = max_engines
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.idle_timeout = idle_timeout
+        self._engines = OrderedDict()   # 连接字符串 -> (引擎, 会话工厂, 最近使用时间)
+        self._lock = threading.Lock()
+
+    def _get(self, database_url: str):
+        with self._lock:
+            entry = self._engines.get(database_url)
+            if entry is None:
+                engine = create_engine(
+                    database_url,
+                    pool_size=self.pool_size,
+                    max_overflow=self.max_overflow,
+                    pool_timeout=30,
+                    pool_recycle=1800,
+                    pool_pre_ping=True
+                )
+                entry = (engine, sessionmaker(bind=engine))
+            else:
+                entry = entry[:2]
+            self._engines[database_url] = entry + (time.monotonic(),)
+            self._engines.move_to_end(database_url)
+            self._evict()
+            return entry[1]
+
+    def _evict(self) -> None:
+        """释放超出数量上限或空闲超时、且没有连接在使用中的引擎"""
+        now = time.monotonic()
+        for database_url in list(self._engines)[:-1]:
+            engine, _, last_used = self._engines[database_url]
+            over_limit = len(self._engines) > self.max_engines
+            if (over_limit or now - last_used > self.idle_timeout) and engine.pool.checkedout() == 0:
+                del self._engines[database_url]
+                engine.dispose()
+
+    @contextmanager
+    def session(self, database_url: str):
+        """从缓存的引擎中借用一个数据库会话"""
+        session = self._get(database_url)()
         try:
-            # 创建数据库连接
-            engine = create_engine(database_url)
-            Session = sessionmaker(bind=engine)
-            session = Session()
-            
-            try:
-                # 查询任务信息
-                task = session.execute(
-                    text("SELECT name FROM tasks WHERE id = :task_id"),
+            yield session
+        finally:
+            session.close()
+
+    def dispose_all(self) -> None:
+        """释放所有引擎"""
+        with self._lock:
+            for engine, _, _ in self._engines.values():
+                engine.dispose()
+            self._engines.clear()
+
+# 数据库引擎缓存
+engines = EngineRegistry(
+    max_engines=int(os.getenv("DB_MAX_ENGINES", 4)),
+    pool_size=int(os.getenv("DB_POOL_SIZE", 2)),
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", 4))
+)
+
+class AccessTracker:
+    """记录模型文件的读取，限频写入 tasks.last_accessed_at，使磁盘预算按实际使用情况淘汰
+
+    /models/ 读取请求不带数据库信息，任务所在的数据库和任务 ID 在下载或 /ensure_model 时登记；
+    尚未登记或未到写入间隔的读取先记在内存中，在淘汰前由 flush 写入。
+    """
+    def __init__(self, interval: float = ACCESS_UPDATE_INTERVAL):
+        self.interval = interval
+        self._locations = {}    # 任务名称 -> (连接字符串, 任务 ID)
+        self._written = {}      # 任务名称 -> 最近一次写入的时间（monotonic）
+        self._pending = {}      # 任务名称 -> 尚未写入的最近访问时间（UTC）
+        self._lock = threading.Lock()
+
+    def register(self, job_name: str, database_url: str, task_id: int) -> None:
+        """登记任务所在的数据库，调用方已在数据库中更新了访问时间"""
+        with self._lock:
+            self._locations[job_name] = (database_url, task_id)
+            self._written[job_name] = time.monotonic()
+            self._pending.pop(job_name, None)
+
+    def touch(self, job_name: str) -> None:
+        """记录一次读取，距上次写入超过 interval 时写入数据库"""
+        now = time.monotonic()
+        with self._lock:
+            location = self._locations.get(job_name)
+            if location is None or now - self._written.get(job_name, 0) < self.interval:
+                self._pending[job_name] = datetime.utcnow()
+                return
+            self._written[job_name] = now
+            self._pending.pop(job_name, None)
+
+        database_url, task_id = location
+        try:
+            with engines.session(database_url) as session:
+                session.execute(
+                    text("UPDATE tasks SET last_accessed_at = (now() AT TIME ZONE 'utc') WHERE id = :task_id"),
                     {"task_id": task_id}
-                ).first()
-                
-                if not task:
-                    print(f"未找到任务 ID: {task_id}")
-                    return False
-                
-                job_name = task.name
-                
-                # 发送请求获取文件
-                response = requests.post(
-                    f'{toolkit_url}/get_zip/',
-                    json={"job_name": job_name}
                 )
-                
-                if response.status_code == 200:
-                    zip_content = response.content
-                    # 指定要保存的 ZIP 文件的本地路径
-                    local_zip_file_path = f"models/loras/{job_name}.zip"
-
-                    # 将 ZIP 文件内容写入到本地文件中
-                    with open(local_zip_file_path, 'wb') as f:
-                        f.write(zip_content)
-
-                    print(f"ZIP 文件已保存到 {local_zip_file_path}")
-                    
-                    # 解压文件
-                    with zipfile.ZipFile(local_zip_file_path, 'r') as zip_ref:
-                        zip_ref.extractall(f"models/loras/{job_name}")
-                    
-                    print(f"文件已解压到 models/loras/{job_name}")
-                    
-                    # 更新任务状态为 running
-                    session.execute(
-                        text("""
-                        UPDATE tasks 
-                        SET status = 'running'
-                        WHERE id = :task_id
-                        """),
-                        {"task_id": task_id}
-                    )
-                    session.commit()
-                    print(f"任务 {task_id} 状态已更新为 running")
-                    
-                    return True
-                else:
-                    print(f"请求失败，状态码: {response.status_code}")
-                    return False
-                    
-            finally:
-                session.close()
-                
+                session.commit()
+        except Exception as e:
+            print(f"更新任务 {job_name} 的访问时间失败: {str(e)}")
+            with self._lock:
+                self._pending.setdefault(job_name, datetime.utcnow())
+
+    def flush(self, session) -> None:
+        """将内存中尚未写入的访问时间写入当前数据库（按任务名称匹配），由调用方提交"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for job_name, accessed_at in pending.items():
+            session.execute(
+                text("""
+                UPDATE tasks SET last_accessed_at = GREATEST(last_accessed_at, :accessed_at)
+                WHERE name = :job_name
+                """),
+                {"job_name": job_name, "accessed_at": accessed_at}
+            )
+
+# 模型文件访问记录
+access_tracker = AccessTracker()
+
+class FileJob:
+    """单个任务的文件下载作业"""
+    def __init__(self, task_id: int):
+        self.task_id = task_id
+        self.status = "queued"          # queued / running / done / failed
+        self.bytes_transferred = 0
+        self.total_bytes = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def to_dict(self):
+        """转换为字典格式"""
+        return {
+            "task_id": self.task_id,
+            "status": self.status,
+            "bytes_transferred": self.bytes_transferred,
+            "total_bytes": self.total_bytes,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at
+        }
+
+class QueueFullError(Exception):
+    """作业队列已满"""
+
+class FileJobManager:
+    """文件下载作业管理类
+
+    固定大小的线程池处理下载作业，排队作业数有上限；
+    同一任务已有排队或进行中的作业时，重复请求直接复用该作业（single-flight）。
+    """
+    def __init__(self, workers: int, queue_size: int, history_size: int = 1000):
+        self.queue_size = queue_size
+        self.history_size = history_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="get-file")
+        self._jobs = OrderedDict()      # 任务 ID -> FileJob
+        self._lock = threading.Lock()
+
+    def submit(self, database_url: str, task_id: int, toolkit_url: str, update_status: bool = True):
+        """提交下载作业
+
+        Returns:
+            (FileJob, 是否新建)
+
+        Raises:
+            QueueFullError: 排队中的作业数已达上限
+        """
+        with self._lock:
+            job = self._jobs.get(task_id)
+            if job is not None and job.status in ("queued", "running"):
+                return job, False
+
+            queued = sum(1 for j in self._jobs.values() if j.status == "queued")
+            if queued >= self.queue_size:
+                raise QueueFullError(f"下载队列已满（{queued} 个作业排队中）")
+
+            job = FileJob(task_id)
+            self._jobs[task_id] = job
+            self._jobs.move_to_end(task_id)
+            self._prune()
+
+        self._executor.submit(self._run, job, database_url, toolkit_url, update_status)
+        return job, True
+
+    def get(self, task_id: int):
+        """查询作业，不存在时返回 None"""
+        with self._lock:
+            return self._jobs.get(task_id)
+
+    def _prune(self) -> None:
+        """只保留最近的已结束作业"""
+        finished = [task_id for task_id, job in self._jobs.items() if job.status in ("done", "failed")]
+        for task_id in finished[:max(0, len(finished) - self.history_size)]:
+            del self._jobs[task_id]
+
+    def _run(self, job: FileJob, database_url: str, toolkit_url: str, update_status: bool) -> None:
+        job.status = "running"
+
+        def progress(transferred, total):
+            job.bytes_transferred = transferred
+            job.total_bytes = total
+
+        try:
+            ok = process_file_job(database_url, job.task_id, toolkit_url, progress, update_status)
+            job.status = "done" if ok else "failed"
         except Exception as e:
-            print(f"处理文件时出错: {str(e)}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+
+def enforce_disk_budget(session, keep_job: str = None) -> None:
+    """模型存储超出磁盘预算时，按最近访问时间淘汰冷门任务的文件
+
+    被淘汰的任务在 tasks 表中记录 evicted_at，再次请求时重新从 toolkit 下载。
+    """
+    usage = store.disk_usage()
+    if usage <= LORA_DISK_BUDGET:
+        return
+
+    # 先写入最近的读取记录，避免淘汰正在使用的任务
+    access_tracker.flush(session)
+    candidates = session.execute(
+        text("""
+        SELECT id, name FROM tasks
+        WHERE storage_bytes IS NOT NULL AND evicted_at IS NULL
+        ORDER BY last_accessed_at NULLS FIRST, id
+        """)
+    ).all()
+
+    task_ids = {candidate.name: candidate.id for candidate in candidates if candidate.name != keep_job}
+    for job_name, freed in store.evict(list(task_ids), bytes_needed=usage - LORA_DISK_BUDGET):
+        session.execute(
+            text("UPDATE tasks SET evicted_at = (now() AT TIME ZONE 'utc') WHERE id = :task_id"),
+            {"task_id": task_ids[job_name]}
+        )
+        print(f"磁盘预算不足，已淘汰任务 {job_name} 的模型文件，释放 {freed} 字节")
+    session.commit()
+
+def process_file_job(database_url: str, task_id: int, toolkit_url: str, progress=None,
+                     update_status: bool = True) -> bool:
+    """下载任务结果并写入模型存储，完成后将任务状态更新为 running
+
+    Args:
+        toolkit_url: 任务没有记录所在节点时（多节点之前创建的）使用的 toolkit
+        update_status: 为 False 时只重新获取文件（例如被淘汰后再次访问），不修改任务状态
+    """
+    print(f"执行任务 ID: {task_id}")
+    
+    try:
+        # 只在查询和更新时借用数据库会话，下载期间不占用连接
+        with engines.session(database_url) as session:
+            # 查询任务信息
+            task = session.execute(
+                text("SELECT name, toolkit_url FROM tasks WHERE id = :task_id"),
+                {"task_id": task_id}
+            ).first()
+            
+        if not task:
+            print(f"未找到任务 ID: {task_id}")
             return False
+        
+        job_name = task.name
+        # 从训练该任务的节点下载
+        toolkit_url = task.toolkit_url or toolkit_url
+        
+        # 下载和写入存储期间该任务及其新写入的 blob 不会被其他作业的磁盘预算淘汰
+        with store.pinned(job_name):
+            # 流式下载压缩包
+            local_zip_file_path = os.path.join(LORA_DIR, f"{job_name}.zip")
+            result = download_archive(toolkit_url, job_name, local_zip_file_path, progress)
+            if result == DOWNLOAD_FAILED:
+                return False
+            if result == DOWNLOADED:
+                print(f"ZIP 文件已保存到 {local_zip_file_path}")
 
-    # 启动异步任务
-    thread = threading.Thread(
-        target=asyncio.run,
-        args=(callback(database_url, task_id, toolkit_url),)
-    )
-    thread.start()
+            target_dir = store.job_dir(job_name)
+            manifest = load_manifest(job_name)
+            if STORAGE_MODE == ARCHIVE_MODE:
+                # 不解压，下载完成后即可通过 /models/{job_name}/{member} 按需读取单个文件
+                manifest = store.keep_archive(job_name)
+                storage_bytes = os.path.getsize(local_zip_file_path)
+                print(f"压缩包已保留在 {local_zip_file_path}，跳过解压")
+            else:
+                # 内容未变化且文件已在存储中时跳过写入
+                if manifest.get("extracted") and store.is_materialized(job_name):
+                    # toolkit 未提供 ETag 或忽略条件请求时会重新下载内容相同的压缩包，同样删除
+                    if os.path.exists(local_zip_file_path):
+                        os.remove(local_zip_file_path)
+                    print(f"{target_dir} 已是最新，跳过解压")
+                else:
+                    files = store.ingest_archive(local_zip_file_path, job_name)
+                    store.materialize(job_name, files)
+                    manifest.pop("members", None)
+                    manifest.update({"files": files, "archive": False, "extracted": True, "evicted": False})
+                    save_manifest(job_name, manifest)
+                    # 文件已全部写入存储，压缩包不再需要
+                    os.remove(local_zip_file_path)
+                    print(f"文件已解压到 {target_dir}")
+                storage_bytes = sum(entry["size"] for entry in manifest.get("files", {}).values())
+        
+        with engines.session(database_url) as session:
+            # 记录存储占用和访问时间，需要时更新任务状态为 running
+            status_clause = "status = 'RUNNING', updated_at = (now() AT TIME ZONE 'utc')," if update_status else ""
+            session.execute(
+                text(f"""
+                UPDATE tasks 
+                SET {status_clause}
+                    storage_bytes = :storage_bytes,
+                    last_accessed_at = (now() AT TIME ZONE 'utc'),
+                    evicted_at = NULL
+                WHERE id = :task_id
+                """),
+                {"task_id": task_id, "storage_bytes": storage_bytes}
+            )
+            if update_status:
+                # 通知界面任务列表刷新
+                session.execute(
+                    text("SELECT pg_notify('tasks_changed', :payload)"),
+                    {"payload": str(task_id)}
+                )
+            session.commit()
+            access_tracker.register(job_name, database_url, task_id)
+            if update_status:
+                print(f"任务 {task_id} 状态已更新为 running")
+
+            enforce_disk_budget(session, keep_job=job_name)
+        
+        return True
+            
+    except Exception as e:
+        print(f"处理文件时出错: {str(e)}")
+        raise
 
-    print("主线程继续执行其他任务...")
-    return (f"models/loras/task_{task_id}",)
+# 下载作业管理器
+file_jobs = FileJobManager(
+    workers=int(os.getenv("FILE_WORKERS", 4)),
+    queue_size=int(os.getenv("FILE_QUEUE_SIZE", 100))
+)
+
+def get_file(database_url: str, task_id: int, toolkit_url: str):
+    """提交下载作业（同一任务的重复请求复用进行中的作业），立即返回"""
+    job, created = file_jobs.submit(database_url, task_id, toolkit_url)
+    if not created:
+        print(f"任务 {task_id} 已有进行中的下载作业（{job.status}）")
+    return (f"models/loras/task_{task_id}", job)
 
 # API 端点
 @app.post("/get_file")
@@ -126,10 +580,90 @@ async def handle_get_file(request: FileRequest) -> Dict[str, str]:
             request.task_id,
             request.toolkit_url
         )
-        return {"status": "success", "path": result[0]}
+        return {"status": "success", "path": result[0], "job_status": result[1].status}
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/get_file/{task_id}")
+async def get_file_status(task_id: int):
+    """查询下载作业状态（queued / running / done / failed）及已传输字节数"""
+    job = file_jobs.get(task_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"任务 {task_id} 没有下载作业")
+    return job.to_dict()
+
+@app.post("/ensure_model")
+def ensure_model(request: FileRequest):
+    """确保任务的模型文件在本地可用
+
+    文件在存储中时更新最近访问时间并返回路径；已被淘汰或尚未下载时提交重新下载作业，
+    不修改任务状态，可通过 GET /get_file/{task_id} 查询进度。
+    查询数据库和检查磁盘是阻塞操作，因此定义为普通函数，由 FastAPI 在线程池中执行。
+    """
+    with engines.session(request.database_url) as session:
+        task = session.execute(
+            text("SELECT name FROM tasks WHERE id = :task_id"),
+            {"task_id": request.task_id}
+        ).first()
+        if not task:
+            raise HTTPException(status_code=404, detail=f"未找到任务 ID: {request.task_id}")
+        if store.is_available(task.name):
+            session.execute(
+                text("UPDATE tasks SET last_accessed_at = (now() AT TIME ZONE 'utc') WHERE id = :task_id"),
+                {"task_id": request.task_id}
+            )
+            session.commit()
+            access_tracker.register(task.name, request.database_url, request.task_id)
+            return {"status": "ready", "path": store.job_dir(task.name)}
+
+    try:
+        job, _ = file_jobs.submit(request.database_url, request.task_id, request.toolkit_url,
+                                  update_status=False)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"status": "fetching", "job_status": job.status}
+
+def _iter_member(job_name: str, member: str):
+    """分块读取任务中的单个文件：未压缩的成员直接从 mmap 切片，否则流式解压"""
+    with store.map_member(job_name, member) as view:
+        if view is not None:
+            for offset in range(0, len(view), DOWNLOAD_BUFFER_SIZE):
+                yield bytes(view[offset:offset + DOWNLOAD_BUFFER_SIZE])
+            return
+    with store.open_member(job_name, member) as source:
+        for chunk in iter(lambda: source.read(DOWNLOAD_BUFFER_SIZE), b''):
+            yield chunk
+
+@app.get("/models/{job_name}/{member:path}")
+def read_model_file(job_name: str, member: str):
+    """读取任务中的单个文件，文件仍在压缩包中时无需解压整个压缩包"""
+    if not safe_member_parts(job_name) or job_name != safe_member_parts(job_name)[0]:
+        raise HTTPException(status_code=400, detail="无效的任务名称")
+    if not store.is_available(job_name):
+        raise HTTPException(status_code=404, detail=f"任务 {job_name} 的模型文件不在本地")
+
+    chunks = _iter_member(job_name, member)
+    try:
+        # 先取第一块，让“文件不存在”在响应开始前以 404 返回
+        first = next(chunks, b'')
+    except (KeyError, FileNotFoundError, IsADirectoryError):
+        raise HTTPException(status_code=404, detail=f"任务 {job_name} 中没有文件 {member}")
+
+    def body():
+        yield first
+        yield from chunks
+
+    access_tracker.touch(job_name)
+    return StreamingResponse(body(), media_type="application/octet-stream")
+
+@app.on_event("shutdown")
+async def shutdown():
+    """释放数据库连接和 HTTP 连接池"""
+    engines.dispose_all()
+    http_session.close()
+
 @app.get("/health")
 async def health_check():
     """健康检查端点"""
@@ -0,0 +1,302 @@
+"""
+共享的 HTTP 客户端：Gradio 提交流程、任务监控（aiohttp）和文件服务（requests）都通过这里访问 toolkit
+
+- 连接池：按主机限制连接数，复用 keep-alive 连接，缓存 DNS 解析结果，开启 TCP keepalive；
+- 超时：连接超时与读取超时分开设置，大文件上传下载只受两次读取之间的间隔限制；
+- 重试：连接失败、超时和 502/503/504 按带抖动的指数退避重试，重试次数受全局重试预算限制，
+  故障期间重试不会把请求量放大数倍；
+- 熔断：按 toolkit 主机统计连续失败，达到阈值后在一段时间内直接拒绝请求（BackendUnavailable），
+  到期后放行一个试探请求，成功即恢复。
+"""
+import asyncio
+import os
+import random
+import socket
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Dict
+from urllib.parse import urlsplit
+
+# 连接池：总连接数与每个主机的连接数上限
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", 100))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", 20))
+# 空闲 keep-alive 连接保留时长（秒）
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", 30))
+# DNS 解析结果缓存时长（秒）
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", 300))
+# 连接超时与读取超时（秒），读取超时为两次收到数据之间的最长间隔
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 300))
+
+# 单个请求最多重试次数，以及退避的基准与上限（秒）
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", 3))
+HTTP_BACKOFF_BASE = 0.5
+HTTP_BACKOFF_MAX = 10.0
+# 重试预算：重试数不超过请求数的该比例（另有少量保底额度）
+HTTP_RETRY_BUDGET_RATIO = float(os.getenv("HTTP_RETRY_BUDGET_RATIO", 0.2))
+HTTP_RETRY_BUDGET_MIN = 10
+
+# 熔断：连续失败次数阈值，以及熔断后多久放行试探请求（秒）
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", 30))
+
+# 视为 toolkit 暂时不可用、可以重试的状态码
+RETRY_STATUSES = {502, 503, 504}
+
+
+class BackendUnavailable(Exception):
+    """toolkit 暂时不可用（熔断中，或重试后仍连接失败、超时、返回 502/503/504）"""
+
+
+class RetryBudget:
+    """重试预算（令牌桶）
+
+    每个请求存入 ratio 个令牌，每次重试取出一个；令牌不足时不再重试。
+    令牌上限为 HTTP_RETRY_BUDGET_MIN，空闲后仍允许少量重试。
+    """
+    def __init__(self, ratio: float = HTTP_RETRY_BUDGET_RATIO, minimum: int = HTTP_RETRY_BUDGET_MIN):
+        self.ratio = ratio
+        self.minimum = minimum
+        self._tokens = float(minimum)
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._tokens = min(self.minimum, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    """单个 toolkit 主机的熔断器（closed -> open -> half-open -> closed）"""
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None      # 熔断开始时间，None 表示未熔断
+        self._probing = False       # 是否已放行试探请求
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        """是否放行请求：未熔断时放行；熔断到期后只放行一个试探请求"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def release(self) -> None:
+        """请求被取消、未得出结果时归还试探名额，不计为成功或失败"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                # 试探失败或连续失败达到阈值：（重新）开始熔断
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+retry_budget = RetryBudget()
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(url: str) -> CircuitBreaker:
+    """获取 URL 所在主机的熔断器"""
+    parts = urlsplit(url)
+    key = f"{parts.scheme}://{parts.netloc}"
+    with _breakers_lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = _breakers[key] = CircuitBreaker()
+        return breaker
+
+
+def backoff_delay(attempt: int) -> float:
+    """第 attempt 次重试前的等待时间（full jitter）"""
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+
+
+def _keepalive_socket_options():
+    """开启 TCP keepalive 的套接字选项，及时发现对端已断开的空闲连接"""
+    options = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    for name, value in (("TCP_KEEPIDLE", 60), ("TCP_KEEPINTVL", 10), ("TCP_KEEPCNT", 3)):
+        if hasattr(socket, name):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return options
+
+
+# ---- aiohttp（Gradio 提交流程与任务监控）----
+
+def create_session():
+    """创建带连接池限制、DNS 缓存、keep-alive 和分阶段超时的 aiohttp 会话
+
+    需在使用它的事件循环中调用；aiohttp 默认对客户端连接开启 TCP keepalive。
+    """
+    import aiohttp
+
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=None,
+        sock_connect=HTTP_CONNECT_TIMEOUT,
+        sock_read=HTTP_READ_TIMEOUT
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+def api_timeout(read_timeout: float):
+    """普通接口调用的超时：连接超时不变，读取超时为 read_timeout"""
+    import aiohttp
+
+    return aiohttp.ClientTimeout(total=None, sock_connect=HTTP_CONNECT_TIMEOUT, sock_read=read_timeout)
+
+
+@asynccontextmanager
+async def request(session, method: str, url: str, retry: bool = True, retry_statuses=RETRY_STATUSES, **kwargs):
+    """经过熔断器和重试预算发送请求，用法与 session.request 相同：
+
+        async with request(session, "POST", url, json=...) as response:
+            ...
+
+    Args:
+        retry: 请求体不能重放（例如流式上传）时设为 False，只经过熔断器
+        retry_statuses: 视为后端暂时不可用（重试并计入熔断）的状态码；
+            服务用某个状态码表示“繁忙、稍后再试”时将其排除，由调用方处理
+
+    Raises:
+        BackendUnavailable: 熔断中，或重试后仍连接失败、超时、返回 502/503/504
+    """
+    import aiohttp
+
+    breaker = breaker_for(url)
+    retry_budget.deposit()
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            raise BackendUnavailable(f"{url} 暂时不可用（熔断中）")
+        try:
+            response = await session.request(method, url, **kwargs)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            breaker.record_failure()
+            error = BackendUnavailable(f"{url} 请求失败: {str(e) or type(e).__name__}")
+            error.__cause__ = e
+        except Exception:
+            # 其他错误（如上传数据流读取失败）同样计为失败，保证试探名额被释放
+            breaker.record_failure()
+            raise
+        except BaseException:
+            # 任务被取消
+            breaker.release()
+            raise
+        else:
+            if response.status not in retry_statuses:
+                breaker.record_success()
+                try:
+                    yield response
+                finally:
+                    response.release()
+                return
+            breaker.record_failure()
+            response.release()
+            error = BackendUnavailable(f"{url} 返回 {response.status}")
+
+        if not retry or attempt >= HTTP_MAX_RETRIES or not retry_budget.withdraw():
+            raise error
+        await asyncio.sleep(backoff_delay(attempt))
+        attempt += 1
+
+
+# ---- requests（文件服务）----
+
+def create_sync_session():
+    """创建带连接池和 TCP keepalive 的 requests 会话，多个下载线程共用其连接池"""
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection
+
+    class KeepAliveAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            kwargs["socket_options"] = HTTPConnection.default_socket_options + _keepalive_socket_options()
+            super().init_poolmanager(*args, **kwargs)
+
+    session = requests.Session()
+    # 重试由 sync_request 统一处理，适配器本身不重试
+    adapter = KeepAliveAdapter(
+        pool_connections=HTTP_POOL_LIMIT_PER_HOST,
+        pool_maxsize=HTTP_POOL_LIMIT_PER_HOST,
+        max_retries=0
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def sync_request(session, method: str, url: str, retry: bool = True, **kwargs):
+    """requests 版本的 request，未指定 timeout 时使用 (连接超时, 读取超时)
+
+    Returns:
+        requests.Response，可用 with 语句确保连接归还连接池
+
+    Raises:
+        BackendUnavailable: 熔断中，或重试后仍连接失败、超时、返回 502/503/504
+    """
+    import requests
+
+    kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+    breaker = breaker_for(url)
+    retry_budget.deposit()
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            raise BackendUnavailable(f"{url} 暂时不可用（熔断中）")
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            breaker.record_failure()
+            error = BackendUnavailable(f"{url} 请求失败: {str(e) or type(e).__name__}")
+            error.__cause__ = e
+        except Exception:
+            breaker.record_failure()
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+        else:
+            if response.status_code not in RETRY_STATUSES:
+                breaker.record_success()
+                return response
+            breaker.record_failure()
+            response.close()
+            error = BackendUnavailable(f"{url} 返回 {response.status_code}")
+
+        if not retry or attempt >= HTTP_MAX_RETRIES or not retry_budget.withdraw():
+            raise error
+        time.sleep(backoff_delay(attempt))
+        attempt += 1
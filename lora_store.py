@@ -0,0 +1,392 @@
+"""
+LoRA 模型文件存储（内容寻址）
+
+压缩包中的每个文件按 SHA-256 存为 {root}/.blobs/<前两位>/<sha256>，相同内容只保存一份；
+每个任务的清单 {root}/<job_name>.manifest.json 记录文件路径与摘要，
+任务目录 {root}/<job_name>/ 中的文件以硬链接（跨设备时退化为符号链接）指向对应的 blob，
+对外保持原有的目录结构。
+
+存储模式为 archive 时不解压，直接保留 {root}/<job_name>.zip，
+通过 open_member / map_member 按需读取单个成员。
+"""
+import errno
+import glob
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import zipfile
+from contextlib import contextmanager
+
+LORA_DIR = os.getenv("LORA_DIR", "models/loras")
+# 读写文件时的缓冲区大小（字节）
+BUFFER_SIZE = int(os.getenv("DOWNLOAD_BUFFER_SIZE", 1024 * 1024))
+
+MANIFEST_SUFFIX = ".manifest.json"
+
+# 存储模式：store 写入内容寻址存储并链接到任务目录；archive 保留压缩包，不解压
+STORE_MODE = "store"
+ARCHIVE_MODE = "archive"
+STORAGE_MODE = os.getenv("LORA_STORAGE_MODE", STORE_MODE)
+
+# zip 本地文件头：签名、固定长度，以及文件名长度与扩展字段长度的位置
+_LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+_LOCAL_HEADER_SIZE = 30
+_LOCAL_HEADER_LENGTHS = struct.Struct("<HH")
+_LOCAL_HEADER_LENGTHS_OFFSET = 26
+
+
+def manifest_path(job_name: str, root: str = LORA_DIR) -> str:
+    """任务清单文件路径"""
+    return os.path.join(root, f"{job_name}{MANIFEST_SUFFIX}")
+
+
+def load_manifest(job_name: str, root: str = LORA_DIR) -> dict:
+    """读取任务清单，不存在或损坏时返回空字典"""
+    try:
+        with open(manifest_path(job_name, root), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(job_name: str, manifest: dict, root: str = LORA_DIR) -> None:
+    """原子地写入任务清单"""
+    path = manifest_path(job_name, root)
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".manifest.", suffix=".tmp")
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def safe_member_parts(filename: str):
+    """拆分压缩包成员路径，去掉盘符、绝对路径和 .. 等不安全部分"""
+    parts = []
+    for part in filename.replace('\\', '/').split('/'):
+        if part in ('', '.', '..') or ':' in part:
+            continue
+        parts.append(part)
+    return parts
+
+
+def _find_member(zip_ref: zipfile.ZipFile, member: str) -> zipfile.ZipInfo:
+    """按（规范化后的）成员路径查找压缩包成员"""
+    wanted = "/".join(safe_member_parts(member))
+    for info in zip_ref.infolist():
+        if not info.is_dir() and "/".join(safe_member_parts(info.filename)) == wanted:
+            return info
+    raise KeyError(f"压缩包中没有成员 {member}")
+
+
+def list_members(zip_path: str) -> dict:
+    """列出压缩包中的文件，返回 相对路径 -> 解压后大小"""
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        return {
+            "/".join(safe_member_parts(info.filename)): info.file_size
+            for info in zip_ref.infolist()
+            if not info.is_dir() and safe_member_parts(info.filename)
+        }
+
+
+@contextmanager
+def open_member(zip_path: str, member: str):
+    """以流的方式打开压缩包中的单个成员，不解压其他文件"""
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        with zip_ref.open(_find_member(zip_ref, member)) as source:
+            yield source
+
+
+@contextmanager
+def map_member(zip_path: str, member: str):
+    """以 mmap 方式读取未压缩（ZIP_STORED）的成员
+
+    产出成员数据的只读 memoryview，直接映射压缩包文件，不复制、不解压；
+    成员被压缩或加密时产出 None，调用方改用 open_member。
+    """
+    with open(zip_path, 'rb') as f:
+        with zipfile.ZipFile(f, 'r') as zip_ref:
+            info = _find_member(zip_ref, member)
+        if info.compress_type != zipfile.ZIP_STORED or info.flag_bits & 0x1:
+            yield None
+            return
+        if info.file_size == 0:
+            yield memoryview(b"")
+            return
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            header = info.header_offset
+            if mapped[header:header + 4] != _LOCAL_HEADER_SIGNATURE:
+                raise zipfile.BadZipFile(f"{member} 的本地文件头损坏")
+            name_length, extra_length = _LOCAL_HEADER_LENGTHS.unpack_from(
+                mapped, header + _LOCAL_HEADER_LENGTHS_OFFSET
+            )
+            start = header + _LOCAL_HEADER_SIZE + name_length + extra_length
+            view = memoryview(mapped)[start:start + info.file_size]
+            try:
+                yield view
+            finally:
+                view.release()
+
+
+class LoraStore:
+    """内容寻址的 LoRA 文件存储类"""
+    def __init__(self, root: str = LORA_DIR, buffer_size: int = BUFFER_SIZE):
+        self.root = root
+        self.buffer_size = buffer_size
+        self.blob_dir = os.path.join(root, ".blobs")
+        # 写入 blob 与淘汰互斥；_pins 记录正在处理的任务及其已写入、清单尚未记录的 blob
+        self.lock = threading.RLock()
+        self._pins = {}     # 任务名称 -> {sha256, ...}
+
+    def blob_path(self, sha256: str) -> str:
+        """blob 文件路径"""
+        return os.path.join(self.blob_dir, sha256[:2], sha256)
+
+    def job_dir(self, job_name: str) -> str:
+        """任务目录路径"""
+        return os.path.join(self.root, job_name)
+
+    @contextmanager
+    def pinned(self, job_name: str):
+        """处理任务期间保护其文件：淘汰时跳过该任务，也不删除它已写入但清单尚未记录的 blob"""
+        with self.lock:
+            pins = self._pins.setdefault(job_name, set())
+        try:
+            yield
+        finally:
+            with self.lock:
+                if self._pins.get(job_name) is pins:
+                    del self._pins[job_name]
+
+    def _store_stream(self, source, job_name: str = None) -> tuple:
+        """将数据流写入 blob 存储，返回 (sha256, 字节数)；内容已存在时不重复保存
+
+        在 pinned(job_name) 中调用时，blob 在任务处理完成前不会被淘汰。
+        """
+        tmp_dir = os.path.join(self.blob_dir, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as target:
+                for chunk in iter(lambda: source.read(self.buffer_size), b''):
+                    digest.update(chunk)
+                    target.write(chunk)
+                    size += len(chunk)
+
+            sha256 = digest.hexdigest()
+            path = self.blob_path(sha256)
+            with self.lock:
+                if os.path.exists(path):
+                    os.remove(tmp_path)
+                else:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    # blob 被多个任务共享，设为只读防止被就地修改
+                    os.chmod(tmp_path, 0o444)
+                    os.replace(tmp_path, path)
+                if job_name in self._pins:
+                    self._pins[job_name].add(sha256)
+            return sha256, size
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def ingest_archive(self, zip_path: str, job_name: str = None) -> dict:
+        """将压缩包中的文件逐个流式写入 blob 存储
+
+        Args:
+            job_name: 所属任务，在 pinned(job_name) 中调用时写入的 blob 不会被并发的淘汰删除
+
+        Returns:
+            dict: 相对路径 -> {"sha256", "size"}
+        """
+        files = {}
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            for member in zip_ref.infolist():
+                parts = safe_member_parts(member.filename)
+                if not parts or member.is_dir():
+                    continue
+                with zip_ref.open(member) as source:
+                    sha256, size = self._store_stream(source, job_name)
+                files["/".join(parts)] = {"sha256": sha256, "size": size}
+        return files
+
+    def materialize(self, job_name: str, files: dict) -> None:
+        """按清单在任务目录中链接 blob，完成后原子地替换任务目录"""
+        target_dir = self.job_dir(job_name)
+        staging_dir = tempfile.mkdtemp(dir=self.root, prefix=f".{job_name}.")
+        try:
+            # mkdtemp 创建的目录仅属主可访问，恢复为普通目录权限
+            os.chmod(staging_dir, 0o755)
+            for relative_path, entry in files.items():
+                link_path = os.path.join(staging_dir, *relative_path.split("/"))
+                os.makedirs(os.path.dirname(link_path), exist_ok=True)
+                blob = self.blob_path(entry["sha256"])
+                try:
+                    os.link(blob, link_path)
+                except OSError as e:
+                    # 只在不支持硬链接（跨设备或文件系统不允许）时退化为符号链接，blob 缺失时报错
+                    if e.errno not in (errno.EXDEV, errno.EPERM):
+                        raise
+                    os.symlink(os.path.abspath(blob), link_path)
+
+            if os.path.exists(target_dir):
+                shutil.rmtree(target_dir)
+            os.replace(staging_dir, target_dir)
+        except BaseException:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+
+    def archive_path(self, job_name: str) -> str:
+        """任务压缩包路径"""
+        return os.path.join(self.root, f"{job_name}.zip")
+
+    def keep_archive(self, job_name: str) -> dict:
+        """archive 模式：保留压缩包作为任务文件，返回写入后的清单"""
+        manifest = load_manifest(job_name, self.root)
+        shutil.rmtree(self.job_dir(job_name), ignore_errors=True)
+        manifest.pop("files", None)
+        manifest.update({
+            "archive": True,
+            "members": list_members(self.archive_path(job_name)),
+            "extracted": True,
+            "evicted": False
+        })
+        save_manifest(job_name, manifest, self.root)
+        return manifest
+
+    def is_available(self, job_name: str) -> bool:
+        """任务文件是否可读（已链接到任务目录，或以 archive 模式保留了压缩包）"""
+        manifest = load_manifest(job_name, self.root)
+        if manifest.get("archive"):
+            return not manifest.get("evicted") and os.path.exists(self.archive_path(job_name))
+        return self.is_materialized(job_name)
+
+    @contextmanager
+    def open_member(self, job_name: str, member: str):
+        """打开任务中的单个文件，不论其位于任务目录还是压缩包中"""
+        if self.is_materialized(job_name):
+            with open(os.path.join(self.job_dir(job_name), *safe_member_parts(member)), 'rb') as f:
+                yield f
+        else:
+            with open_member(self.archive_path(job_name), member) as source:
+                yield source
+
+    @contextmanager
+    def map_member(self, job_name: str, member: str):
+        """以 mmap 方式读取任务中的单个文件；无法映射（压缩成员）时产出 None"""
+        if self.is_materialized(job_name):
+            path = os.path.join(self.job_dir(job_name), *safe_member_parts(member))
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    yield memoryview(b"")
+                    return
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    view = memoryview(mapped)
+                    try:
+                        yield view
+                    finally:
+                        view.release()
+        else:
+            with map_member(self.archive_path(job_name), member) as view:
+                yield view
+
+    def is_materialized(self, job_name: str) -> bool:
+        """任务文件是否在本地可用"""
+        manifest = load_manifest(job_name, self.root)
+        return bool(manifest.get("files")) and not manifest.get("evicted") \
+            and os.path.isdir(self.job_dir(job_name))
+
+    def manifests(self) -> dict:
+        """读取所有任务清单，返回 任务名称 -> 清单"""
+        result = {}
+        for path in glob.glob(os.path.join(self.root, f"*{MANIFEST_SUFFIX}")):
+            job_name = os.path.basename(path)[:-len(MANIFEST_SUFFIX)]
+            result[job_name] = load_manifest(job_name, self.root)
+        return result
+
+    def disk_usage(self) -> int:
+        """blob 存储与保留的压缩包占用的字节数"""
+        paths = glob.glob(os.path.join(self.root, "*.zip"))
+        for directory, _, filenames in os.walk(self.blob_dir):
+            paths.extend(os.path.join(directory, filename) for filename in filenames)
+        total = 0
+        for path in paths:
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        return total
+
+    def evict(self, job_names, bytes_needed: int = None) -> list:
+        """按顺序淘汰任务：移除任务目录并标记清单为已淘汰，删除不再被任何任务引用的 blob
+
+        Args:
+            job_names: 候选任务名称，按淘汰优先级排序
+            bytes_needed: 需要释放的字节数；指定时跳过所有文件都与其他任务共享的任务，
+                释放足够空间后停止。为 None 时淘汰全部候选任务
+
+        正在处理（pinned）的任务不会被淘汰，其已写入的 blob 也不会被删除。
+
+        Returns:
+            list: [(任务名称, 释放的字节数), ...]
+        """
+        with self.lock:
+            return self._evict(job_names, bytes_needed)
+
+    def _evict(self, job_names, bytes_needed: int = None) -> list:
+        manifests = self.manifests()
+        pinned_blobs = set().union(*self._pins.values())
+
+        # 统计仍在使用中的任务对每个 blob 的引用
+        references = {}
+        for manifest in manifests.values():
+            if manifest.get("evicted"):
+                continue
+            for sha256 in {entry["sha256"] for entry in manifest.get("files", {}).values()}:
+                references[sha256] = references.get(sha256, 0) + 1
+
+        evicted = []
+        freed_total = 0
+        for job_name in job_names:
+            if bytes_needed is not None and freed_total >= bytes_needed:
+                break
+            if job_name in self._pins:
+                continue
+            manifest = manifests.get(job_name, {})
+            blobs = {entry["sha256"]: entry["size"] for entry in manifest.get("files", {}).values()}
+            if bytes_needed is not None and not manifest.get("evicted") and not manifest.get("archive") \
+                    and not any(references.get(sha256) == 1 for sha256 in blobs):
+                continue
+
+            shutil.rmtree(self.job_dir(job_name), ignore_errors=True)
+            freed = 0
+            # 存储模式下残留的压缩包（例如写入存储前中断）也一并删除
+            archive = self.archive_path(job_name)
+            if os.path.exists(archive):
+                freed += os.path.getsize(archive)
+                os.remove(archive)
+            if not manifest.get("evicted"):
+                for sha256 in blobs:
+                    references[sha256] = references.get(sha256, 1) - 1
+                    if references[sha256] <= 0:
+                        references.pop(sha256)
+                        path = self.blob_path(sha256)
+                        if sha256 not in pinned_blobs and os.path.exists(path):
+                            freed += os.path.getsize(path)
+                            os.remove(path)
+                if manifest:
+                    manifest["evicted"] = True
+                    manifest["extracted"] = False
+                    save_manifest(job_name, manifest, self.root)
+            freed_total += freed
+            evicted.append((job_name, freed))
+        return evicted
@@ -1,10 +1,16 @@
-from sqlalchemy import create_engine, Column, Integer, String, JSON, Enum, DateTime
+from sqlalchemy import (
+    create_engine, inspect, select, update, delete, values, column, cast, literal_column,
+    Column, Integer, BigInteger, Float, Boolean, String, JSON, Enum, DateTime, Index, case, func, text, tuple_,
+    any_, bindparam
+)
+from sqlalchemy.dialects.postgresql import ARRAY, insert
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from datetime import datetime
+from datetime import datetime, timedelta
+import argparse
 import enum
 import os
-import pandas as pd
+import threading
 
 # 从环境变量获取数据库配置
 DATABASE_URL = os.getenv(
@@ -16,6 +22,7 @@ Base = declarative_base()
 
 class TaskStatus(enum.Enum):
     """任务状态枚举类"""
+    UPLOADING = "uploading" # 上传中（已占用任务名称，数据集尚未上传完成）
     PENDING = "pending"     # 等待中
     TRAINING = "training"   # 训练中
     RUN_BEFORE = "run_before" # 运行前
@@ -33,7 +40,29 @@ class Task(Base):
     config = Column(JSON, nullable=False)
     result_images = Column(JSON, nullable=True, default=list)  # 存储OSS链接列表
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+    # 监控调度：下一次轮询时间、当前轮询间隔，以及认领该任务的监控进程和租约到期时间
+    next_poll_at = Column(DateTime, nullable=True, index=True)
+    poll_interval = Column(Float, nullable=True)
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+
+    # 文件服务本地模型存储：占用字节数、最近访问时间，以及因磁盘预算被淘汰的时间
+    storage_bytes = Column(BigInteger, nullable=True)
+    last_accessed_at = Column(DateTime, nullable=True)
+    evicted_at = Column(DateTime, nullable=True)
+
+    # 训练数据集清单的 SHA-256，对应 dataset_manifests 表
+    dataset_hash = Column(String(64), nullable=True, index=True)
+
+    # 执行训练的 toolkit 节点，为空表示多节点之前创建的任务（使用默认节点）
+    toolkit_url = Column(String, nullable=True, index=True)
+
+    # 任务列表按 (created_at, id) 做键集分页
+    __table_args__ = (
+        Index('ix_tasks_created_at_id', 'created_at', 'id'),
+    )
 
     def __repr__(self):
         return f"<Task(id={self.id}, name='{self.name}', status={self.status.value})>"
@@ -50,61 +79,512 @@ class Task(Base):
             "updated_at": self.updated_at.isoformat()
         }
 
-def get_task_list():
-    """查询数据库中的任务并返回"""
+class DatasetBlob(Base):
+    """已上传到 toolkit 的数据集文件，按 (toolkit, SHA-256) 记录"""
+    __tablename__ = 'dataset_blobs'
+
+    toolkit_url = Column(String, primary_key=True)
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    content_type = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.utcnow)
+
+class DatasetManifest(Base):
+    """数据集清单：文件名与内容摘要的列表，以其 SHA-256 为主键"""
+    __tablename__ = 'dataset_manifests'
+
+    sha256 = Column(String(64), primary_key=True)
+    files = Column(JSON, nullable=False)  # [{"name", "sha256", "size", "content_type"}, ...]
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class MonitorHeartbeat(Base):
+    """任务监控进程的存活心跳，每个监控进程一行，进程正常退出时删除"""
+    __tablename__ = 'monitor_heartbeats'
+
+    owner = Column(String, primary_key=True)        # 监控进程标识（主机名:PID:随机串）
+    hostname = Column(String, nullable=False)
+    pid = Column(Integer, nullable=False)
+    started_at = Column(DateTime, nullable=False)
+    last_seen_at = Column(DateTime, nullable=False, index=True)
+    tracked_tasks = Column(Integer, nullable=False, default=0)  # 当前持有租约的任务数
+
+TASK_LIST_HEADERS = ["ID", "Name", "Status", "Results", "Created", "Updated"]
+
+# 任务变更通知的 LISTEN/NOTIFY 频道
+TASK_CHANGE_CHANNEL = "tasks_changed"
+
+# 增量查询时回看的时间窗口，覆盖 updated_at 写入与事务提交之间的时间差
+TASK_CHANGE_OVERLAP = timedelta(seconds=5)
+
+def _task_list_columns():
+    """任务列表展示所需的列，结果数量在数据库端计算，不加载完整 JSON"""
+    result_count = case(
+        (func.json_typeof(Task.result_images) == 'array', func.json_array_length(Task.result_images)),
+        else_=0
+    )
+    return (
+        Task.id,
+        Task.name,
+        Task.status,
+        result_count.label("result_count"),
+        Task.created_at,
+        Task.updated_at
+    )
+
+def _format_task_row(row):
+    """将查询行转换为表格行"""
+    return [
+        row.id,                                          # ID
+        row.name,                                        # Name
+        row.status.value,                                # Status
+        "✅ 查看结果" if row.result_count > 0 else "❌ 无结果",  # Results
+        row.created_at.strftime("%Y-%m-%d %H:%M:%S"),    # Created
+        row.updated_at.strftime("%Y-%m-%d %H:%M:%S")     # Updated
+    ]
+
+def get_task_page(limit: int = 20, cursor=None):
+    """按 (created_at, id) 键集分页查询任务列表
+
+    Args:
+        limit: 每页行数
+        cursor: 上一页最后一行的 (created_at, id)，为 None 时返回第一页
+
+    Returns:
+        dict: headers、data、每行的 (created_at, id) 键 keys、
+              下一页游标 next_cursor（没有下一页时为 None）以及增量刷新起点 watermark
+    """
+    db = next(get_db())
+    try:
+        # 先取水位线再查询，期间发生的变更会被下一次增量查询覆盖
+        watermark = db.query(func.max(Task.updated_at)).scalar()
+
+        query = db.query(*_task_list_columns())
+        if cursor is not None:
+            created_at, task_id = cursor
+            query = query.filter(
+                tuple_(Task.created_at, Task.id) < tuple_(created_at, task_id)
+            )
+        # 多取一行用于判断是否还有下一页
+        rows = query.order_by(
+            Task.created_at.desc(), Task.id.desc()
+        ).limit(limit + 1).all()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return {
+            "headers": TASK_LIST_HEADERS,
+            "data": [_format_task_row(row) for row in rows],
+            "keys": [(row.created_at, row.id) for row in rows],
+            "next_cursor": (rows[-1].created_at, rows[-1].id) if has_more else None,
+            "watermark": watermark
+        }
+    finally:
+        db.close()
+
+def get_task_changes(since, limit: int = 200):
+    """查询 updated_at 在水位线之后发生变更的任务行
+
+    Args:
+        since: 上次查询得到的水位线（updated_at），为 None 时只返回当前水位线
+        limit: 最多返回的行数
+
+    Returns:
+        dict: 变更行 data、对应的 (created_at, id) 键 keys、新的水位线 watermark，
+              以及变更是否超过 limit 的标记 truncated
+    """
+    db = next(get_db())
+    try:
+        if since is None:
+            watermark = db.query(func.max(Task.updated_at)).scalar()
+            return {"data": [], "keys": [], "watermark": watermark, "truncated": False}
+
+        rows = db.query(*_task_list_columns()).filter(
+            Task.updated_at > since - TASK_CHANGE_OVERLAP
+        ).order_by(Task.updated_at).limit(limit + 1).all()
+
+        truncated = len(rows) > limit
+        rows = rows[:limit]
+        watermark = max([since] + [row.updated_at for row in rows])
+        return {
+            "data": [_format_task_row(row) for row in rows],
+            "keys": [(row.created_at, row.id) for row in rows],
+            "watermark": watermark,
+            "truncated": truncated
+        }
+    finally:
+        db.close()
+
+def get_task_result_images(task_id: int):
+    """查询单个任务的结果图片链接
+
+    Returns:
+        (updated_at, 图片链接列表)；任务不存在时返回 None
+    """
+    db = next(get_db())
+    try:
+        row = db.query(Task.updated_at, Task.result_images).filter(Task.id == task_id).first()
+        if row is None:
+            return None
+        return row.updated_at, [img["url"] for img in (row.result_images or [])]
+    finally:
+        db.close()
+
+def get_monitor_status(timeout_seconds: float):
+    """查询任务监控进程的存活情况
+
+    Args:
+        timeout_seconds: 超过该时长没有心跳的监控进程视为已停止
+
+    Returns:
+        dict: 存活的进程数 alive、它们监控的任务数 tracked_tasks，
+              以及最近一次心跳距今的秒数 last_seen_seconds（从未有过心跳时为 None）
+    """
     db = next(get_db())
     try:
-        # 按创建时间倒序排序
-        tasks = db.query(Task).order_by(Task.created_at.desc()).all()
-        
-        # 准备表头和数据
-        headers = ["ID", "Name", "Status", "Results", "Created", "Updated"]
-        data = []
-        for task in tasks:
-            result_count = len(task.result_images) if task.result_images else 0
-            data.append([
-                task.id,                                         # ID
-                task.name,                                       # Name
-                task.status.value,                              # Status
-                "✅ 查看结果" if result_count > 0 else "❌ 无结果",  # Results
-                task.created_at.strftime("%Y-%m-%d %H:%M:%S"),  # Created
-                task.updated_at.strftime("%Y-%m-%d %H:%M:%S")   # Updated
-            ])
+        age = func.extract('epoch', utc_now() - MonitorHeartbeat.last_seen_at)
+        row = db.query(
+            func.count().filter(age <= timeout_seconds).label("alive"),
+            func.coalesce(func.sum(MonitorHeartbeat.tracked_tasks).filter(age <= timeout_seconds), 0).label("tracked"),
+            func.min(age).label("last_seen")
+        ).one()
         return {
-            "headers": headers,
-            "data": data
+            "alive": row.alive,
+            "tracked_tasks": int(row.tracked),
+            "last_seen_seconds": float(row.last_seen) if row.last_seen is not None else None
         }
     finally:
         db.close()
 
+def utc_now():
+    """数据库端的当前 UTC 时间，多个进程之间以数据库时钟为准"""
+    return func.timezone('utc', func.now())
+
+# 以下语句由监控进程通过异步数据库层（pg_db_async）执行
+
+def claim_tasks_statement(owner: str, statuses, limit: int, lease_seconds: float, lookahead_seconds: float):
+    """构造认领任务的语句：认领一批即将到期、且未被其他监控进程持有租约的任务
+
+    使用 FOR UPDATE SKIP LOCKED，多个监控进程并发认领时互不阻塞、也不会认领到同一任务。
+    RETURNING id、name、status、created_at、poll_interval、toolkit_url 以及距到期的秒数 due_in。
+
+    Args:
+        owner: 监控进程标识
+        statuses: 需要监控的任务状态
+        limit: 最多认领的任务数
+        lease_seconds: 租约时长（秒）
+        lookahead_seconds: 认领在此时间内到期的任务（秒）
+    """
+    now = utc_now()
+    due = select(Task.id).where(
+        Task.status.in_(statuses),
+        (Task.next_poll_at.is_(None)) | (Task.next_poll_at <= now + timedelta(seconds=lookahead_seconds)),
+        (Task.lease_owner.is_(None)) | (Task.lease_expires_at < now)
+    ).order_by(
+        Task.next_poll_at.asc().nulls_first(), Task.id
+    ).limit(limit).with_for_update(skip_locked=True).scalar_subquery()
+
+    return update(Task).where(Task.id.in_(due)).values(
+        lease_owner=owner,
+        lease_expires_at=now + timedelta(seconds=lease_seconds),
+        updated_at=Task.updated_at      # 认领不算任务变更，保持 updated_at 不变
+    ).returning(
+        Task.id,
+        Task.name,
+        Task.status,
+        Task.created_at,
+        Task.poll_interval,
+        Task.toolkit_url,
+        func.coalesce(func.extract('epoch', Task.next_poll_at - now), 0).label("due_in")
+    )
+
+def renew_leases_statement(owner: str, task_ids, lease_seconds: float):
+    """构造续期租约的语句，RETURNING 续期成功的任务 ID（租约已被他人接管的不在其中）"""
+    return update(Task).where(
+        Task.id.in_(list(task_ids)),
+        Task.lease_owner == owner
+    ).values(
+        lease_expires_at=utc_now() + timedelta(seconds=lease_seconds),
+        updated_at=Task.updated_at
+    ).returning(Task.id)
+
+def release_leases_statement(owner: str, task_ids=None):
+    """构造释放租约的语句，task_ids 为 None 时释放本进程持有的全部租约"""
+    stmt = update(Task).where(Task.lease_owner == owner)
+    if task_ids is not None:
+        stmt = stmt.where(Task.id.in_(list(task_ids)))
+    return stmt.values(
+        lease_owner=None,
+        lease_expires_at=None,
+        updated_at=Task.updated_at
+    )
+
+def poll_results_statement(owner: str, results):
+    """构造批量写回一轮轮询结果的语句
+
+    使用 UPDATE ... FROM (VALUES ...) 一次更新所有任务的状态、下一次轮询时间和租约，
+    只更新本进程仍持有租约、且状态仍为轮询前状态的任务。
+    RETURNING 实际写回的任务 ID 以及状态是否变化 changed。
+
+    Args:
+        owner: 监控进程标识
+        results: [(任务 ID, 轮询前状态, 新状态, 下一次轮询间隔, 是否继续持有租约)]，
+                 轮询间隔为 None 表示任务不再需要轮询
+    """
+    poll_results = values(
+        column("id", Integer),
+        column("previous_status", Task.status.type),
+        column("status", Task.status.type),
+        column("poll_interval", Float),
+        column("keep_lease", Boolean),
+        name="poll_results"
+    ).data(list(results))
+    # VALUES 中的值没有类型信息，需要显式转换为对应的列类型
+    previous_status = cast(poll_results.c.previous_status, Task.status.type)
+    new_status = cast(poll_results.c.status, Task.status.type)
+    poll_interval = cast(poll_results.c.poll_interval, Float)
+
+    now = utc_now()
+    return update(Task).where(
+        Task.id == poll_results.c.id,
+        Task.status == previous_status,
+        Task.lease_owner == owner
+    ).values(
+        status=new_status,
+        updated_at=case(
+            (new_status != previous_status, now),
+            else_=Task.updated_at
+        ),
+        poll_interval=poll_interval,
+        next_poll_at=now + poll_interval * literal_column("interval '1 second'"),
+        lease_owner=case((poll_results.c.keep_lease, owner), else_=None),
+        lease_expires_at=case((poll_results.c.keep_lease, Task.lease_expires_at), else_=None)
+    ).returning(
+        Task.id,
+        (new_status != previous_status).label("changed")
+    )
+
+def heartbeat_statement(owner: str, hostname: str, pid: int, tracked_tasks: int):
+    """构造写入监控进程心跳的语句，首次写入时记录启动时间"""
+    now = utc_now()
+    statement = insert(MonitorHeartbeat).values(
+        owner=owner,
+        hostname=hostname,
+        pid=pid,
+        started_at=now,
+        last_seen_at=now,
+        tracked_tasks=tracked_tasks
+    )
+    return statement.on_conflict_do_update(
+        index_elements=[MonitorHeartbeat.owner],
+        set_={"last_seen_at": now, "tracked_tasks": statement.excluded.tracked_tasks}
+    )
+
+def prune_heartbeats_statement(older_than_seconds: float):
+    """构造删除长时间没有心跳（进程异常退出）的记录的语句"""
+    return delete(MonitorHeartbeat).where(
+        MonitorHeartbeat.last_seen_at < utc_now() - timedelta(seconds=older_than_seconds)
+    )
+
+def remove_heartbeat_statement(owner: str):
+    """构造删除监控进程心跳的语句（进程正常退出时）"""
+    return delete(MonitorHeartbeat).where(MonitorHeartbeat.owner == owner)
+
+def notify_statement(task_id):
+    """构造发送任务变更通知的语句，task_id 可以是逗号分隔的多个 ID
+
+    任务被删除时以 "-" 加任务 ID 通知，任务列表需要整体刷新。
+    """
+    return text("SELECT pg_notify(:channel, :payload)").bindparams(
+        channel=TASK_CHANGE_CHANNEL,
+        payload=str(task_id)
+    )
+
+# 每条记录数据集文件的语句最多包含的文件数（asyncpg 单条语句最多 32767 个参数）
+RECORD_BLOBS_BATCH_SIZE = 1000
+
+def record_blobs_statement(toolkit_url: str, files):
+    """构造记录已上传数据集文件的语句，已有记录时只更新最近使用时间
+
+    files 为 [{"sha256", "size", "content_type"}, ...]；每个文件占用多个绑定参数，
+    文件较多时由调用方按 RECORD_BLOBS_BATCH_SIZE 分批执行。
+    """
+    rows = {
+        entry["sha256"]: {
+            "toolkit_url": toolkit_url,
+            "sha256": entry["sha256"],
+            "size": entry["size"],
+            "content_type": entry.get("content_type")
+        }
+        for entry in files
+    }
+    statement = insert(DatasetBlob).values(list(rows.values()))
+    return statement.on_conflict_do_update(
+        index_elements=[DatasetBlob.toolkit_url, DatasetBlob.sha256],
+        set_={"last_used_at": func.timezone('utc', func.now())}
+    )
+
+def known_blobs_statement(toolkit_url: str, hashes):
+    """构造查询已记录为上传到该 toolkit 的文件摘要的语句
+
+    摘要列表作为一个数组参数传入，参数个数与文件数无关。
+    """
+    return select(DatasetBlob.sha256).where(
+        DatasetBlob.toolkit_url == toolkit_url,
+        DatasetBlob.sha256 == any_(bindparam("hashes", list(hashes), type_=ARRAY(String)))
+    )
+
+def record_manifest_statement(manifest_hash: str, files):
+    """构造记录数据集清单的语句，清单已存在时不做修改"""
+    return insert(DatasetManifest).values(
+        sha256=manifest_hash,
+        files=files
+    ).on_conflict_do_nothing(index_elements=[DatasetManifest.sha256])
+
+# 以下语句由任务提交流程通过异步数据库层（pg_db_async）执行
+
+def reserve_task_statement(job_name: str, config):
+    """构造占用任务名称的语句：插入一条 UPLOADING 状态的任务
+
+    名称已被占用时不插入，RETURNING 为空。
+    """
+    now = utc_now()
+    return insert(Task).values(
+        name=job_name,
+        status=TaskStatus.UPLOADING,
+        config=config,
+        created_at=now,
+        updated_at=now
+    ).on_conflict_do_nothing(index_elements=[Task.name]).returning(Task.id)
+
+def renew_reservation_statement(task_id: int):
+    """构造续期任务名称占用的语句：刷新 UPLOADING 任务的 updated_at，RETURNING 仍有效的任务 ID"""
+    return update(Task).where(
+        Task.id == task_id,
+        Task.status == TaskStatus.UPLOADING
+    ).values(updated_at=utc_now()).returning(Task.id)
+
+def finalize_task_statement(task_id: int, config, dataset_hash: str = None, toolkit_url: str = None):
+    """构造上传完成后将占用的任务转为 PENDING 并记录所在节点的语句，RETURNING 成功转换的任务 ID"""
+    return update(Task).where(
+        Task.id == task_id,
+        Task.status == TaskStatus.UPLOADING
+    ).values(
+        status=TaskStatus.PENDING,
+        config=config,
+        dataset_hash=dataset_hash,
+        toolkit_url=toolkit_url,
+        updated_at=utc_now()
+    ).returning(Task.id)
+
+def active_tasks_by_toolkit_statement(statuses):
+    """构造按节点统计处于指定状态的任务数的语句，结果为 (toolkit_url, count) 行"""
+    return select(Task.toolkit_url, func.count()).where(
+        Task.status.in_(statuses)
+    ).group_by(Task.toolkit_url)
+
+def release_reservations_statement(task_id: int = None, job_name: str = None, stale_seconds: float = None):
+    """构造删除任务名称占用的语句，RETURNING 被删除的任务 ID
+
+    Args:
+        task_id: 删除指定的占用（上传失败时回滚）
+        job_name: 只删除该名称的占用
+        stale_seconds: 删除超过该时长未续期的占用（提交进程异常退出后遗留的）
+    """
+    statement = delete(Task).where(Task.status == TaskStatus.UPLOADING)
+    if task_id is not None:
+        statement = statement.where(Task.id == task_id)
+    if job_name is not None:
+        statement = statement.where(Task.name == job_name)
+    if stale_seconds is not None:
+        statement = statement.where(Task.updated_at < utc_now() - timedelta(seconds=stale_seconds))
+    return statement.returning(Task.id)
+
 def init_db(drop_all=False):
-    """初始化数据库
+    """初始化数据库（建表、补齐枚举值、列和索引），由 migrate 命令在部署时执行一次
     :param drop_all: 是否删除所有表并重新创建
     """
+    engine = get_engine()
     if drop_all:
         Base.metadata.drop_all(engine)
     Base.metadata.create_all(engine)
 
-# 创建数据库引擎
-engine = create_engine(
-    DATABASE_URL,
-    pool_size=5,
-    max_overflow=10,
-    pool_timeout=30,
-    pool_recycle=1800
-)
+    # create_all 不会修改已存在的枚举类型，这里补齐新增的任务状态（枚举中存储的是成员名称）
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for status in TaskStatus:
+            conn.execute(text(
+                f"ALTER TYPE {Task.status.type.name} ADD VALUE IF NOT EXISTS '{status.name}'"
+            ))
+
+    # create_all 不会修改已存在的表，这里补齐新增的（可空）列和索引
+    existing_columns = {column["name"] for column in inspect(engine).get_columns(Task.__tablename__)}
+    with engine.begin() as conn:
+        for column in Task.__table__.columns:
+            if column.name not in existing_columns:
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(
+                    f"ALTER TABLE {Task.__tablename__} ADD COLUMN IF NOT EXISTS {column.name} {column_type}"
+                ))
+    for index in Task.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
 
-# 创建 session
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# 数据库引擎与会话工厂在首次访问数据库时创建，导入本模块不会连接数据库
+_engine = None
+_session_factory = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """获取数据库引擎，首次调用时创建"""
+    global _engine, _session_factory
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = create_engine(
+                    DATABASE_URL,
+                    pool_size=5,
+                    max_overflow=10,
+                    pool_timeout=30,
+                    pool_recycle=1800
+                )
+                _session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+                _engine = engine
+    return _engine
 
 def get_db():
     """获取数据库会话"""
-    db = SessionLocal()
+    get_engine()
+    db = _session_factory()
     try:
         yield db
     finally:
         db.close()
 
+def notify_task_changed(db, task_id) -> None:
+    """在当前事务中发送任务变更通知（NOTIFY），事务提交后才会送达监听方
+
+    Args:
+        db: 数据库会话
+        task_id: 任务 ID，批量变更时可以是逗号分隔的多个 ID
+    """
+    db.execute(notify_statement(task_id))
+
+def listen_task_changes():
+    """创建一个监听任务变更通知的独立连接（不占用连接池）
+
+    Returns:
+        已执行 LISTEN 的 DBAPI 连接，可配合 select() 与 poll() 使用
+    """
+    engine = get_engine()
+    cargs, cparams = engine.dialect.create_connect_args(engine.url)
+    conn = engine.dialect.dbapi.connect(*cargs, **cparams)
+    conn.autocommit = True
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"LISTEN {TASK_CHANGE_CHANNEL}")
+    finally:
+        cursor.close()
+    return conn
+
 def check_task_name_exists(task_name: str) -> bool:
     """检查任务名称是否已存在
     
@@ -122,5 +602,19 @@ def check_task_name_exists(task_name: str) -> bool:
         db.close()
 
 
-# 初始化数据库表（重建所有表）
-init_db(drop_all=False)
+def main():
+    """数据库管理命令：python pg_db.py migrate [--drop-all]"""
+    parser = argparse.ArgumentParser(description="数据库管理")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+    migrate = commands.add_parser("migrate", help="创建或升级数据库表结构")
+    migrate.add_argument("--drop-all", action="store_true", help="删除所有表后重新创建（会丢失数据）")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        init_db(drop_all=args.drop_all)
+        print("数据库表结构已是最新")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+异步数据库访问层（SQLAlchemy asyncio + asyncpg）
+
+供运行在事件循环中的监控与任务提交流程使用，查询不会阻塞事件循环；
+Gradio 的同步处理函数继续使用 pg_db 中的同步接口。
+"""
+import asyncio
+import os
+import weakref
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from pg_db import (
+    DATABASE_URL,
+    claim_tasks_statement, renew_leases_statement, release_leases_statement,
+    poll_results_statement, notify_statement, record_blobs_statement, record_manifest_statement,
+    known_blobs_statement, RECORD_BLOBS_BATCH_SIZE,
+    reserve_task_statement, renew_reservation_statement, finalize_task_statement, release_reservations_statement,
+    active_tasks_by_toolkit_statement, heartbeat_statement, prune_heartbeats_statement,
+    remove_heartbeat_statement
+)
+
+# 异步连接使用 asyncpg 驱动
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL",
+    DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+)
+
+# asyncpg 连接只能在创建它的事件循环中使用，监控线程与 Gradio 各自有事件循环，
+# 因此每个事件循环使用独立的引擎和连接池
+_engines = weakref.WeakKeyDictionary()
+
+
+def _get_engine_entry():
+    """获取当前事件循环的 (引擎, 会话工厂)，首次使用时创建"""
+    loop = asyncio.get_event_loop()
+    entry = _engines.get(loop)
+    if entry is None:
+        engine = create_async_engine(
+            ASYNC_DATABASE_URL,
+            pool_size=5,
+            max_overflow=10,
+            pool_timeout=30,
+            pool_recycle=1800
+        )
+        entry = (engine, async_sessionmaker(engine, expire_on_commit=False))
+        _engines[loop] = entry
+    return entry
+
+
+@asynccontextmanager
+async def async_session():
+    """获取异步数据库会话"""
+    _, session_factory = _get_engine_entry()
+    async with session_factory() as db:
+        yield db
+
+
+async def dispose_async_engine() -> None:
+    """关闭当前事件循环的引擎及其连接池"""
+    entry = _engines.pop(asyncio.get_event_loop(), None)
+    if entry is not None:
+        await entry[0].dispose()
+
+
+async def claim_due_tasks(owner: str, statuses, limit: int, lease_seconds: float, lookahead_seconds: float):
+    """认领一批即将到期的任务，参数与返回值见 pg_db.claim_tasks_statement"""
+    if limit <= 0:
+        return []
+    async with async_session() as db:
+        result = await db.execute(
+            claim_tasks_statement(owner, statuses, limit, lease_seconds, lookahead_seconds)
+        )
+        rows = result.all()
+        await db.commit()
+        return rows
+
+
+async def renew_task_leases(owner: str, task_ids, lease_seconds: float) -> set:
+    """续期本进程持有的租约，返回续期成功的任务 ID"""
+    if not task_ids:
+        return set()
+    async with async_session() as db:
+        result = await db.execute(renew_leases_statement(owner, task_ids, lease_seconds))
+        task_ids = {row.id for row in result.all()}
+        await db.commit()
+        return task_ids
+
+
+async def release_task_leases(owner: str, task_ids=None) -> None:
+    """释放本进程持有的租约，task_ids 为 None 时释放全部"""
+    async with async_session() as db:
+        await db.execute(release_leases_statement(owner, task_ids))
+        await db.commit()
+
+
+async def apply_poll_results(owner: str, results) -> set:
+    """在一个事务中批量写回一轮轮询的结果，状态有变化时发送一次变更通知
+
+    Returns:
+        set: 实际写回的任务 ID
+    """
+    if not results:
+        return set()
+    async with async_session() as db:
+        result = await db.execute(poll_results_statement(owner, results))
+        rows = result.all()
+        changed_ids = [row.id for row in rows if row.changed]
+        if changed_ids:
+            await db.execute(notify_statement(",".join(str(task_id) for task_id in changed_ids)))
+        await db.commit()
+        return {row.id for row in rows}
+
+
+async def reserve_task(job_name: str, config, stale_seconds: float) -> Optional[int]:
+    """以 UPLOADING 状态占用任务名称，同名的过期占用会先被清理
+
+    Returns:
+        任务 ID；名称已被占用时返回 None
+    """
+    async with async_session() as db:
+        result = await db.execute(
+            release_reservations_statement(job_name=job_name, stale_seconds=stale_seconds)
+        )
+        released = [f"-{row.id}" for row in result.all()]
+        result = await db.execute(reserve_task_statement(job_name, config))
+        task_id = result.scalar()
+        if task_id is not None or released:
+            await db.execute(notify_statement(",".join(released + ([str(task_id)] if task_id else []))))
+        await db.commit()
+        return task_id
+
+
+async def renew_reservation(task_id: int) -> bool:
+    """续期任务名称占用，占用已被清理时返回 False"""
+    async with async_session() as db:
+        result = await db.execute(renew_reservation_statement(task_id))
+        renewed = result.first() is not None
+        await db.commit()
+        return renewed
+
+
+async def finalize_task(task_id: int, config, dataset_hash: str = None, toolkit_url: str = None) -> bool:
+    """上传完成后将占用的任务转为 PENDING 并记录所在节点，占用已被清理时返回 False"""
+    async with async_session() as db:
+        result = await db.execute(finalize_task_statement(task_id, config, dataset_hash, toolkit_url))
+        finalized = result.first() is not None
+        if finalized:
+            await db.execute(notify_statement(task_id))
+        await db.commit()
+        return finalized
+
+
+async def release_reservations(task_id: int = None, stale_seconds: float = None) -> int:
+    """删除任务名称占用（上传失败回滚，或清理过期的占用），返回删除的数量"""
+    async with async_session() as db:
+        result = await db.execute(release_reservations_statement(task_id=task_id, stale_seconds=stale_seconds))
+        task_ids = [row.id for row in result.all()]
+        if task_ids:
+            await db.execute(notify_statement(",".join(f"-{task_id}" for task_id in task_ids)))
+        await db.commit()
+        return len(task_ids)
+
+
+async def record_dataset(toolkit_url: str, manifest_hash: str, files) -> None:
+    """记录 toolkit 已有的数据集文件和数据集清单，文件按 RECORD_BLOBS_BATCH_SIZE 分批写入"""
+    if not files:
+        return
+    blobs = list({entry["sha256"]: entry for entry in files}.values())
+    async with async_session() as db:
+        for start in range(0, len(blobs), RECORD_BLOBS_BATCH_SIZE):
+            await db.execute(record_blobs_statement(toolkit_url, blobs[start:start + RECORD_BLOBS_BATCH_SIZE]))
+        await db.execute(record_manifest_statement(manifest_hash, files))
+        await db.commit()
+
+
+async def known_blobs(toolkit_url: str, hashes) -> set:
+    """已记录为上传到该 toolkit 的文件摘要"""
+    if not hashes:
+        return set()
+    async with async_session() as db:
+        result = await db.execute(known_blobs_statement(toolkit_url, set(hashes)))
+        return set(result.scalars().all())
+
+
+async def count_active_tasks(statuses) -> dict:
+    """按节点统计处于指定状态的任务数，返回 {toolkit_url 或 None: 任务数}"""
+    async with async_session() as db:
+        result = await db.execute(active_tasks_by_toolkit_statement(statuses))
+        return {toolkit_url: count for toolkit_url, count in result.all()}
+
+
+async def record_heartbeat(owner: str, hostname: str, pid: int, tracked_tasks: int, prune_seconds: float) -> None:
+    """写入监控进程心跳，并清理超过 prune_seconds 没有心跳的记录"""
+    async with async_session() as db:
+        await db.execute(heartbeat_statement(owner, hostname, pid, tracked_tasks))
+        await db.execute(prune_heartbeats_statement(prune_seconds))
+        await db.commit()
+
+
+async def remove_heartbeat(owner: str) -> None:
+    """删除监控进程心跳（进程正常退出时）"""
+    async with async_session() as db:
+        await db.execute(remove_heartbeat_statement(owner))
+        await db.commit()
@@ -0,0 +1,158 @@
+import json
+import logging
+import tarfile
+import time
+from typing import List, Optional, Set, Tuple
+
+import aiohttp
+
+from config import Config
+from services.dataset_cache import DatasetFile, iter_file_chunks
+from services.toolkit_protocol import ProtocolSupport, post_multipart, retry_on_missing
+
+try:
+    import zstandard
+except ImportError:  # zstd 压缩为可选功能
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# 打包格式 -> (上传时的文件名, MIME 类型)
+BUNDLE_FORMATS = {
+    "tar": ("dataset.tar", "application/x-tar"),
+    "tar.zst": ("dataset.tar.zst", "application/zstd"),
+}
+
+MANIFEST_NAME = "manifest.json"
+_BLOCK_SIZE = tarfile.BLOCKSIZE
+
+
+def resolve_format(bundle_format: str) -> str:
+    """检查打包格式是否可用，未安装 zstandard 时 tar.zst 退化为 tar"""
+    if bundle_format not in BUNDLE_FORMATS:
+        raise ValueError(f"不支持的打包格式: {bundle_format}")
+    if bundle_format == "tar.zst" and zstandard is None:
+        logger.warning("未安装 zstandard，数据集改为不压缩的 tar 打包")
+        return "tar"
+    return bundle_format
+
+
+def _tar_header(name: str, size: int) -> bytes:
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mode = 0o644
+    info.mtime = int(time.time())
+    return info.tobuf(format=tarfile.PAX_FORMAT)
+
+
+def _padding(size: int) -> bytes:
+    return b"\0" * (-size % _BLOCK_SIZE)
+
+
+async def _iter_tar(job_name: str, config_name: str, config: bytes,
+                    files: List[DatasetFile], contents: List[DatasetFile]):
+    """边读文件边生成 tar 数据流，第一个成员是清单，其次是配置，然后是需要上传内容的文件"""
+    manifest = json.dumps({
+        "job_name": job_name,
+        "config": config_name,
+        "files": [f.to_dict() for f in files]
+    }, ensure_ascii=False).encode('utf-8')
+
+    for name, data in ((MANIFEST_NAME, manifest), (config_name, config)):
+        yield _tar_header(name, len(data)) + data + _padding(len(data))
+
+    for dataset_file in contents:
+        yield _tar_header(dataset_file.name, dataset_file.size)
+        written = 0
+        async for chunk in iter_file_chunks(dataset_file.path):
+            written += len(chunk)
+            yield chunk
+        if written != dataset_file.size:
+            raise IOError(f"{dataset_file.name} 在上传过程中被修改")
+        yield _padding(written)
+
+    # tar 以两个全零块结尾
+    yield b"\0" * (_BLOCK_SIZE * 2)
+
+
+async def iter_bundle(job_name: str, config_name: str, config: bytes, files: List[DatasetFile],
+                      contents: Optional[List[DatasetFile]] = None, bundle_format: str = "tar"):
+    """数据集打包的异步生成器：不写临时文件，按需读取文件并（可选地）用 zstd 压缩
+
+    Args:
+        files: 任务的全部数据集文件，写入清单
+        contents: 需要随包上传内容的文件，默认为全部文件
+        bundle_format: "tar" 或 "tar.zst"
+    """
+    tar_stream = _iter_tar(job_name, config_name, config, files, files if contents is None else contents)
+    try:
+        if bundle_format == "tar":
+            async for chunk in tar_stream:
+                yield chunk
+            return
+
+        compressor = zstandard.ZstdCompressor().compressobj()
+        async for chunk in tar_stream:
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+        yield compressor.flush()
+    finally:
+        await tar_stream.aclose()
+
+
+class ToolkitBundleClient:
+    """toolkit 单流打包上传客户端
+
+    协议：
+        POST {toolkit}/put_jobs_bundle/   multipart，只有一个部分 bundle（dataset.tar 或 dataset.tar.zst），
+                                          tar 依次包含 manifest.json、YAML 配置和数据集文件；
+                                          manifest.json 为 {"job_name", "config",
+                                                            "files": [{"name", "sha256", "size", "content_type"}, ...]}，
+                                          清单中的文件未随包上传时使用 toolkit 已有的同摘要文件，
+                                          toolkit 没有时返回 409 与 {"missing": [...]}
+    toolkit 不支持该协议时（404/405/501）由调用方回退为多部分上传，并在一段时间后重新探测。
+    """
+    def __init__(self, toolkit_url: str = Config.TOOLKIT_URL, bundle_format: str = Config.UPLOAD_BUNDLE_FORMAT):
+        self.toolkit_url = toolkit_url
+        self.bundle_format = resolve_format(bundle_format) if bundle_format else None
+        self._bundle_support = ProtocolSupport("toolkit 不支持打包上传，回退为多部分上传")
+
+    @property
+    def supports_bundle(self) -> bool:
+        """当前是否使用打包上传"""
+        return self.bundle_format is not None and self._bundle_support.supported
+
+    async def put_job(self, session: aiohttp.ClientSession, job_name: str, config_name: str,
+                      config: bytes, files: List[DatasetFile],
+                      missing: Optional[Set[str]] = None) -> Optional[Tuple[int, str]]:
+        """以一个数据流上传配置和文件并提交训练任务，toolkit 报告缺少文件时补传一次后重试
+
+        Args:
+            missing: toolkit 缺少的文件摘要，只上传这些文件的内容（相同内容只上传一次）；
+                     为 None 时上传全部文件
+
+        Returns:
+            (HTTP 状态码, 响应文本)；toolkit 不支持打包上传时返回 None
+        """
+        async def submit(missing):
+            if not self.supports_bundle:
+                return None
+            if missing is None:
+                contents = files
+            else:
+                contents = list({f.sha256: f for f in files if f.sha256 in missing}.values())
+            status, text = await self._post_bundle(session, job_name, config_name, config, files, contents)
+            if not self._bundle_support.check(status):
+                return None
+            return status, text
+
+        return await retry_on_missing(submit, missing)
+
+    async def _post_bundle(self, session: aiohttp.ClientSession, job_name: str, config_name: str,
+                           config: bytes, files: List[DatasetFile], contents: List[DatasetFile]) -> Tuple[int, str]:
+        filename, content_type = BUNDLE_FORMATS[self.bundle_format]
+        body = iter_bundle(job_name, config_name, config, files, contents, self.bundle_format)
+        fields = [('bundle', body, filename, content_type)]
+        async with post_multipart(session, f"{self.toolkit_url}/put_jobs_bundle/", fields) as response:
+            return response.status, await response.text()
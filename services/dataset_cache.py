@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+import json
+from typing import List, Optional, Set
+
+import aiohttp
+
+from config import Config
+from http_client import api_timeout, request
+from services.submission_scheduler import upload_bandwidth
+from services.toolkit_protocol import ProtocolSupport, post_multipart, retry_on_missing
+
+
+async def iter_file_chunks(filepath, chunk_size=Config.UPLOAD_CHUNK_SIZE):
+    """分块读取文件的异步生成器
+
+    开始发送该文件时才打开，发送完毕即关闭；读取在线程池中进行，不阻塞事件循环。
+    每块数据都经过全局带宽限速。
+    """
+    loop = asyncio.get_event_loop()
+    with open(filepath, 'rb') as f:
+        while True:
+            chunk = await loop.run_in_executor(None, f.read, chunk_size)
+            if not chunk:
+                break
+            await upload_bandwidth.consume(len(chunk))
+            yield chunk
+
+
+class DatasetFile:
+    """待上传的数据集文件"""
+    __slots__ = ("name", "path", "content_type", "sha256", "size")
+
+    def __init__(self, name: str, path: str, content_type: str, sha256: str, size: int):
+        self.name = name
+        self.path = path
+        self.content_type = content_type
+        self.sha256 = sha256
+        self.size = size
+
+    def to_dict(self):
+        """转换为清单条目"""
+        return {
+            "name": self.name,
+            "sha256": self.sha256,
+            "size": self.size,
+            "content_type": self.content_type
+        }
+
+
+def duplicate_names(files: List[DatasetFile]) -> List[str]:
+    """上传名称重复的文件名（toolkit 按名称保存文件，重名的文件会互相覆盖）"""
+    seen = set()
+    duplicates = []
+    for dataset_file in files:
+        if dataset_file.name in seen and dataset_file.name not in duplicates:
+            duplicates.append(dataset_file.name)
+        seen.add(dataset_file.name)
+    return duplicates
+
+
+def manifest_hash(files: List[DatasetFile]) -> str:
+    """数据集清单的 SHA-256，只与文件名和文件内容有关"""
+    entries = sorted([f.name, f.sha256] for f in files)
+    return hashlib.sha256(json.dumps(entries, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+class ToolkitDatasetClient:
+    """toolkit 数据集上传客户端（按内容寻址）
+
+    协议：
+        POST {toolkit}/blobs/missing       请求 {"hashes": [...]}，响应 {"missing": [...]}
+        POST {toolkit}/blobs/              multipart，每个文件以其 SHA-256 作为文件名
+        POST {toolkit}/put_jobs_by_hash/   请求 {"job_name", "config_name", "config",
+                                                 "files": [{"name", "sha256"}, ...]}；
+                                           引用的文件已被 toolkit 清理时返回 409 与 {"missing": [...]}
+    toolkit 不支持该协议时（404/405/501）由调用方回退为 /put_jobs/ 整体上传，并在一段时间后重新探测。
+    """
+    def __init__(self, toolkit_url: str = Config.TOOLKIT_URL):
+        self.toolkit_url = toolkit_url
+        self._blobs_support = ProtocolSupport("toolkit 不支持按内容寻址上传，回退为 /put_jobs/ 整体上传")
+
+    @property
+    def supports_blobs(self) -> bool:
+        """当前是否使用按内容寻址的上传协议"""
+        return self._blobs_support.supported
+
+    async def missing(self, session: aiohttp.ClientSession, hashes: List[str]) -> Optional[Set[str]]:
+        """查询 toolkit 缺少的文件
+
+        Returns:
+            缺少的 SHA-256 集合；toolkit 不支持该协议时返回 None
+        """
+        if not self.supports_blobs:
+            return None
+        async with request(
+            session, "POST", f"{self.toolkit_url}/blobs/missing",
+            json={"hashes": sorted(set(hashes))},
+            timeout=api_timeout(Config.REQUEST_TIMEOUT)
+        ) as response:
+            if not self._blobs_support.check(response.status):
+                return None
+            response.raise_for_status()
+            data = await response.json()
+        return set(data.get("missing", []))
+
+    async def upload_blobs(self, session: aiohttp.ClientSession, files: List[DatasetFile]) -> None:
+        """流式上传缺少的文件，内容相同的文件只上传一次"""
+        unique = list({f.sha256: f for f in files}.values())
+        if not unique:
+            return
+
+        fields = [
+            ('files', iter_file_chunks(f.path), f.sha256, f.content_type)
+            for f in unique
+        ]
+        async with post_multipart(session, f"{self.toolkit_url}/blobs/", fields) as response:
+            response.raise_for_status()
+
+    async def put_job(self, session: aiohttp.ClientSession, job_name: str, config_name: str,
+                      config: bytes, files: List[DatasetFile]):
+        """按文件摘要提交训练任务，toolkit 报告缺少文件时补传一次后重试
+
+        Returns:
+            (HTTP 状态码, 响应文本)
+        """
+        payload = {
+            "job_name": job_name,
+            "config_name": config_name,
+            "config": config.decode('utf-8'),
+            "files": [{"name": f.name, "sha256": f.sha256} for f in files]
+        }
+
+        async def submit(missing):
+            if missing is not None:
+                await self.upload_blobs(session, [f for f in files if f.sha256 in missing])
+            # 提交任务不是幂等操作，不自动重试
+            async with request(
+                session, "POST", f"{self.toolkit_url}/put_jobs_by_hash/",
+                retry=False,
+                json=payload,
+                timeout=api_timeout(Config.REQUEST_TIMEOUT)
+            ) as response:
+                return response.status, await response.text()
+
+        return await retry_on_missing(submit)
@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from config import Config
+
+# 图片格式 -> (对应的扩展名, MIME 类型)，重新编码时使用第一个扩展名
+IMAGE_FORMATS = {
+    "JPEG": ((".jpg", ".jpeg"), "image/jpeg"),
+    "PNG": ((".png",), "image/png"),
+}
+# 按 JPEG 处理的格式：手机拍摄的照片常被识别为 MPO（多帧 JPEG），只保留第一帧
+JPEG_VARIANTS = {"MPO"}
+
+
+class DatasetError(Exception):
+    """数据集中有无法读取的图片"""
+    def __init__(self, errors: List[Tuple[str, str]]):
+        self.errors = errors
+        details = "；".join(f"{os.path.basename(path)}（{reason}）" for path, reason in errors[:5])
+        if len(errors) > 5:
+            details += f" 等共 {len(errors)} 个文件"
+        super().__init__(f"以下图片无法读取: {details}")
+
+
+def file_digest(filepath: str) -> Tuple[str, int]:
+    """计算文件的 SHA-256，返回 (十六进制摘要, 字节数)"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(Config.UPLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def preprocess_image(filepath: str, output_dir: str, max_size: int) -> Tuple[str, str, str, str, int]:
+    """校验并预处理单张图片（在子进程中执行）
+
+    解码校验后按 EXIF 方向旋转，长边缩小到 max_size 以内，去掉 EXIF 后按实际格式重新编码。
+    图片没有 EXIF、无需缩小且扩展名与实际格式一致时直接使用原文件。
+    上传名称的主干保持不变，标注文件仍能与图片对应；扩展名按实际格式修正。
+    重新编码的文件写入 output_dir 下每张图片独立的子目录，不同图片即使上传名称相同也不会互相覆盖，
+    名称是否重复由调用方检查。
+
+    Returns:
+        (上传使用的文件路径, 上传名称, MIME 类型, SHA-256, 字节数)
+
+    Raises:
+        ValueError: 图片损坏或格式不受支持
+    """
+    upload_path, upload_name, mime_type = _preprocess_image(filepath, output_dir, max_size)
+    return (upload_path, upload_name, mime_type) + file_digest(upload_path)
+
+
+def _preprocess_image(filepath: str, output_dir: str, max_size: int) -> Tuple[str, str, str]:
+    # Pillow 只在预处理子进程中使用，不在导入时加载
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(filepath) as image:
+            image.verify()
+        with Image.open(filepath) as image:
+            image_format = "JPEG" if image.format in JPEG_VARIANTS else image.format
+            if image_format not in IMAGE_FORMATS:
+                raise ValueError(f"不支持的图片格式 {image.format}")
+            image.load()
+
+            extensions, mime_type = IMAGE_FORMATS[image_format]
+            stem, original_extension = os.path.splitext(os.path.basename(filepath))
+            # MPO 总是重新编码，去掉第一帧之后的附加图像
+            if (max(image.size) <= max_size and not image.getexif()
+                    and image.format == image_format
+                    and original_extension.lower() in extensions):
+                return filepath, os.path.basename(filepath), mime_type
+
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_size, max_size), Image.LANCZOS)
+
+            upload_name = stem + extensions[0]
+            output_path = os.path.join(tempfile.mkdtemp(dir=output_dir), upload_name)
+            if image_format == "JPEG":
+                if image.mode not in ("RGB", "L"):
+                    image = image.convert("RGB")
+                image.save(output_path, "JPEG", quality=Config.PREPROCESS_JPEG_QUALITY)
+            else:
+                image.save(output_path, "PNG", optimize=False)
+            return output_path, upload_name, mime_type
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(str(e) or type(e).__name__)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """获取预处理进程池，首次调用时创建
+
+    Gradio 进程中有多个线程（任务列表广播、监控等），fork 出的子进程可能继承其他线程
+    持有的锁而死锁，因此以 spawn 方式启动工作进程。
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=Config.PREPROCESS_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+async def preprocess_images(filepaths: List[str], output_dir: str,
+                            max_size: int = Config.PREPROCESS_MAX_SIZE) -> List[Tuple[str, str, str, str, int]]:
+    """在进程池中并行预处理一批图片
+
+    Returns:
+        与输入顺序一致的 [(上传使用的文件路径, 上传名称, MIME 类型, SHA-256, 字节数), ...]
+
+    Raises:
+        DatasetError: 有图片无法读取，此时不应上传任何文件
+    """
+    loop = asyncio.get_event_loop()
+    pool = get_pool()
+    results = await asyncio.gather(
+        *(loop.run_in_executor(pool, preprocess_image, path, output_dir, max_size) for path in filepaths),
+        return_exceptions=True
+    )
+
+    errors = [(path, str(result)) for path, result in zip(filepaths, results) if isinstance(result, ValueError)]
+    if errors:
+        raise DatasetError(errors)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
+async def hash_files(filepaths: List[str]) -> List[Tuple[str, int]]:
+    """在进程池中并行计算一批文件的 (SHA-256, 字节数)"""
+    loop = asyncio.get_event_loop()
+    pool = get_pool()
+    return await asyncio.gather(*(loop.run_in_executor(pool, file_digest, path) for path in filepaths))
@@ -0,0 +1,57 @@
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+from config import Config
+from pg_db import get_task_result_images
+
+
+class TaskResultCache:
+    """任务结果缓存类
+
+    按任务 ID 缓存结果图片链接（LRU），以任务的更新时间作为版本：
+    界面上显示的更新时间变化后，对应条目失效并重新查询。
+    """
+    def __init__(self, max_size: int = Config.RESULT_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()   # 任务 ID -> (版本, 图片链接列表)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _version(updated_at) -> str:
+        """与任务列表 Updated 列一致的版本字符串"""
+        return updated_at.strftime("%Y-%m-%d %H:%M:%S")
+
+    def get(self, task_id: int, version: Optional[str] = None) -> Optional[List[str]]:
+        """获取任务结果图片链接
+
+        Args:
+            task_id: 任务 ID
+            version: 界面上该任务的 Updated 值，为 None 时只要有缓存就直接使用
+
+        Returns:
+            图片链接列表；任务不存在时返回 None
+        """
+        with self._lock:
+            entry = self._entries.get(task_id)
+            if entry is not None and (version is None or entry[0] == version):
+                self._entries.move_to_end(task_id)
+                return entry[1]
+
+        result = get_task_result_images(task_id)
+        if result is None:
+            self.invalidate(task_id)
+            return None
+
+        updated_at, image_urls = result
+        with self._lock:
+            self._entries[task_id] = (self._version(updated_at), image_urls)
+            self._entries.move_to_end(task_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return image_urls
+
+    def invalidate(self, task_id: int) -> None:
+        """移除单个任务的缓存"""
+        with self._lock:
+            self._entries.pop(task_id, None)
@@ -0,0 +1,168 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from typing import Optional
+
+from config import Config
+
+
+class SubmissionRejected(Exception):
+    """提交队列已满"""
+
+
+class _Ticket:
+    """一次排队中的提交"""
+    __slots__ = ("user", "seq", "granted", "started_at")
+
+    def __init__(self, user: str, seq: int, granted: asyncio.Future):
+        self.user = user
+        self.seq = seq
+        self.granted = granted
+        self.started_at = None
+
+
+class SubmissionScheduler:
+    """训练提交调度类
+
+    同时进行的上传（含预处理）不超过 slots 个；排队的提交按用户分组，空闲槽位总是分给
+    最久没有获得槽位的用户，一个用户排队再多，也只能与其他用户交替获得槽位。
+    排队总数和每个用户的排队数有上限，超出时直接拒绝。
+    槽位平均占用时长以 EWMA 估计，用于给出预计等待时间。
+    """
+    def __init__(self, slots: int = Config.UPLOAD_SLOTS,
+                 max_queued: int = Config.UPLOAD_MAX_QUEUED,
+                 max_queued_per_user: int = Config.UPLOAD_MAX_QUEUED_PER_USER):
+        self.slots = slots
+        self.max_queued = max_queued
+        self.max_queued_per_user = max_queued_per_user
+        self._queues = {}               # 用户 -> 排队中的 _Ticket
+        self._last_served = {}          # 用户 -> 最近一次获得槽位的序号
+        self._serial = itertools.count()
+        self._running = set()
+        self._avg_duration: Optional[float] = None
+
+    @property
+    def queued(self) -> int:
+        """排队中的提交数"""
+        return sum(len(queue) for queue in self._queues.values())
+
+    def enqueue(self, user: str) -> _Ticket:
+        """加入队列，有空闲槽位时立即获得
+
+        Raises:
+            SubmissionRejected: 排队总数或该用户的排队数已达上限
+        """
+        queue = self._queues.get(user)
+        if queue is not None and len(queue) >= self.max_queued_per_user:
+            raise SubmissionRejected(f"您已有 {len(queue)} 个提交在排队，请等待完成后再提交。")
+        if self.queued >= self.max_queued:
+            raise SubmissionRejected("提交队列已满，请稍后再试。")
+
+        ticket = _Ticket(user, next(self._serial), asyncio.get_event_loop().create_future())
+        self._queues.setdefault(user, deque()).append(ticket)
+        self._dispatch()
+        return ticket
+
+    async def wait(self, ticket: _Ticket, timeout: float) -> bool:
+        """等待获得槽位，超时返回 False（调用方可借此刷新排队信息）"""
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.granted), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def release(self, ticket: _Ticket) -> None:
+        """提交结束（或放弃排队），释放槽位并分配给下一个"""
+        if ticket in self._running:
+            self._running.discard(ticket)
+            duration = time.monotonic() - ticket.started_at
+            self._avg_duration = duration if self._avg_duration is None \
+                else 0.2 * duration + 0.8 * self._avg_duration
+            if ticket.user not in self._queues and all(t.user != ticket.user for t in self._running):
+                # 用户没有进行中和排队中的提交，不再保留其服务记录
+                self._last_served.pop(ticket.user, None)
+        else:
+            queue = self._queues.get(ticket.user)
+            if queue is not None and ticket in queue:
+                queue.remove(ticket)
+                if not queue:
+                    del self._queues[ticket.user]
+                    if all(t.user != ticket.user for t in self._running):
+                        self._last_served.pop(ticket.user, None)
+            if not ticket.granted.done():
+                ticket.granted.cancel()
+        self._dispatch()
+
+    def position(self, ticket: _Ticket) -> int:
+        """排在该提交之前的提交数，已获得槽位时为 0"""
+        if ticket.granted.done():
+            return 0
+        return self._service_order().index(ticket)
+
+    def estimated_wait(self, ticket: _Ticket) -> Optional[float]:
+        """预计还需等待的秒数，尚无完成记录时返回 None"""
+        if ticket.granted.done():
+            return 0.0
+        if self._avg_duration is None:
+            return None
+        now = time.monotonic()
+        # 按平均占用时长推算各槽位的空闲时刻，依次分配给排在前面的提交
+        free_at = [max(0.0, running.started_at + self._avg_duration - now) for running in self._running]
+        free_at += [0.0] * max(0, self.slots - len(free_at))
+        heapq.heapify(free_at)
+        for _ in range(self.position(ticket)):
+            heapq.heappush(free_at, heapq.heappop(free_at) + self._avg_duration)
+        return free_at[0]
+
+    def _priority(self, user: str):
+        """用户获得下一个槽位的优先级：最久没有获得槽位的优先，其次按排队先后"""
+        return self._last_served.get(user, -1), self._queues[user][0].seq
+
+    def _service_order(self):
+        """按分配规则排列的全部排队提交"""
+        queues = [list(self._queues[user]) for user in sorted(self._queues, key=self._priority)]
+        order = []
+        for depth in range(max((len(queue) for queue in queues), default=0)):
+            order.extend(queue[depth] for queue in queues if depth < len(queue))
+        return order
+
+    def _dispatch(self) -> None:
+        """把空闲槽位依次分配给轮到的用户"""
+        while len(self._running) < self.slots and self._queues:
+            user = min(self._queues, key=self._priority)
+            queue = self._queues[user]
+            ticket = queue.popleft()
+            if not queue:
+                del self._queues[user]
+            self._last_served[user] = next(self._serial)
+            ticket.started_at = time.monotonic()
+            self._running.add(ticket)
+            ticket.granted.set_result(True)
+
+
+class TokenBucket:
+    """令牌桶限速，rate 为每秒字节数，不大于 0 时不限速
+
+    所有上传共享同一个令牌桶；令牌不足时按欠下的字节数等待，总速率不超过 rate。
+    """
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+
+    async def consume(self, amount: int) -> None:
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= amount
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.rate)
+
+
+# 所有上传共享的带宽上限
+upload_bandwidth = TokenBucket(Config.UPLOAD_BANDWIDTH_LIMIT)
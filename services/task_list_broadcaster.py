@@ -0,0 +1,203 @@
+import logging
+import select
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from config import Config
+from pg_db import get_task_page, get_task_changes, listen_task_changes, get_monitor_status
+
+logger = logging.getLogger(__name__)
+
+
+class TaskListBroadcaster:
+    """任务列表广播类
+
+    进程内只运行一个后台刷新线程：收到 tasks 表的 NOTIFY 或兜底定时器到期时查询一次变更，
+    维护第一页快照和带版本号的变更日志，所有 Gradio 会话只读取内存中的结果，
+    数据库压力与在线页面数量无关。
+    """
+    def __init__(self, refresh_interval: float = Config.TASK_LIST_REFRESH_INTERVAL,
+                 log_size: int = 1000, debounce: float = 0.2):
+        self.refresh_interval = refresh_interval
+        self.debounce = debounce
+        self._lock = threading.Lock()
+        self._version = 0
+        self._watermark = None
+        self._first_page = None
+        self._ready = threading.Event()         # 第一页快照已生成
+        self._latest_rows = {}                  # 任务 ID -> 最近一次广播的行
+        self._log = deque(maxlen=log_size)      # (版本号, 键, 行)
+        self._oldest_version = 0                # 变更日志能覆盖的最早版本
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self._listen_conn = None
+        self._needs_full_refresh = False        # 收到任务删除通知后需要整体刷新
+        self._monitor_status = None             # 监控进程存活情况的缓存
+        self._monitor_checked_at = 0.0
+        self._monitor_lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        """当前版本号，每次发现变更时递增"""
+        return self._version
+
+    def start(self) -> None:
+        """启动后台刷新线程，首次查询也在后台线程中进行，数据库不可用时不阻塞调用方"""
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="task-list-broadcaster", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """停止后台刷新线程"""
+        self._running = False
+        self._close_listen_conn()
+
+    def first_page(self, timeout: float = 0):
+        """返回 (版本号, 第一页快照)
+
+        Args:
+            timeout: 首次快照尚未生成时最多等待的秒数，仍未生成时快照为 None
+        """
+        if timeout:
+            self._ready.wait(timeout)
+        with self._lock:
+            return self._version, self._first_page
+
+    def changes_since(self, version: int):
+        """返回指定版本之后的变更
+
+        Returns:
+            (当前版本号, [(键, 行), ...])；版本过旧、变更日志已无法覆盖时变更列表为 None
+        """
+        with self._lock:
+            if version < self._oldest_version:
+                return self._version, None
+            return self._version, [(key, row) for v, key, row in self._log if v > version]
+
+    def monitor_status(self):
+        """监控进程存活情况（见 pg_db.get_monitor_status），每 MONITOR_INTERVAL 最多查询一次数据库"""
+        with self._monitor_lock:
+            if time.monotonic() - self._monitor_checked_at >= Config.MONITOR_INTERVAL:
+                try:
+                    self._monitor_status = get_monitor_status(Config.MONITOR_HEARTBEAT_TIMEOUT)
+                except Exception as e:
+                    logger.error(f"查询监控进程心跳出错: {str(e)}")
+                    self._monitor_status = None
+                self._monitor_checked_at = time.monotonic()
+            return self._monitor_status
+
+    def _run(self) -> None:
+        """等待 NOTIFY 或兜底定时器，然后刷新"""
+        while self._running:
+            try:
+                if self._first_page is None:
+                    # 首次刷新（或启动时数据库不可用），先查询第一页再等待通知
+                    self._refresh(full=True)
+                    continue
+                notified = self._wait_for_notify()
+                if notified and self.debounce:
+                    # 合并短时间内连续到达的通知
+                    time.sleep(self.debounce)
+                    self._drain_notifies()
+                self._refresh(full=self._needs_full_refresh)
+            except Exception as e:
+                logger.error(f"刷新共享任务列表出错: {str(e)}")
+                self._close_listen_conn()
+                time.sleep(self.refresh_interval)
+
+    def _wait_for_notify(self) -> bool:
+        """阻塞直到收到通知或超时，返回是否收到通知"""
+        if self._listen_conn is None:
+            try:
+                self._listen_conn = listen_task_changes()
+            except Exception as e:
+                logger.warning(f"LISTEN 连接失败，仅使用定时刷新: {str(e)}")
+                time.sleep(self.refresh_interval)
+                return False
+
+        readable, _, _ = select.select([self._listen_conn], [], [], self.refresh_interval)
+        if not readable:
+            return False
+        return self._drain_notifies() > 0
+
+    def _drain_notifies(self) -> int:
+        """读取并清空已到达的通知"""
+        if self._listen_conn is None:
+            return 0
+        self._listen_conn.poll()
+        count = len(self._listen_conn.notifies)
+        # 增量查询只能发现更新过的任务，任务被删除时需要整体刷新
+        if any(task_id.startswith("-")
+               for notify in self._listen_conn.notifies for task_id in notify.payload.split(",")):
+            self._needs_full_refresh = True
+        self._listen_conn.notifies.clear()
+        return count
+
+    def _close_listen_conn(self) -> None:
+        if self._listen_conn is not None:
+            try:
+                self._listen_conn.close()
+            except Exception:
+                pass
+            self._listen_conn = None
+
+    def _refresh(self, full: bool = False) -> None:
+        """查询一次变更，有变化时递增版本号并更新第一页快照"""
+        if full or self._watermark is None:
+            self._needs_full_refresh = False
+            page = get_task_page(Config.TASK_PAGE_SIZE)
+            with self._lock:
+                self._version += 1
+                self._watermark = page["watermark"]
+                self._first_page = page
+                self._log.clear()
+                self._latest_rows = {row[0]: row for row in page["data"]}
+                self._oldest_version = self._version
+            self._ready.set()
+            return
+
+        changes = get_task_changes(self._watermark, limit=self._log.maxlen)
+        if changes["truncated"]:
+            # 变更过多，变更日志无法完整记录，让所有会话重新查询
+            self._refresh(full=True)
+            return
+
+        entries = [
+            (key, row) for key, row in zip(changes["keys"], changes["data"])
+            if self._latest_rows.get(row[0]) != row
+        ]
+        self._watermark = changes["watermark"]
+        if not entries:
+            return
+
+        page = get_task_page(Config.TASK_PAGE_SIZE)
+        with self._lock:
+            self._version += 1
+            for key, row in entries:
+                if len(self._log) == self._log.maxlen:
+                    # 淘汰最旧的变更，落后于它的会话需要重新查询
+                    old_version, _, old_row = self._log.popleft()
+                    self._oldest_version = old_version
+                    if self._latest_rows.get(old_row[0]) == old_row:
+                        del self._latest_rows[old_row[0]]
+                self._log.append((self._version, key, row))
+                self._latest_rows[row[0]] = row
+            self._first_page = page
+
+
+_broadcaster: Optional[TaskListBroadcaster] = None
+_broadcaster_lock = threading.Lock()
+
+
+def get_broadcaster() -> TaskListBroadcaster:
+    """获取进程内唯一的任务列表广播器，首次调用时启动"""
+    global _broadcaster
+    with _broadcaster_lock:
+        if _broadcaster is None:
+            _broadcaster = TaskListBroadcaster()
+            _broadcaster.start()
+        return _broadcaster
@@ -1,116 +1,371 @@
 import asyncio
-from pg_db import Task, TaskStatus, get_db
+import heapq
+import itertools
+import random
+import os
+import signal
+import socket
+import time
+import uuid
+from datetime import datetime
+from pg_db import TaskStatus
+from pg_db_async import (
+    claim_due_tasks, renew_task_leases, release_task_leases, apply_poll_results, dispose_async_engine,
+    release_reservations, record_heartbeat, remove_heartbeat
+)
 from config import Config
-import json
+from http_client import RETRY_STATUSES, BackendUnavailable, api_timeout, create_session, request
 import logging
 import aiohttp
-from typing import Optional
+from typing import List, Optional
+from services.toolkit_pool import ToolkitPool
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 需要轮询状态的任务
+ACTIVE_STATUSES = [TaskStatus.TRAINING, TaskStatus.PENDING]
+# 训练已完成、等待 get_files 下载结果的任务：监控持续发送下载请求，直到 get_files 将状态更新为 running
+DISPATCH_STATUSES = [TaskStatus.RUN_BEFORE]
+# get_files 下载队列已满时返回的状态码
+GET_FILES_BUSY_STATUS = 503
+
+
+class _TrackedTask:
+    """调度器中单个任务的轮询状态"""
+    __slots__ = ("task_id", "name", "toolkit_url", "status", "previous_status", "created_at", "interval",
+                 "deadline", "in_flight")
+
+    def __init__(self, task_id: int, name: str, toolkit_url: str, status: TaskStatus, created_at: datetime):
+        self.task_id = task_id
+        self.name = name
+        self.toolkit_url = toolkit_url
+        self.status = status
+        self.previous_status = status
+        self.created_at = created_at
+        self.interval = 0.0
+        self.deadline = 0.0
+        self.in_flight = False
+
+
 class TaskMonitor:
     """任务监控类"""
     def __init__(self):
         self._running = True
         self.session: Optional[aiohttp.ClientSession] = None
+        self.toolkits = ToolkitPool()
+        # 监控进程标识，用于认领任务租约
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._tracked = {}                      # 本进程持有租约的任务 ID -> _TrackedTask
+        self._queue = []                        # (到期时间, 序号, 任务 ID) 小顶堆
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None  # 在监控线程的事件循环中创建
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._expected_duration: Optional[float] = None  # 预计训练时长（秒）
 
-    async def _update_task_status(self, task: Task, new_status: TaskStatus, db) -> None:
-        """更新任务状态"""
-        if task.status != new_status:
-            if new_status == TaskStatus.RUN_BEFORE:
-                try:
-                    # 从配置中获取 get_files 服务的 URL
-                    get_files_url = f"{Config.GET_FILES_URL}/get_file"
-                    
-                    # 准备请求数据
-                    request_data = {
-                        "database_url": Config.DATABASE_URL.replace("db", Config.DB_HOST),  # 使用配置中的数据库主机
-                        "task_id": task.id,
-                        "toolkit_url": Config.TOOLKIT_URL
-                    }
-                    
-                    # 发送 HTTP 请求但不等待响应
-                    try:
-                        await self.session.post(
-                            get_files_url,
-                            json=request_data,
-                            headers={'Content-Type': 'application/json'},
-                            timeout=60
-                        )
-                        logger.info(f"已发送请求到 get_files 服务处理任务 {task.id}")
-                    except Exception as e:
-                        logger.error(f"发送请求到 get_files 服务时出错: {str(e)}")
-                            
-                except Exception as e:
-                    logger.error(f"处理 RUN_BEFORE 状态时出错: {str(e)}")
-                    # 如果处理过程出错，将任务状态设置为失败
-                    task.status = TaskStatus.FAILED
-                    db.commit()
-                    logger.info(f"任务 {task.name} 状态更新为: {TaskStatus.FAILED.value}")
-                    return
-            
-            # 如果没有错误，正常更新状态
-            task.status = new_status
-            db.commit()
-            logger.info(f"任务 {task.name} 状态更新为: {new_status.value}")
-
-    async def monitor_task(self, task: Task, db) -> None:
-        """监控单个任务状态"""
-        if not self.session:
-            self.session = aiohttp.ClientSession()
+    async def _dispatch_get_file(self, task_id: int, toolkit_url: str) -> bool:
+        """通知 get_files 服务从任务所在节点下载训练结果（状态已提交为 RUN_BEFORE 之后调用）
+
+        get_files 对同一任务的重复请求复用进行中的作业，可以安全地重复发送。
+
+        Returns:
+            bool: get_files 是否已接收下载作业；队列已满或请求失败时返回 False，稍后重新发送
+        """
+        # 从配置中获取 get_files 服务的 URL
+        get_files_url = f"{Config.GET_FILES_URL}/get_file"
 
+        # 准备请求数据
+        request_data = {
+            "database_url": Config.DATABASE_URL.replace("db", Config.DB_HOST),  # 使用配置中的数据库主机
+            "task_id": task_id,
+            "toolkit_url": toolkit_url
+        }
+
+        # get_files 只登记下载作业，立即返回；队列已满（503）表示服务繁忙，不计入熔断
         try:
-            url = f"{Config.TOOLKIT_URL}/get_zip/"
-            request_data = json.dumps({"job_name": task.name})
-            
-            async with self.session.post(
-                url,
-                data=request_data,
-                headers={'Content-Type': 'application/json'},
-                timeout=Config.REQUEST_TIMEOUT
+            async with request(
+                self.session, "POST", get_files_url,
+                retry_statuses=RETRY_STATUSES - {GET_FILES_BUSY_STATUS},
+                json=request_data,
+                timeout=api_timeout(60)
             ) as response:
-                status_map = {
-                    200: TaskStatus.RUN_BEFORE,
-                    201: TaskStatus.TRAINING
-                }
-                new_status = status_map.get(response.status, TaskStatus.FAILED)
-                await self._update_task_status(task, new_status, db)
-                
+                if response.status == GET_FILES_BUSY_STATUS:
+                    logger.warning(f"get_files 下载队列已满，稍后重新发送任务 {task_id}")
+                    return False
+                response.raise_for_status()
+            logger.info(f"已发送请求到 get_files 服务处理任务 {task_id}")
+            return True
+        except Exception as e:
+            logger.error(f"发送请求到 get_files 服务时出错: {str(e)}")
+            return False
+
+    async def _probe_status(self, status_client, job_name: str) -> Optional[TaskStatus]:
+        """通过 /get_zip/ 查询单个任务状态（toolkit 不支持批量状态接口时使用），查询失败时返回 None"""
+        try:
+            return await status_client.probe_one(self.session, job_name)
+        except BackendUnavailable as e:
+            logger.warning(f"监控任务 {job_name} 失败: {str(e)}")
+        except Exception as e:
+            logger.error(f"监控任务 {job_name} 失败: {str(e)}")
+        return None
+
+    def _poll_interval(self, state: "_TrackedTask", status_changed: bool) -> float:
+        """计算任务下一次轮询的间隔"""
+        initial, maximum = Config.MONITOR_POLL_INTERVALS.get(
+            state.status.value, Config.MONITOR_POLL_INTERVALS['training']
+        )
+        if status_changed or not state.interval:
+            interval = initial
+        else:
+            interval = min(state.interval * Config.MONITOR_BACKOFF_FACTOR, maximum)
+
+        # 训练时长接近历史平均时长时加快轮询，尽早发现任务完成
+        if state.status == TaskStatus.TRAINING and self._expected_duration:
+            elapsed = (datetime.utcnow() - state.created_at).total_seconds()
+            if elapsed >= self._expected_duration * Config.MONITOR_NEAR_DONE_RATIO:
+                interval = min(interval, Config.MONITOR_NEAR_DONE_INTERVAL)
+        return interval
+
+    def _schedule(self, state: "_TrackedTask", delay: float) -> None:
+        """设置任务的本地轮询时间并放入优先队列"""
+        state.deadline = time.monotonic() + max(0.0, delay)
+        heapq.heappush(self._queue, (state.deadline, next(self._seq), state.task_id))
+        self._wakeup.set()
+
+    async def _claim_tasks(self) -> None:
+        """续期已持有的租约，并认领一批即将到期的任务"""
+        lost = set(self._tracked) - await renew_task_leases(
+            self.owner, list(self._tracked), Config.MONITOR_LEASE_SECONDS
+        )
+        for task_id in lost:
+            # 续期期间可能已有批次处理完该任务
+            state = self._tracked.get(task_id)
+            if state is not None and not state.in_flight:
+                logger.warning(f"任务 {state.name} 的租约已失效")
+                del self._tracked[task_id]
+
+        rows = await claim_due_tasks(
+            self.owner,
+            ACTIVE_STATUSES + DISPATCH_STATUSES,
+            min(Config.MONITOR_CLAIM_BATCH, Config.MONITOR_MAX_CLAIMED - len(self._tracked)),
+            Config.MONITOR_LEASE_SECONDS,
+            Config.MONITOR_INTERVAL
+        )
+        for row in rows:
+            if row.id in self._tracked:
+                continue
+            state = _TrackedTask(row.id, row.name, self.toolkits.get(row.toolkit_url).url, row.status, row.created_at)
+            state.interval = row.poll_interval or 0.0
+            self._tracked[row.id] = state
+            # 加入少量抖动，避免大量任务在同一时刻到期
+            self._schedule(state, float(row.due_in) + random.uniform(0, 0.5))
+
+    async def _probe_batch(self, batch, semaphore: asyncio.Semaphore) -> List[Optional[TaskStatus]]:
+        """查询一批任务的状态：按所在节点分组，每个节点优先使用一次批量状态请求
+
+        toolkit 不可用（连接失败、熔断中等）时状态为 None，表示本轮未能查询到，任务保持原状态。
+        """
+        groups = {}
+        for state in batch:
+            groups.setdefault(state.toolkit_url, []).append(state.name)
+        results = await asyncio.gather(*(
+            self._probe_backend(url, names, semaphore) for url, names in groups.items()
+        ))
+        statuses = {}
+        for url, probed in zip(groups, results):
+            for name, status in probed.items():
+                statuses[(url, name)] = status
+        return [statuses[(state.toolkit_url, state.name)] for state in batch]
+
+    async def _probe_backend(self, toolkit_url: str, names: List[str], semaphore: asyncio.Semaphore):
+        """查询同一节点上一组任务的状态，返回 {任务名称: 状态或 None}"""
+        status_client = self.toolkits.get(toolkit_url).status_client
+        try:
+            async with semaphore:
+                statuses = await status_client.probe(self.session, names)
+            if statuses is not None:
+                return statuses
+        except BackendUnavailable as e:
+            logger.warning(f"节点 {toolkit_url} 暂时不可用，{len(names)} 个任务保持原状态: {str(e)}")
+            return {name: None for name in names}
+        except Exception as e:
+            logger.error(f"批量查询节点 {toolkit_url} 的任务状态失败: {str(e)}")
+            return {name: None for name in names}
+
+        async def probe_one(name):
+            async with semaphore:
+                return await self._probe_status(status_client, name)
+
+        return dict(zip(names, await asyncio.gather(*[probe_one(name) for name in names])))
+
+    async def _run_batch(self, batch, semaphore: asyncio.Semaphore) -> None:
+        """处理一批到期任务
+
+        并发查询状态后，在一个事务中批量写回状态、下一次轮询时间和租约；
+        新进入 RUN_BEFORE 的任务在状态提交后继续持有租约并立即到期，
+        由下一批通知 get_files 下载结果（副作用只在状态提交后执行），
+        get_files 未确认接收（队列已满、不可用）时按退避间隔重新发送。
+        """
+        for state in batch:
+            state.previous_status = state.status
+        probing = [state for state in batch if state.status not in DISPATCH_STATUSES]
+        dispatching = [state for state in batch if state.status in DISPATCH_STATUSES]
+        batch = probing + dispatching
+        try:
+            probed = await self._probe_batch(probing, semaphore)
+
+            async def dispatch(state):
+                async with semaphore:
+                    return await self._dispatch_get_file(state.task_id, state.toolkit_url)
+
+            accepted = await asyncio.gather(*[dispatch(state) for state in dispatching])
+
+            results = []
+            for state, new_status in zip(probing, probed):
+                previous_status = state.previous_status
+                if new_status is None:
+                    # 未能查询到状态：保持原状态，按状态未变化退避，不把任务标记为失败
+                    new_status = previous_status
+                state.status = new_status
+                if new_status in ACTIVE_STATUSES:
+                    state.interval = self._poll_interval(state, new_status != previous_status)
+                    # 下一次轮询在认领窗口内时继续持有租约，否则释放给任意监控进程重新认领
+                    keep_lease = state.interval < Config.MONITOR_INTERVAL
+                    results.append((state.task_id, previous_status, new_status, state.interval, keep_lease))
+                elif new_status in DISPATCH_STATUSES:
+                    state.interval = 0.0
+                    results.append((state.task_id, previous_status, new_status, state.interval, True))
+                else:
+                    results.append((state.task_id, previous_status, new_status, None, False))
+            for state, ok in zip(dispatching, accepted):
+                if ok:
+                    state.interval = Config.MONITOR_DISPATCH_RECHECK
+                else:
+                    state.interval = self._poll_interval(state, False)
+                keep_lease = state.interval < Config.MONITOR_INTERVAL
+                results.append((state.task_id, state.status, state.status, state.interval, keep_lease))
+
+            applied = await apply_poll_results(self.owner, results)
         except Exception as e:
-            logger.error(f"监控任务 {task.name} 失败: {str(e)}")
-            await self._update_task_status(task, TaskStatus.FAILED, db)
+            logger.error(f"写回轮询结果出错: {str(e)}")
+            # 未写回的任务保留租约，稍后重试
+            for state in batch:
+                state.status = state.previous_status
+                state.interval = state.interval or Config.MONITOR_INTERVAL
+                state.in_flight = False
+                self._schedule(state, state.interval)
+            return
+
+        for state, (_, previous_status, new_status, interval, keep_lease) in zip(batch, results):
+            state.in_flight = False
+            if state.task_id not in applied:
+                # 租约已被其他监控进程接管，或任务状态已被其他流程修改（例如 get_files 已完成下载）
+                self._tracked.pop(state.task_id, None)
+                continue
+
+            if new_status != previous_status:
+                logger.info(f"任务 {state.name} 状态更新为: {new_status.value}")
+                if new_status == TaskStatus.RUN_BEFORE and previous_status == TaskStatus.TRAINING:
+                    self._record_duration(state)
+
+            if keep_lease:
+                self._schedule(state, interval)
+            else:
+                self._tracked.pop(state.task_id, None)
+
+    def _record_duration(self, state: "_TrackedTask") -> None:
+        """记录训练完成耗时，用指数滑动平均估计预计训练时长"""
+        duration = (datetime.utcnow() - state.created_at).total_seconds()
+        if self._expected_duration is None:
+            self._expected_duration = duration
+        else:
+            self._expected_duration = 0.8 * self._expected_duration + 0.2 * duration
 
     async def start_monitoring(self) -> None:
-        """开始监控所有任务"""
+        """开始监控所有任务
+
+        每隔 MONITOR_INTERVAL 用 SKIP LOCKED 认领一批即将到期的任务并续期已持有的租约，
+        多个监控进程可以同时运行、各自处理不同的任务；进程退出后租约过期，任务由其他进程接管。
+        认领到的任务按到期时间放入优先队列，到期的任务成批查询、成批提交，并发查询数由信号量限制。
+        """
+        self._loop = asyncio.get_event_loop()
+        self._wakeup = asyncio.Event()
+        semaphore = asyncio.Semaphore(Config.MONITOR_CONCURRENCY)
+        running = set()
+        next_claim = 0.0
         try:
-            self.session = aiohttp.ClientSession()
-            logger.info("开始监控任务...")
-            
+            self.session = create_session()
+            logger.info(f"开始监控任务（{self.owner}）...")
+
             while self._running:
-                db = next(get_db())
-                try:
-                    tasks = db.query(Task).filter(
-                        Task.status.in_([TaskStatus.TRAINING, TaskStatus.PENDING])
-                    ).limit(10).all()
-
-                    if tasks:
-                        # logger.info(f"发现 {len(tasks)} 个待监控任务")
-                        await asyncio.gather(
-                            *[self.monitor_task(task, db) for task in tasks]
+                now = time.monotonic()
+                if now >= next_claim:
+                    try:
+                        await self._claim_tasks()
+                    except Exception as e:
+                        logger.error(f"认领待监控任务出错: {str(e)}")
+                    try:
+                        # 清理提交进程异常退出后遗留的任务名称占用
+                        released = await release_reservations(stale_seconds=Config.UPLOAD_RESERVATION_TTL)
+                        if released:
+                            logger.info(f"已清理 {released} 个过期的上传中任务")
+                    except Exception as e:
+                        logger.error(f"清理过期的上传中任务出错: {str(e)}")
+                    try:
+                        # 写入存活心跳，界面据此显示是否有监控进程在运行
+                        await record_heartbeat(
+                            self.owner, socket.gethostname(), os.getpid(), len(self._tracked),
+                            Config.MONITOR_HEARTBEAT_RETENTION
                         )
-                    else:
-                        logger.info("当前没有需要监控的任务")
+                    except Exception as e:
+                        logger.error(f"写入监控心跳出错: {str(e)}")
+                    # 认领周期加入抖动，避免多个监控进程总在同一时刻认领
+                    next_claim = now + Config.MONITOR_INTERVAL * random.uniform(0.9, 1.1)
 
-                except Exception as e:
-                    logger.error(f"监控周期出错: {str(e)}")
-                finally:
-                    db.close()
+                # 取出所有到期的任务，按批次处理；即将到期的任务一并提前处理，以便合并请求
+                batch = []
+                if self._queue and self._queue[0][0] <= time.monotonic():
+                    horizon = time.monotonic() + Config.MONITOR_BATCH_WINDOW
+                else:
+                    horizon = 0.0
+                while self._queue and self._queue[0][0] <= horizon:
+                    deadline, _, task_id = heapq.heappop(self._queue)
+                    state = self._tracked.get(task_id)
+                    if state is None or state.deadline != deadline or state.in_flight:
+                        continue
+                    state.in_flight = True
+                    batch.append(state)
+                for i in range(0, len(batch), Config.MONITOR_BATCH_SIZE):
+                    run = asyncio.ensure_future(
+                        self._run_batch(batch[i:i + Config.MONITOR_BATCH_SIZE], semaphore)
+                    )
+                    running.add(run)
+                    run.add_done_callback(running.discard)
 
-                await asyncio.sleep(Config.MONITOR_INTERVAL)
+                wake_at = min(self._queue[0][0] if self._queue else next_claim, next_claim)
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(
+                        self._wakeup.wait(),
+                        timeout=max(0.0, wake_at - time.monotonic())
+                    )
+                except asyncio.TimeoutError:
+                    pass
 
         finally:
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+            # 释放所有租约，其他监控进程可以立即接管
+            try:
+                await release_task_leases(self.owner)
+            except Exception as e:
+                logger.error(f"释放任务租约出错: {str(e)}")
+            try:
+                await remove_heartbeat(self.owner)
+            except Exception as e:
+                logger.error(f"删除监控心跳出错: {str(e)}")
+            await dispose_async_engine()
             if self.session:
                 await self.session.close()
             logger.info("监控任务已停止")
@@ -118,4 +373,31 @@ class TaskMonitor:
     def stop(self) -> None:
         """停止监控"""
         self._running = False
-        logger.info("正在停止任务监控...")
\ No newline at end of file
+        if self._loop is not None and self._wakeup is not None:
+            # stop 可能在其他线程中调用
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        logger.info("正在停止任务监控...")
+
+def main() -> None:
+    """独立运行任务监控进程：python -m services.task_monitor
+
+    收到 SIGINT / SIGTERM 时停止认领、等待进行中的批次写回，释放租约并删除心跳后退出；
+    监控异常退出时进程以非零状态码结束，由进程管理器（docker restart 策略等）重启。
+    """
+    monitor = TaskMonitor()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, monitor.stop)
+        except NotImplementedError:
+            # Windows 的事件循环不支持 add_signal_handler
+            signal.signal(signum, lambda *_: monitor.stop())
+    try:
+        loop.run_until_complete(monitor.start_monitoring())
+    finally:
+        loop.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import json
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from config import Config
+from http_client import api_timeout, request
+from pg_db import TaskStatus
+from services.toolkit_protocol import ProtocolSupport
+
+# /status 接口返回的状态与任务状态的对应关系
+STATUS_MAP = {
+    "pending": TaskStatus.TRAINING,
+    "queued": TaskStatus.TRAINING,
+    "training": TaskStatus.TRAINING,
+    "running": TaskStatus.TRAINING,
+    "done": TaskStatus.RUN_BEFORE,
+    "completed": TaskStatus.RUN_BEFORE,
+}
+
+# /get_zip/ 接口的状态码与任务状态的对应关系（旧版 toolkit）
+GET_ZIP_STATUS_MAP = {
+    200: TaskStatus.RUN_BEFORE,
+    201: TaskStatus.TRAINING
+}
+
+
+class ToolkitStatusClient:
+    """toolkit 任务状态查询客户端
+
+    优先使用批量状态接口 POST {toolkit}/status：
+        请求 {"job_names": [...]}，响应 {"statuses": {"<job_name>": "training" | "done" | "failed", ...}}
+    一次请求查询多个任务，toolkit 不需要打包结果文件。
+    toolkit 不支持该接口时（404/405/501）回退为逐个 POST /get_zip/，并在一段时间后重新探测。
+    """
+    def __init__(self, toolkit_url: str = Config.TOOLKIT_URL):
+        self.toolkit_url = toolkit_url
+        self._status_support = ProtocolSupport(
+            "toolkit 不支持批量状态接口，回退为 /get_zip/ 查询", Config.STATUS_PROBE_RECHECK
+        )
+
+    @property
+    def supports_status(self) -> bool:
+        """当前是否使用批量状态接口"""
+        return self._status_support.supported
+
+    async def probe(self, session: aiohttp.ClientSession, job_names: List[str]) -> Optional[Dict[str, TaskStatus]]:
+        """批量查询任务状态
+
+        Returns:
+            dict: 任务名称 -> 任务状态；不支持批量接口时返回 None，由调用方回退为逐个查询
+        """
+        if not self.supports_status:
+            return None
+
+        statuses = {}
+        for i in range(0, len(job_names), Config.STATUS_PROBE_BATCH):
+            chunk = job_names[i:i + Config.STATUS_PROBE_BATCH]
+            async with request(
+                session, "POST", f"{self.toolkit_url}/status",
+                json={"job_names": chunk},
+                timeout=api_timeout(Config.REQUEST_TIMEOUT)
+            ) as response:
+                if not self._status_support.check(response.status):
+                    return None
+                response.raise_for_status()
+                data = await response.json()
+
+            reported = data.get("statuses", {})
+            for name in chunk:
+                value = reported.get(name)
+                statuses[name] = STATUS_MAP.get(str(value).lower(), TaskStatus.FAILED)
+        return statuses
+
+    async def probe_one(self, session: aiohttp.ClientSession, job_name: str) -> TaskStatus:
+        """通过 /get_zip/ 查询单个任务状态（旧版 toolkit）"""
+        async with request(
+            session, "POST", f"{self.toolkit_url}/get_zip/",
+            data=json.dumps({"job_name": job_name}),
+            headers={'Content-Type': 'application/json'},
+            timeout=api_timeout(Config.REQUEST_TIMEOUT)
+        ) as response:
+            return GET_ZIP_STATUS_MAP.get(response.status, TaskStatus.FAILED)
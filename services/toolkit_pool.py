@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from config import Config
+from http_client import api_timeout, request
+from services.dataset_bundle import ToolkitBundleClient
+from services.dataset_cache import ToolkitDatasetClient
+from services.toolkit_client import ToolkitStatusClient
+from services.toolkit_protocol import UNSUPPORTED_STATUSES
+
+logger = logging.getLogger(__name__)
+
+
+class ToolkitBackend:
+    """一个训练节点（toolkit）及其探测到的健康状态和负载
+
+    每个节点有独立的协议客户端，各自记录该节点是否支持批量状态、按内容寻址和打包上传。
+    """
+    def __init__(self, url: str):
+        self.url = url
+        self.status_client = ToolkitStatusClient(url)
+        self.dataset_client = ToolkitDatasetClient(url)
+        self.bundle_client = ToolkitBundleClient(url)
+        self.healthy = True
+        self.slots: Optional[int] = None    # 可同时训练的任务数，toolkit 不支持 /capacity 时为 None
+        self.running = 0                    # toolkit 报告的训练中任务数
+        self.queued = 0                     # toolkit 报告的排队任务数
+        self.assigned = 0                   # 上次探测后分配到该节点的提交数
+
+    def load(self, active_tasks: int = 0) -> float:
+        """节点负载：训练中与排队的任务数除以可同时训练的任务数
+
+        toolkit 不支持 /capacity 时，任务数按数据库中分配给该节点、尚未完成的任务数估计，
+        可同时训练的任务数按 TOOLKIT_DEFAULT_CAPACITY 估计，与其他节点的负载可以直接比较。
+        """
+        if self.slots is None:
+            return (active_tasks + self.assigned) / max(Config.TOOLKIT_DEFAULT_CAPACITY, 1)
+        return (self.running + self.queued + self.assigned) / max(self.slots, 1)
+
+    async def probe(self, session: aiohttp.ClientSession) -> None:
+        """探测健康状态和容量：GET {toolkit}/capacity，响应 {"slots", "running", "queued"}
+
+        连接失败、5xx 或熔断中视为不可用；404/405/501 表示旧版 toolkit，可用但容量未知。
+        探测定期进行，失败时不重试。
+        """
+        try:
+            async with request(
+                session, "GET", f"{self.url}/capacity",
+                retry=False,
+                timeout=api_timeout(Config.TOOLKIT_PROBE_TIMEOUT)
+            ) as response:
+                if response.status in UNSUPPORTED_STATUSES:
+                    self.slots = None
+                else:
+                    response.raise_for_status()
+                    data = await response.json()
+                    self.slots = int(data.get("slots", 1))
+                    self.running = int(data.get("running", 0))
+                    self.queued = int(data.get("queued", 0))
+            if not self.healthy:
+                logger.info(f"训练节点 {self.url} 已恢复")
+            self.healthy = True
+        except Exception as e:
+            if self.healthy:
+                logger.warning(f"训练节点 {self.url} 不可用: {str(e) or type(e).__name__}")
+            self.healthy = False
+        self.assigned = 0
+
+
+class ToolkitPool:
+    """训练节点池
+
+    新任务分配给负载最低的可用节点，任务记录所在节点后，状态查询和结果下载都发往该节点。
+    节点状态在需要时按 TOOLKIT_PROBE_INTERVAL 重新探测。
+    """
+    def __init__(self, urls: List[str] = Config.TOOLKIT_URLS):
+        self.urls = [url.rstrip('/') for url in urls]  # 接受新任务的节点
+        self.backends: Dict[str, ToolkitBackend] = {}
+        for url in self.urls:
+            self.get(url)
+        self._refreshed_at = 0.0
+        self._refresh_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def default_url(self) -> str:
+        """未记录节点的任务（多节点之前创建的）所在的节点"""
+        return Config.TOOLKIT_URL
+
+    def get(self, url: Optional[str]) -> ToolkitBackend:
+        """获取任务所在的节点，已从配置中移除的节点也照常返回，以便完成其上的任务"""
+        url = (url or self.default_url).rstrip('/')
+        backend = self.backends.get(url)
+        if backend is None:
+            backend = self.backends[url] = ToolkitBackend(url)
+        return backend
+
+    async def refresh(self, session: aiohttp.ClientSession, force: bool = False) -> None:
+        """并发探测接受新任务的节点，距上次探测不足 TOOLKIT_PROBE_INTERVAL 时跳过"""
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        async with self._refresh_lock:
+            if not force and time.monotonic() - self._refreshed_at < Config.TOOLKIT_PROBE_INTERVAL:
+                return
+            await asyncio.gather(*(self.backends[url].probe(session) for url in self.urls))
+            self._refreshed_at = time.monotonic()
+
+    async def choose(self, session: aiohttp.ClientSession,
+                     active_tasks: Optional[Dict[str, int]] = None) -> Optional[ToolkitBackend]:
+        """选择负载最低的可用节点，没有可用节点时返回 None
+
+        Args:
+            active_tasks: 节点 URL -> 数据库中分配给该节点、尚未完成的任务数，
+                          用于估计不支持 /capacity 的节点的负载
+        """
+        await self.refresh(session)
+        active_tasks = active_tasks or {}
+        candidates = [
+            backend for url, backend in self.backends.items()
+            if backend.healthy and url in self.urls
+        ]
+        if not candidates:
+            return None
+        backend = min(candidates, key=lambda b: (b.load(active_tasks.get(b.url, 0)), b.assigned))
+        # 在下次探测前计入本次分配，避免并发提交都分到同一个节点
+        backend.assigned += 1
+        return backend
@@ -0,0 +1,85 @@
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional, Set, Tuple
+
+import aiohttp
+
+from config import Config
+from http_client import request
+
+logger = logging.getLogger(__name__)
+
+# toolkit 不支持某个接口时返回的状态码（旧版 toolkit）
+UNSUPPORTED_STATUSES = (404, 405, 501)
+
+
+class ProtocolSupport:
+    """toolkit 可选接口的支持情况
+
+    接口返回 UNSUPPORTED_STATUSES 时记为不支持，调用方回退为旧接口，recheck 秒后重新尝试。
+    """
+    def __init__(self, fallback_message: str, recheck: float = Config.TOOLKIT_PROTOCOL_RECHECK):
+        self.fallback_message = fallback_message
+        self.recheck = recheck
+        self._unsupported_until = 0.0
+
+    @property
+    def supported(self) -> bool:
+        """当前是否使用该接口"""
+        return time.monotonic() >= self._unsupported_until
+
+    def check(self, status: int) -> bool:
+        """根据响应状态码记录支持情况，返回接口是否受支持"""
+        if status in UNSUPPORTED_STATUSES:
+            logger.info(self.fallback_message)
+            self._unsupported_until = time.monotonic() + self.recheck
+            return False
+        return True
+
+
+@asynccontextmanager
+async def post_multipart(session: aiohttp.ClientSession, url: str, fields: List[Tuple]):
+    """以 multipart 流式上传并产出响应：
+
+        async with post_multipart(session, url, [(字段名, 内容, 文件名, MIME 类型), ...]) as response:
+            ...
+
+    内容为 bytes 或异步生成器（如 iter_file_chunks），生成器在发送时才读取文件，
+    内存占用与上传大小无关。数据流不能重放，不自动重试；超时使用会话的连接/读取超时。
+    结束时（包括提交失败时）关闭尚未发送完的数据流。
+    """
+    streams = [body for _, body, _, _ in fields if hasattr(body, "aclose")]
+    try:
+        form = aiohttp.FormData()
+        for name, body, filename, content_type in fields:
+            form.add_field(name, body, filename=filename, content_type=content_type)
+        async with request(session, "POST", url, retry=False, data=form) as response:
+            yield response
+    finally:
+        for body in streams:
+            await body.aclose()
+
+
+def missing_files(text: str) -> Optional[Set[str]]:
+    """解析 409 响应 {"missing": [...]} 中 toolkit 缺少的文件摘要，响应不是预期的 JSON 时返回 None"""
+    try:
+        return set(json.loads(text).get("missing", []))
+    except (ValueError, AttributeError, TypeError):
+        return None
+
+
+async def retry_on_missing(submit, missing: Optional[Set[str]] = None):
+    """调用 submit(missing) 提交任务，toolkit 返回 409 报告缺少文件时以缺少的摘要重试一次
+
+    submit 返回 (HTTP 状态码, 响应文本)，或 None 表示放弃提交（原样返回 None）。
+    409 的响应不是预期的 JSON（例如来自代理或旧版 toolkit）时不重试，原样返回，由调用方按失败处理。
+    """
+    for attempt in range(2):
+        result = await submit(missing)
+        if result is None or result[0] != 409 or attempt:
+            return result
+        missing = missing_files(result[1])
+        if missing is None:
+            return result
@@ -1,21 +1,55 @@
+import asyncio
+import shutil
+import tempfile
 import yaml
-from PIL import Image
-from io import BytesIO
 import os
 from config import Config
-from pg_db import Task, TaskStatus, get_db, check_task_name_exists
-import aiohttp
+from http_client import create_session
+from pg_db import TaskStatus
+from pg_db_async import (
+    reserve_task, renew_reservation, finalize_task, release_reservations, record_dataset, count_active_tasks,
+    known_blobs
+)
+from services.dataset_cache import DatasetFile, duplicate_names, iter_file_chunks, manifest_hash
+from services.dataset_preprocess import DatasetError, preprocess_images, hash_files
+from services.submission_scheduler import SubmissionScheduler, SubmissionRejected
+from services.toolkit_pool import ToolkitPool
+from services.toolkit_protocol import post_multipart
 import json
 
 class TrainingManager:
     """训练管理类"""
     def __init__(self):
         self.session = None
+        self.toolkits = ToolkitPool()
+        self.scheduler = SubmissionScheduler()
 
     async def init_session(self):
         """初始化会话"""
         if self.session is None:
-            self.session = aiohttp.ClientSession()
+            self.session = create_session()
+
+    async def submit_training_queued(self, user: str, *args):
+        """排队提交训练任务的异步生成器
+
+        按用户公平排队等待上传槽位，排队期间定期产出排队位置和预计等待时间，最后产出提交结果。
+        """
+        try:
+            ticket = self.scheduler.enqueue(user)
+        except SubmissionRejected as e:
+            yield str(e)
+            return
+
+        try:
+            while not await self.scheduler.wait(ticket, Config.UPLOAD_QUEUE_REFRESH):
+                position = self.scheduler.position(ticket)
+                wait = self.scheduler.estimated_wait(ticket)
+                eta = f"，预计等待约 {int(wait) + 1} 秒" if wait is not None else ""
+                yield f"排队中：前面还有 {position} 个提交{eta}"
+            yield "正在处理并上传数据集..."
+            yield await self.submit_training(*args)
+        finally:
+            self.scheduler.release(ticket)
 
     async def submit_training(self, *args):
         """提交训练任务"""
@@ -28,16 +62,18 @@ class TrainingManager:
         if not images:
             return "请上传至少一张图片来开始训练。"
 
-        # 检查任务名称是否已存在
-        if check_task_name_exists(job_name):
-            return f"任务名称 '{job_name}' 已存在，请使用其他名称。"
-
+        preprocess_dir = None
+        task_id = None
+        keepalive = None
+        finalized = False
+        accepted = False    # toolkit 是否已接受任务
         try:
             if self.session is None:
                 await self.init_session()
 
             yaml_config = None
-            files_to_send = []
+            image_paths = []
+            caption_paths = []
 
             # 处理���传的文件
             for filepath in images:
@@ -58,54 +94,149 @@ class TrainingManager:
                         yaml_config
                     )
                     
-                    # 将更新后的 YAML 转换为 BytesIO
+                    # 更新后的 YAML 很小，直接作为字节发送
+                    config_name = filename
                     yaml_content = yaml.dump(yaml_config).encode('utf-8')
-                    byte_io = BytesIO(yaml_content)
-                    byte_io.seek(0)
-                    files_to_send.append(('files', (filename, byte_io, 'text/yaml')))
 
                 elif file_extension in Config.VALID_IMAGE_EXTENSIONS:
-                    with open(filepath, 'rb') as f:
-                        byte_io = BytesIO(f.read())
-                        byte_io.seek(0)
-                        files_to_send.append(('files', (filename, byte_io, 'image/png')))
+                    image_paths.append(filepath)
                 elif file_extension == '.txt':
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        byte_io = BytesIO(f.read().encode('utf-8'))
-                        byte_io.seek(0)
-                        files_to_send.append(('files', (filename, byte_io, 'text/plain')))
+                    caption_paths.append(filepath)
 
             if not yaml_config:
                 return "请先上传一个 YAML 配置文件。"
 
-            # 创建 FormData
-            form = aiohttp.FormData()
-            for field_name, file_tuple in files_to_send:
-                form.add_field(field_name,
-                             file_tuple[1],
-                             filename=file_tuple[0],
-                             content_type=file_tuple[2])
-
-            # 提交任务
-            url = f"{Config.TOOLKIT_URL}/put_jobs/"
-            async with self.session.post(
-                url,
-                data=form,
-                timeout=Config.REQUEST_TIMEOUT
-            ) as response:
-                if response.status == 200:
-                    return await self._create_task(job_name, yaml_config)
-                else:
-                    response_text = await response.text()
-                    return f"任务提交失败: {response_text}"
+            # 先占用任务名称，名称冲突时不处理、不上传任何文件
+            task_id = await reserve_task(job_name, yaml_config, Config.UPLOAD_RESERVATION_TTL)
+            if task_id is None:
+                return f"任务名称 '{job_name}' 已存在，请使用其他名称。"
+            keepalive = asyncio.ensure_future(self._renew_reservation(task_id))
+
+            # 上传前并行校验、旋转、缩小并重新编码图片，有损坏的图片时不上传任何文件
+            preprocess_dir = tempfile.mkdtemp(prefix="dataset_")
+            try:
+                processed = await preprocess_images(image_paths, preprocess_dir)
+            except DatasetError as e:
+                return str(e)
+            dataset = [
+                DatasetFile(name, path, mime_type, sha256, size)
+                for path, name, mime_type, sha256, size in processed
+            ]
+            for path, (sha256, size) in zip(caption_paths, await hash_files(caption_paths)):
+                dataset.append(DatasetFile(os.path.basename(path), path, 'text/plain', sha256, size))
+            # 扩展名按实际格式修正后可能重名（如 a.png 实为 JPEG 与 a.jpg），重名的文件在 toolkit 上会互相覆盖
+            duplicates = duplicate_names(dataset)
+            if duplicates:
+                return f"以下文件上传后重名，请重命名后再提交: {'、'.join(duplicates)}"
+            dataset_hash = manifest_hash(dataset)
+
+            # 分配到负载最低的训练节点
+            backend = await self.toolkits.choose(self.session, await self._active_tasks())
+            if backend is None:
+                return "当前没有可用的训练节点，请稍后再试。"
+            print(f"任务 {job_name} 分配到训练节点 {backend.url}")
+
+            # 只上传 toolkit 还没有的文件；toolkit 不支持时整体上传。配置了打包格式时优先打包为一个数据流
+            missing = await self._missing_blobs(backend, dataset)
+            if missing is not None:
+                print(f"数据集 {dataset_hash[:12]} 共 {len(dataset)} 个文件，需上传 {len(missing)} 个")
+            result = await backend.bundle_client.put_job(
+                self.session, job_name, config_name, yaml_content, dataset, missing
+            )
+            if result is not None:
+                status, response_text = result
+            elif missing is None:
+                status, response_text = await self._put_job(backend.url, config_name, yaml_content, dataset)
+            else:
+                await backend.dataset_client.upload_blobs(
+                    self.session, [f for f in dataset if f.sha256 in missing]
+                )
+                status, response_text = await backend.dataset_client.put_job(
+                    self.session, job_name, config_name, yaml_content, dataset
+                )
+
+            if status != 200:
+                return f"任务提交失败: {response_text}"
+            accepted = True
+            keepalive.cancel()
+            finalized = await finalize_task(task_id, yaml_config, dataset_hash, backend.url)
+            if not finalized:
+                # 占用已被清理，但 toolkit 已接受任务：重新登记，使监控能跟踪该任务
+                print(f"任务 {job_name} 的名称占用已失效，重新登记")
+                task_id = await reserve_task(job_name, yaml_config, Config.UPLOAD_RESERVATION_TTL)
+                finalized = task_id is not None and \
+                    await finalize_task(task_id, yaml_config, dataset_hash, backend.url)
+                if not finalized:
+                    return f"任务 {job_name} 已提交到训练节点，但任务名称已被其他提交占用，无法记录该任务，请联系管理员。"
+            if missing is not None:
+                # 文件索引只用于减少查询，写入失败不影响已提交的任务
+                try:
+                    await record_dataset(backend.url, dataset_hash, [f.to_dict() for f in dataset])
+                except Exception as e:
+                    print(f"记录数据集文件索引失败: {str(e)}")
+            return f"任务 {job_name} 已成功提交，任务 ID: {task_id}"
 
         except Exception as e:
             print(f"提交任务时出错: {str(e)}")
+            if accepted and not finalized:
+                return f"任务 {job_name} 已提交到训练节点，但记录任务失败: {str(e)}，请联系管理员。"
             return f"提交任务失败: {str(e)}"
         finally:
-            # 关闭所有 BytesIO 对象
-            for _, file_tuple in files_to_send:
-                file_tuple[1].close()
+            if keepalive is not None:
+                keepalive.cancel()
+            # 未能完成提交时释放任务名称；toolkit 已接受任务时不释放，避免同名任务再次提交到 toolkit
+            if task_id is not None and not finalized and not accepted:
+                try:
+                    await release_reservations(task_id=task_id)
+                except Exception as e:
+                    print(f"释放任务 {task_id} 的名称占用失败: {str(e)}")
+            if preprocess_dir is not None:
+                shutil.rmtree(preprocess_dir, ignore_errors=True)
+
+    @staticmethod
+    async def _renew_reservation(task_id):
+        """预处理与上传期间定期续期任务名称占用，长时间的上传不会被当作遗留占用清理"""
+        while True:
+            await asyncio.sleep(Config.UPLOAD_RESERVATION_RENEW_INTERVAL)
+            try:
+                if not await renew_reservation(task_id):
+                    print(f"任务 {task_id} 的名称占用已失效")
+                    return
+            except Exception as e:
+                print(f"续期任务 {task_id} 的名称占用失败: {str(e)}")
+
+    async def _missing_blobs(self, backend, dataset):
+        """toolkit 缺少的文件摘要，toolkit 不支持按内容寻址上传时返回 None
+
+        dataset_blobs 中已记录为上传到该节点的文件不再向 toolkit 查询；
+        toolkit 已将其清理时，提交接口返回 409 并补传。
+        """
+        if not backend.dataset_client.supports_blobs:
+            return None
+        hashes = {f.sha256 for f in dataset}
+        unknown = hashes - await known_blobs(backend.url, hashes)
+        if not unknown:
+            return set()
+        return await backend.dataset_client.missing(self.session, list(unknown))
+
+    async def _active_tasks(self):
+        """各训练节点上尚未完成的任务数，未记录节点的任务计入默认节点"""
+        counts = {}
+        for url, count in (await count_active_tasks([TaskStatus.PENDING, TaskStatus.TRAINING])).items():
+            url = self.toolkits.get(url).url
+            counts[url] = counts.get(url, 0) + count
+        return counts
+
+    async def _put_job(self, toolkit_url, config_name, yaml_content, dataset):
+        """通过 /put_jobs/ 整体上传配置和所有文件（旧版 toolkit）
+
+        Returns:
+            (HTTP 状态码, 响应文本)
+        """
+        fields = [('files', yaml_content, config_name, 'text/yaml')]
+        fields += [('files', iter_file_chunks(f.path), f.name, f.content_type) for f in dataset]
+        async with post_multipart(self.session, f"{toolkit_url}/put_jobs/", fields) as response:
+            return response.status, await response.text()
 
     @staticmethod
     def _update_yaml(args, defaults, config):
@@ -125,20 +256,3 @@ class TrainingManager:
         config["config"]["process"][0]["train"].update(options["train"])
         config["config"]["process"][0]["save"].update(options["save"])
         return config
-
-    @staticmethod
-    async def _create_task(job_name, config):
-        """创建任务记录"""
-        db = next(get_db())
-        try:
-            task = Task(
-                name=job_name,
-                status=TaskStatus.PENDING,
-                config=config
-            )
-            db.add(task)
-            db.commit()
-            db.refresh(task)
-            return f"任务 {job_name} 已成功提交，任务 ID: {task.id}"
-        finally:
-            db.close() 
\ No newline at end of file
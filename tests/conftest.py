@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# lora_store 在导入时读取 LORA_DIR，测试使用独立的临时目录
+os.environ.setdefault("LORA_DIR", tempfile.mkdtemp(prefix="lora-test-"))
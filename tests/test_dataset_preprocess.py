@@ -0,0 +1,89 @@
+import asyncio
+import os
+
+import pytest
+from PIL import Image
+
+from services.dataset_cache import DatasetFile, duplicate_names
+from services.dataset_preprocess import DatasetError, file_digest, preprocess_image, preprocess_images
+
+
+def make_image(path, color, size=(64, 48), image_format=None):
+    Image.new("RGB", size, color).save(str(path), image_format)
+    return str(path)
+
+
+@pytest.fixture
+def output_dir(tmp_path):
+    path = tmp_path / "out"
+    path.mkdir()
+    return str(path)
+
+
+def test_small_image_with_matching_extension_is_used_as_is(tmp_path, output_dir):
+    source = make_image(tmp_path / "a.JPG", "red", image_format="JPEG")
+
+    path, name, mime_type, sha256, size = preprocess_image(source, output_dir, max_size=128)
+
+    assert (path, name, mime_type) == (source, "a.JPG", "image/jpeg")
+    assert (sha256, size) == file_digest(source)
+
+
+def test_wrong_extension_is_renamed_to_actual_format(tmp_path, output_dir):
+    source = make_image(tmp_path / "c.png", "red", image_format="JPEG")
+
+    path, name, mime_type, _, _ = preprocess_image(source, output_dir, max_size=128)
+
+    assert name == "c.jpg" and mime_type == "image/jpeg"
+    assert path.startswith(output_dir) and os.path.basename(path) == "c.jpg"
+
+
+@pytest.mark.parametrize("first, second, image_format", [
+    ("c.png", "c.jpg", "JPEG"),
+    ("a.JPG", "a.jpeg", "JPEG"),
+])
+def test_colliding_names_do_not_overwrite_each_other(tmp_path, output_dir, first, second, image_format):
+    (tmp_path / "1").mkdir()
+    (tmp_path / "2").mkdir()
+    # 超过 max_size，两张图片都会重新编码为 <主干>.jpg
+    sources = [
+        make_image(tmp_path / "1" / first, "red", size=(256, 256), image_format=image_format),
+        make_image(tmp_path / "2" / second, "blue", size=(256, 256), image_format=image_format),
+    ]
+
+    results = [preprocess_image(source, output_dir, max_size=32) for source in sources]
+
+    (path1, name1, _, sha1, size1), (path2, name2, _, sha2, size2) = results
+    assert name1 == name2
+    assert path1 != path2
+    assert sha1 != sha2
+    assert file_digest(path1) == (sha1, size1)
+    assert file_digest(path2) == (sha2, size2)
+    with Image.open(path1) as image:
+        assert image.getpixel((0, 0))[0] > 200
+    dataset = [DatasetFile(name, path, mime_type, sha256, size) for path, name, mime_type, sha256, size in results]
+    assert duplicate_names(dataset) == [name1]
+
+
+def test_preprocess_images_in_pool(tmp_path, output_dir):
+    sources = [
+        make_image(tmp_path / "x.png", "red", size=(256, 256), image_format="JPEG"),
+        make_image(tmp_path / "x.jpg", "blue", size=(256, 256), image_format="JPEG"),
+        make_image(tmp_path / "y.png", "green", image_format="PNG"),
+    ]
+
+    results = asyncio.run(preprocess_images(sources, output_dir, max_size=32))
+
+    assert [name for _, name, _, _, _ in results] == ["x.jpg", "x.jpg", "y.png"]
+    assert len({path for path, _, _, _, _ in results}) == 3
+    for path, _, _, sha256, size in results:
+        assert file_digest(path) == (sha256, size)
+
+
+def test_unreadable_image_raises_dataset_error(tmp_path, output_dir):
+    broken = tmp_path / "broken.jpg"
+    broken.write_bytes(b"not an image")
+
+    with pytest.raises(DatasetError) as error:
+        asyncio.run(preprocess_images([str(broken)], output_dir))
+    assert error.value.errors[0][0] == str(broken)
@@ -0,0 +1,82 @@
+import io
+import os
+import shutil
+import zipfile
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+import get_files
+
+
+class FakeResponse:
+    """不带 ETag 的 /get_zip/ 响应，toolkit 忽略条件请求时每次都返回完整内容"""
+    def __init__(self, body):
+        self.status_code = 200
+        self.headers = {"Content-Length": str(len(body))}
+        self._body = body
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self._body), chunk_size):
+            yield self._body[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class FakeSession:
+    def __init__(self, job_name):
+        self.job_name = job_name
+
+    def execute(self, statement, params=None):
+        return SimpleNamespace(
+            first=lambda: SimpleNamespace(name=self.job_name, toolkit_url=None),
+            all=lambda: []
+        )
+
+    def commit(self):
+        pass
+
+
+class FakeEngines:
+    def __init__(self, job_name):
+        self.job_name = job_name
+
+    @contextmanager
+    def session(self, database_url):
+        yield FakeSession(self.job_name)
+
+
+@pytest.fixture
+def lora_dir():
+    shutil.rmtree(get_files.LORA_DIR, ignore_errors=True)
+    os.makedirs(get_files.LORA_DIR)
+    yield get_files.LORA_DIR
+    shutil.rmtree(get_files.LORA_DIR, ignore_errors=True)
+
+
+def test_repeat_download_keeps_disk_usage(lora_dir, monkeypatch):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zip_ref:
+        zip_ref.writestr("lora.safetensors", b"W" * 1000)
+        zip_ref.writestr("config.yaml", b"steps: 10\n")
+    body = buffer.getvalue()
+
+    monkeypatch.setattr(get_files, "engines", FakeEngines("job1"))
+    monkeypatch.setattr(get_files, "sync_request", lambda *args, **kwargs: FakeResponse(body))
+
+    assert get_files.process_file_job("postgresql://test", 1, "http://toolkit")
+    usage = get_files.store.disk_usage()
+    assert get_files.process_file_job("postgresql://test", 1, "http://toolkit")
+
+    assert usage == 1010
+    assert get_files.store.disk_usage() == usage
+    assert not os.path.exists(os.path.join(lora_dir, "job1.zip"))
+    assert get_files.store.is_materialized("job1")
@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+import http_client
+from http_client import BackendUnavailable, CircuitBreaker, RetryBudget, request
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open and not breaker.allow()
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert not breaker.is_open
+
+
+def test_half_open_allows_a_single_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert not breaker.is_open and breaker.allow()
+
+
+def test_failed_trial_reopens_and_released_trial_frees_the_slot():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open and breaker.allow()
+
+
+def test_retry_budget_limits_retries():
+    budget = RetryBudget(ratio=0.5, minimum=2)
+    assert budget.withdraw() and budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    budget.deposit()
+    assert budget.withdraw()
+
+
+class FakeResponse:
+    def __init__(self, status):
+        self.status = status
+
+    def release(self):
+        pass
+
+
+class FakeSession:
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.calls = 0
+
+    async def request(self, method, url, **kwargs):
+        self.calls += 1
+        return FakeResponse(self.statuses.pop(0))
+
+
+@pytest.fixture(autouse=True)
+def isolated_breakers(monkeypatch):
+    monkeypatch.setattr(http_client, "_breakers", {})
+    monkeypatch.setattr(http_client, "retry_budget", RetryBudget())
+    monkeypatch.setattr(http_client, "backoff_delay", lambda attempt: 0)
+
+
+def fetch(session, **kwargs):
+    async def scenario():
+        async with request(session, "GET", "http://backend/x", **kwargs) as response:
+            return response.status
+    return asyncio.run(scenario())
+
+
+def test_request_retries_unavailable_statuses():
+    session = FakeSession([503, 502, 200])
+
+    assert fetch(session) == 200
+    assert session.calls == 3
+    assert not http_client.breaker_for("http://backend/").is_open
+
+
+def test_request_without_retry_raises_backend_unavailable():
+    session = FakeSession([503])
+
+    with pytest.raises(BackendUnavailable):
+        fetch(session, retry=False)
+    assert session.calls == 1
+
+
+def test_excluded_status_is_returned_without_counting_as_failure():
+    session = FakeSession([503] * 10)
+
+    for _ in range(http_client.BREAKER_FAILURE_THRESHOLD + 1):
+        assert fetch(session, retry_statuses={502, 504}) == 503
+    assert not http_client.breaker_for("http://backend/").is_open
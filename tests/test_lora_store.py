@@ -0,0 +1,115 @@
+import os
+import zipfile
+
+import pytest
+
+from lora_store import LoraStore, load_manifest, save_manifest
+
+
+def make_zip(path, members):
+    with zipfile.ZipFile(path, "w") as zip_ref:
+        for name, data in members.items():
+            zip_ref.writestr(name, data)
+    return path
+
+
+def add_job(store, job_name, members, tmp_path):
+    """按 process_file_job 的方式写入一个任务"""
+    zip_path = make_zip(str(tmp_path / f"{job_name}-src.zip"), members)
+    with store.pinned(job_name):
+        files = store.ingest_archive(zip_path, job_name)
+        store.materialize(job_name, files)
+        save_manifest(job_name, {"files": files, "archive": False, "extracted": True, "evicted": False},
+                      store.root)
+    return files
+
+
+@pytest.fixture
+def store(tmp_path):
+    root = tmp_path / "loras"
+    root.mkdir()
+    return LoraStore(str(root), buffer_size=7)
+
+
+def test_ingest_twice_stores_content_once(store, tmp_path):
+    members = {"a.safetensors": b"A" * 100, "sub/b.txt": b"B" * 50}
+    add_job(store, "job1", members, tmp_path)
+    usage = store.disk_usage()
+    add_job(store, "job1", members, tmp_path)
+    add_job(store, "job2", members, tmp_path)
+
+    assert usage == 150
+    assert store.disk_usage() == usage
+    with open(os.path.join(store.job_dir("job2"), "sub", "b.txt"), "rb") as f:
+        assert f.read() == b"B" * 50
+
+
+def test_duplicate_members_share_one_blob(store, tmp_path):
+    files = add_job(store, "job1", {"x.bin": b"same", "y.bin": b"same"}, tmp_path)
+
+    assert files["x.bin"]["sha256"] == files["y.bin"]["sha256"]
+    assert store.disk_usage() == 4
+
+
+def test_evict_under_budget_stops_when_enough_freed(store, tmp_path):
+    add_job(store, "old", {"m.bin": b"1" * 100}, tmp_path)
+    add_job(store, "mid", {"m.bin": b"2" * 100}, tmp_path)
+    add_job(store, "new", {"m.bin": b"3" * 100}, tmp_path)
+
+    evicted = store.evict(["old", "mid", "new"], bytes_needed=50)
+
+    assert evicted == [("old", 100)]
+    assert store.disk_usage() == 200
+    assert load_manifest("old", store.root)["evicted"]
+    assert not store.is_materialized("old")
+    assert store.is_materialized("mid") and store.is_materialized("new")
+
+
+def test_shared_blobs_survive_eviction(store, tmp_path):
+    add_job(store, "job1", {"shared.bin": b"S" * 80, "own.bin": b"1" * 10}, tmp_path)
+    add_job(store, "job2", {"shared.bin": b"S" * 80, "own.bin": b"2" * 10}, tmp_path)
+
+    evicted = store.evict(["job1"])
+
+    assert evicted == [("job1", 10)]
+    assert store.disk_usage() == 90
+    with open(os.path.join(store.job_dir("job2"), "shared.bin"), "rb") as f:
+        assert f.read() == b"S" * 80
+
+
+def test_evict_skips_jobs_whose_files_are_all_shared(store, tmp_path):
+    add_job(store, "job1", {"shared.bin": b"S" * 80}, tmp_path)
+    add_job(store, "job2", {"shared.bin": b"S" * 80}, tmp_path)
+
+    assert store.evict(["job1", "job2"], bytes_needed=10) == []
+    assert store.is_materialized("job1") and store.is_materialized("job2")
+
+
+def test_pinned_job_and_its_new_blobs_survive_eviction(store, tmp_path):
+    add_job(store, "old", {"m.bin": b"O" * 100}, tmp_path)
+    zip_path = make_zip(str(tmp_path / "new-src.zip"), {"m.bin": b"O" * 100})
+
+    with store.pinned("new"):
+        files = store.ingest_archive(zip_path, "new")
+        # 另一个作业在清单写入前淘汰了共享该 blob 的旧任务
+        assert store.evict(["old", "new"]) == [("old", 0)]
+        store.materialize("new", files)
+
+    with open(os.path.join(store.job_dir("new"), "m.bin"), "rb") as f:
+        assert f.read() == b"O" * 100
+
+
+def test_evict_removes_leftover_archive(store, tmp_path):
+    add_job(store, "job1", {"m.bin": b"1" * 100}, tmp_path)
+    make_zip(store.archive_path("job1"), {"m.bin": b"1" * 100})
+
+    store.evict(["job1"])
+
+    assert not os.path.exists(store.archive_path("job1"))
+    assert store.disk_usage() == 0
+
+
+def test_materialize_missing_blob_raises(store):
+    with pytest.raises(FileNotFoundError):
+        store.materialize("job1", {"m.bin": {"sha256": "0" * 64, "size": 1}})
+    assert not os.path.exists(store.job_dir("job1"))
@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from services.submission_scheduler import SubmissionRejected, SubmissionScheduler
+
+
+def run(coroutine_function):
+    """调度器使用事件循环的 Future，在事件循环中运行测试"""
+    return asyncio.run(coroutine_function())
+
+
+def granted(tickets):
+    return [ticket.granted.done() and not ticket.granted.cancelled() for ticket in tickets]
+
+
+def test_free_slots_are_granted_immediately():
+    async def scenario():
+        scheduler = SubmissionScheduler(slots=2, max_queued=10, max_queued_per_user=5)
+        tickets = [scheduler.enqueue("a"), scheduler.enqueue("b"), scheduler.enqueue("c")]
+        assert granted(tickets) == [True, True, False]
+        assert scheduler.queued == 1
+        assert await scheduler.wait(tickets[0], timeout=0.01)
+        assert not await scheduler.wait(tickets[2], timeout=0.01)
+    run(scenario)
+
+
+def test_users_take_turns_for_slots():
+    async def scenario():
+        scheduler = SubmissionScheduler(slots=1, max_queued=10, max_queued_per_user=5)
+        a1, a2, a3 = scheduler.enqueue("a"), scheduler.enqueue("a"), scheduler.enqueue("a")
+        b1 = scheduler.enqueue("b")
+        c1 = scheduler.enqueue("c")
+
+        # b 和 c 还没有获得过槽位，排在 a 的后续提交之前
+        assert [scheduler.position(t) for t in (a2, a3, b1, c1)] == [2, 3, 0, 1]
+
+        order = []
+        running = a1
+        for _ in range(4):
+            scheduler.release(running)
+            running = next(t for t in (a2, a3, b1, c1) if t not in order and t.granted.done())
+            order.append(running)
+        assert order == [b1, c1, a2, a3]
+    run(scenario)
+
+
+def test_user_returning_after_idle_does_not_jump_ahead_of_waiting_users():
+    async def scenario():
+        scheduler = SubmissionScheduler(slots=1, max_queued=10, max_queued_per_user=5)
+        a1 = scheduler.enqueue("a")
+        b1 = scheduler.enqueue("b")
+        a2 = scheduler.enqueue("a")
+        scheduler.release(a1)
+        assert granted([b1, a2]) == [True, False]
+        c1 = scheduler.enqueue("c")
+        # c 从未获得槽位，先于 a 的第二个提交
+        scheduler.release(b1)
+        assert granted([c1, a2]) == [True, False]
+    run(scenario)
+
+
+def test_per_user_queue_limit():
+    async def scenario():
+        scheduler = SubmissionScheduler(slots=1, max_queued=10, max_queued_per_user=2)
+        scheduler.enqueue("a")      # 立即获得槽位，不计入排队数
+        scheduler.enqueue("a")
+        scheduler.enqueue("a")
+        with pytest.raises(SubmissionRejected):
+            scheduler.enqueue("a")
+        # 其他用户不受影响
+        scheduler.enqueue("b")
+        assert scheduler.queued == 3
+    run(scenario)
+
+
+def test_total_queue_limit():
+    async def scenario():
+        scheduler = SubmissionScheduler(slots=1, max_queued=2, max_queued_per_user=5)
+        scheduler.enqueue("a")
+        scheduler.enqueue("b")
+        scheduler.enqueue("c")
+        with pytest.raises(SubmissionRejected):
+            scheduler.enqueue("d")
+    run(scenario)
+
+
+def test_abandoned_ticket_leaves_the_queue():
+    async def scenario():
+        scheduler = SubmissionScheduler(slots=1, max_queued=10, max_queued_per_user=5)
+        a1 = scheduler.enqueue("a")
+        b1 = scheduler.enqueue("b")
+        c1 = scheduler.enqueue("c")
+
+        scheduler.release(b1)
+        assert b1.granted.cancelled()
+        assert scheduler.queued == 1
+        assert scheduler.position(c1) == 0
+
+        scheduler.release(a1)
+        assert granted([c1]) == [True]
+    run(scenario)
+
+
+def test_estimated_wait_uses_average_duration():
+    async def scenario():
+        scheduler = SubmissionScheduler(slots=1, max_queued=10, max_queued_per_user=5)
+        a1 = scheduler.enqueue("a")
+        b1 = scheduler.enqueue("b")
+        assert scheduler.estimated_wait(a1) == 0.0
+        assert scheduler.estimated_wait(b1) is None
+
+        scheduler.release(a1)
+        c1 = scheduler.enqueue("c")
+        # 平均占用时长约为 0，c 前面只有 b 在运行
+        assert scheduler.estimated_wait(c1) == pytest.approx(0.0, abs=0.1)
+    run(scenario)
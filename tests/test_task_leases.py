@@ -0,0 +1,138 @@
+"""监控任务租约的 SQL（SKIP LOCKED 认领、续期、释放、批量写回），需要 PostgreSQL
+
+设置 TEST_DATABASE_URL 后运行，测试在临时 schema 中建表，结束后删除。
+"""
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, insert, select, text
+
+from pg_db import (
+    Base, Task, TaskStatus, claim_tasks_statement, poll_results_statement, release_leases_statement,
+    renew_leases_statement
+)
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="未设置 TEST_DATABASE_URL")
+
+ACTIVE = [TaskStatus.PENDING, TaskStatus.TRAINING]
+
+
+@pytest.fixture
+def engine():
+    schema = f"test_{uuid.uuid4().hex[:8]}"
+    admin = create_engine(TEST_DATABASE_URL)
+    with admin.begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA {schema}"))
+    engine = create_engine(TEST_DATABASE_URL, connect_args={"options": f"-csearch_path={schema}"})
+    Base.metadata.create_all(engine)
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+        with admin.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+        admin.dispose()
+
+
+def add_tasks(engine, count, status=TaskStatus.PENDING, next_poll_in=None):
+    now = datetime.utcnow()
+    rows = [{
+        "name": f"job-{uuid.uuid4().hex[:8]}",
+        "status": status,
+        "config": {},
+        "created_at": now,
+        "updated_at": now,
+        "next_poll_at": None if next_poll_in is None else now + timedelta(seconds=next_poll_in),
+    } for _ in range(count)]
+    with engine.begin() as conn:
+        return [row.id for row in conn.execute(insert(Task).returning(Task.id), rows)]
+
+
+def claim(conn, owner, limit=10, lease_seconds=60, statuses=ACTIVE):
+    return {row.id for row in conn.execute(claim_tasks_statement(owner, statuses, limit, lease_seconds, 10))}
+
+
+def test_owners_claim_disjoint_tasks(engine):
+    ids = add_tasks(engine, 3)
+
+    with engine.begin() as conn:
+        first = claim(conn, "a", limit=2)
+    with engine.begin() as conn:
+        second = claim(conn, "b")
+        assert claim(conn, "c") == set()
+
+    assert len(first) == 2
+    assert first | second == set(ids) and not first & second
+
+
+def test_claim_skips_rows_locked_by_an_uncommitted_claim(engine):
+    ids = add_tasks(engine, 4)
+
+    with engine.connect() as first, engine.connect() as second:
+        claimed_first = claim(first, "a", limit=2)
+        # 第一个事务尚未提交，第二个认领跳过被锁定的行而不是等待
+        second.execute(text("SET LOCAL lock_timeout = '2s'"))
+        claimed_second = claim(second, "b")
+        first.commit()
+        second.commit()
+
+    assert claimed_first | claimed_second == set(ids)
+    assert not claimed_first & claimed_second
+
+
+def test_claim_only_due_tasks_in_requested_statuses(engine):
+    due = add_tasks(engine, 1)
+    add_tasks(engine, 1, next_poll_in=3600)
+    add_tasks(engine, 1, status=TaskStatus.COMPLETED)
+
+    with engine.begin() as conn:
+        assert claim(conn, "a") == set(due)
+
+
+def test_expired_lease_is_taken_over_and_renew_reports_loss(engine):
+    ids = add_tasks(engine, 2)
+    with engine.begin() as conn:
+        assert claim(conn, "a", lease_seconds=-1) == set(ids)
+    with engine.begin() as conn:
+        assert claim(conn, "b") == set(ids)
+    with engine.begin() as conn:
+        renewed_a = {row.id for row in conn.execute(renew_leases_statement("a", ids, 60))}
+        renewed_b = {row.id for row in conn.execute(renew_leases_statement("b", ids, 60))}
+
+    assert renewed_a == set()
+    assert renewed_b == set(ids)
+
+
+def test_released_tasks_can_be_claimed_again(engine):
+    ids = add_tasks(engine, 2)
+    with engine.begin() as conn:
+        claim(conn, "a")
+        conn.execute(release_leases_statement("a", ids[:1]))
+    with engine.begin() as conn:
+        assert claim(conn, "b") == {ids[0]}
+
+
+def test_poll_results_apply_only_to_held_leases_with_unchanged_status(engine):
+    held, changed, foreign = add_tasks(engine, 3)
+    with engine.begin() as conn:
+        claim(conn, "a")
+        # 其他流程已修改 changed 的状态，foreign 的租约已被他人接管
+        conn.execute(Task.__table__.update().where(Task.id == changed).values(status=TaskStatus.FAILED))
+        conn.execute(Task.__table__.update().where(Task.id == foreign).values(lease_owner="b"))
+
+    results = [
+        (task_id, TaskStatus.PENDING, TaskStatus.TRAINING, 30.0, False)
+        for task_id in (held, changed, foreign)
+    ]
+    with engine.begin() as conn:
+        applied = {row.id: row.changed for row in conn.execute(poll_results_statement("a", results))}
+        row = conn.execute(
+            select(Task.status, Task.lease_owner, Task.poll_interval).where(Task.id == held)
+        ).one()
+
+    assert applied == {held: True}
+    assert row == (TaskStatus.TRAINING, None, 30.0)
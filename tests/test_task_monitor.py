@@ -0,0 +1,132 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from config import Config
+from pg_db import TaskStatus
+from services import task_monitor
+from services.task_monitor import TaskMonitor, _TrackedTask
+
+
+def make_state(task_id, status, name=None, age=0.0):
+    created_at = datetime.utcnow() - timedelta(seconds=age)
+    return _TrackedTask(task_id, name or f"job{task_id}", "http://toolkit", status, created_at)
+
+
+@pytest.fixture
+def monitor():
+    return TaskMonitor()
+
+
+def test_poll_interval_backs_off_and_caps(monitor):
+    initial, maximum = Config.MONITOR_POLL_INTERVALS["pending"]
+    state = make_state(1, TaskStatus.PENDING)
+
+    intervals = []
+    for _ in range(10):
+        state.interval = monitor._poll_interval(state, status_changed=False)
+        intervals.append(state.interval)
+
+    assert intervals[0] == initial
+    assert intervals[1] == initial * Config.MONITOR_BACKOFF_FACTOR
+    assert intervals == sorted(intervals)
+    assert intervals[-1] == maximum
+
+
+def test_poll_interval_resets_when_status_changes(monitor):
+    state = make_state(1, TaskStatus.TRAINING)
+    state.interval = 100.0
+
+    assert monitor._poll_interval(state, status_changed=True) == Config.MONITOR_POLL_INTERVALS["training"][0]
+
+
+def test_poll_interval_speeds_up_near_expected_duration(monitor):
+    monitor._expected_duration = 100.0
+    state = make_state(1, TaskStatus.TRAINING, age=90)
+    state.interval = 100.0
+
+    assert monitor._poll_interval(state, status_changed=False) == Config.MONITOR_NEAR_DONE_INTERVAL
+
+
+def test_schedule_orders_tasks_by_deadline(monitor):
+    async def scenario():
+        monitor._wakeup = asyncio.Event()
+        states = [make_state(task_id, TaskStatus.PENDING) for task_id in (1, 2, 3)]
+        for state, delay in zip(states, (30, 10, 20)):
+            monitor._schedule(state, delay)
+        # 重新调度后，旧的队列项因到期时间不一致而被跳过
+        monitor._schedule(states[0], 5)
+
+        current = [task_id for deadline, _, task_id in sorted(monitor._queue)
+                   if {s.task_id: s for s in states}[task_id].deadline == deadline]
+        assert current == [1, 2, 3]
+        assert monitor._wakeup.is_set()
+    asyncio.run(scenario())
+
+
+class BatchHarness:
+    """替换状态查询、get_files 通知和写回，记录 _run_batch 写回的结果"""
+    def __init__(self, monitor, monkeypatch, probed=None, accepted=True):
+        self.results = []
+        self.dispatched = []
+
+        async def probe_batch(batch, semaphore):
+            return [probed.get(state.task_id) for state in batch]
+
+        async def dispatch_get_file(task_id, toolkit_url):
+            self.dispatched.append(task_id)
+            return accepted
+
+        async def apply_poll_results(owner, results):
+            self.results.extend(results)
+            return {result[0] for result in results}
+
+        monkeypatch.setattr(monitor, "_probe_batch", probe_batch)
+        monkeypatch.setattr(monitor, "_dispatch_get_file", dispatch_get_file)
+        monkeypatch.setattr(task_monitor, "apply_poll_results", apply_poll_results)
+
+    def run(self, monitor, states):
+        async def scenario():
+            monitor._wakeup = asyncio.Event()
+            for state in states:
+                monitor._tracked[state.task_id] = state
+                state.in_flight = True
+            await monitor._run_batch(states, asyncio.Semaphore(10))
+        asyncio.run(scenario())
+
+
+def test_finished_training_is_dispatched_by_the_next_batch(monitor, monkeypatch):
+    state = make_state(1, TaskStatus.TRAINING)
+    harness = BatchHarness(monitor, monkeypatch, probed={1: TaskStatus.RUN_BEFORE})
+
+    harness.run(monitor, [state])
+
+    # 状态提交后继续持有租约并立即到期，不在同一批中通知 get_files
+    assert harness.results == [(1, TaskStatus.TRAINING, TaskStatus.RUN_BEFORE, 0.0, True)]
+    assert harness.dispatched == []
+    assert 1 in monitor._tracked
+
+
+def test_rejected_dispatch_is_retried_with_back_off(monitor, monkeypatch):
+    state = make_state(1, TaskStatus.RUN_BEFORE)
+    harness = BatchHarness(monitor, monkeypatch, accepted=False)
+
+    harness.run(monitor, [state])
+
+    initial, _ = Config.MONITOR_POLL_INTERVALS["run_before"]
+    assert harness.dispatched == [1]
+    assert harness.results == [(1, TaskStatus.RUN_BEFORE, TaskStatus.RUN_BEFORE, initial, True)]
+
+
+def test_accepted_dispatch_is_rechecked_later(monitor, monkeypatch):
+    probing = make_state(1, TaskStatus.PENDING)
+    dispatching = make_state(2, TaskStatus.RUN_BEFORE)
+    harness = BatchHarness(monitor, monkeypatch, probed={1: TaskStatus.PENDING})
+
+    harness.run(monitor, [dispatching, probing])
+
+    assert harness.dispatched == [2]
+    recheck = Config.MONITOR_DISPATCH_RECHECK
+    assert (2, TaskStatus.RUN_BEFORE, TaskStatus.RUN_BEFORE, recheck, False) in harness.results
+    assert 2 not in monitor._tracked
@@ -0,0 +1,51 @@
+import asyncio
+
+from services.toolkit_protocol import missing_files, retry_on_missing
+
+
+def run_submissions(responses, missing=None):
+    calls = []
+
+    async def submit(missing):
+        calls.append(missing)
+        return responses[len(calls) - 1]
+
+    return asyncio.run(retry_on_missing(submit, missing)), calls
+
+
+def test_missing_files_parses_conflict_body():
+    assert missing_files('{"missing": ["a", "b"]}') == {"a", "b"}
+    assert missing_files('{}') == set()
+
+
+def test_missing_files_rejects_unexpected_body():
+    assert missing_files("<html>409 Conflict</html>") is None
+    assert missing_files('["a"]') is None
+    assert missing_files('{"missing": 1}') is None
+
+
+def test_retry_once_with_missing_files():
+    result, calls = run_submissions([(409, '{"missing": ["a"]}'), (200, "ok")])
+
+    assert result == (200, "ok")
+    assert calls == [None, {"a"}]
+
+
+def test_second_conflict_is_returned():
+    result, calls = run_submissions([(409, '{"missing": ["a"]}'), (409, '{"missing": ["b"]}')], missing={"x"})
+
+    assert result == (409, '{"missing": ["b"]}')
+    assert calls == [{"x"}, {"a"}]
+
+
+def test_non_json_conflict_is_returned_unchanged():
+    result, calls = run_submissions([(409, "Conflict")])
+
+    assert result == (409, "Conflict")
+    assert calls == [None]
+
+
+def test_abandoned_submission_returns_none():
+    result, calls = run_submissions([None])
+
+    assert result is None and calls == [None]
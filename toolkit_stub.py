@@ -0,0 +1,340 @@
+"""
+@Project : ComfyUI
+@File : toolkit_stub.py
+
+本地替身 toolkit，用于在没有训练机的环境中联调提交、监控与下载流程：
+    POST /put_jobs/            multipart 整体上传（旧协议）
+    POST /blobs/missing        查询缺少的文件摘要
+    POST /blobs/               按 SHA-256 上传文件
+    POST /put_jobs_by_hash/    按文件摘要提交任务
+    POST /put_jobs_bundle/     单个 tar / tar.zst 数据流提交任务（清单 + 配置 + 文件，边接收边解包）
+    POST /status               批量查询任务状态
+    GET  /capacity             可同时训练的任务数与当前训练中、排队的任务数
+    POST /get_zip/             训练完成返回结果压缩包（支持 ETag / Range），否则返回 201
+
+任务提交后经过 STUB_TRAIN_SECONDS 秒视为训练完成。多节点联调时在不同端口、不同数据目录各启动一个：
+
+    python toolkit_stub.py --port 7860
+    STUB_DATA_DIR=toolkit_stub_data_2 python toolkit_stub.py --port 7862
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+import zipfile
+
+import yaml
+from aiohttp import web
+
+try:
+    import zstandard
+except ImportError:  # 不安装时不接受 tar.zst
+    zstandard = None
+
+# 数据目录与模拟训练时长（秒）
+STUB_DATA_DIR = os.getenv("STUB_DATA_DIR", "toolkit_stub_data")
+STUB_TRAIN_SECONDS = float(os.getenv("STUB_TRAIN_SECONDS", 30))
+STUB_SLOTS = int(os.getenv("STUB_SLOTS", 1))  # 上报的可同时训练任务数
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _blob_path(sha256: str) -> str:
+    return os.path.join(STUB_DATA_DIR, "blobs", sha256[:2], sha256)
+
+
+def _job_dir(job_name: str) -> str:
+    return os.path.join(STUB_DATA_DIR, "jobs", job_name)
+
+
+def _valid_name(name: str) -> bool:
+    return bool(name) and name == os.path.basename(name) and name not in ('.', '..')
+
+
+async def _save_part(part, target_path: str) -> str:
+    """将 multipart 的一个部分流式写入文件，返回内容的 SHA-256"""
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target_path))
+    with os.fdopen(fd, 'wb') as f:
+        while True:
+            chunk = await part.read_chunk(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            f.write(chunk)
+    os.replace(tmp_path, target_path)
+    return digest.hexdigest()
+
+
+def _store_blob(source, sha256_expected: str = None) -> str:
+    """将文件对象的内容写入 blob 存储，返回内容的 SHA-256；与预期摘要不一致时丢弃并抛出 ValueError"""
+    staging_dir = os.path.join(STUB_DATA_DIR, "blobs", "tmp")
+    os.makedirs(staging_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=staging_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                f.write(chunk)
+        sha256 = digest.hexdigest()
+        if sha256_expected is not None and sha256 != sha256_expected:
+            raise ValueError(f"checksum mismatch: expected {sha256_expected}, got {sha256}")
+        os.makedirs(os.path.dirname(_blob_path(sha256)), exist_ok=True)
+        os.replace(tmp_path, _blob_path(sha256))
+        return sha256
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class _PartReader:
+    """把 multipart 部分包装成同步文件对象，供工作线程中的 tarfile 流式读取"""
+    def __init__(self, part, loop):
+        self.part = part
+        self.loop = loop
+        self.buffer = b''
+        self.eof = False
+
+    def read(self, size: int = -1) -> bytes:
+        while not self.eof and (size < 0 or len(self.buffer) < size):
+            chunk = asyncio.run_coroutine_threadsafe(self.part.read_chunk(CHUNK_SIZE), self.loop).result()
+            if not chunk:
+                self.eof = True
+            self.buffer += chunk
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def _unpack_bundle(fileobj, compressed: bool):
+    """一次读完 tar 数据流：清单、配置，其余成员按清单校验后写入 blob 存储
+
+    Returns:
+        (清单, 配置文本, 清单中 blob 存储仍缺少的摘要)
+    """
+    if compressed:
+        fileobj = zstandard.ZstdDecompressor().stream_reader(fileobj)
+    manifest, config, by_name = None, None, {}
+    with tarfile.open(fileobj=fileobj, mode="r|") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            data = tar.extractfile(member)
+            if manifest is None:
+                if member.name != "manifest.json":
+                    raise ValueError("manifest.json must be the first member")
+                manifest = json.load(data)
+                by_name = {f["name"]: f for f in manifest.get("files", [])}
+            elif config is None:
+                if member.name != manifest.get("config"):
+                    raise ValueError("config must follow manifest.json")
+                config = data.read().decode('utf-8')
+            elif member.name in by_name:
+                _store_blob(data, by_name[member.name]["sha256"])
+            else:
+                raise ValueError(f"{member.name} is not listed in manifest")
+    if manifest is None or config is None:
+        raise ValueError("missing manifest or config")
+    missing = sorted({f["sha256"] for f in by_name.values() if not os.path.exists(_blob_path(f["sha256"]))})
+    return manifest, config, missing
+
+
+def _register_job(job_name: str, config_name: str, config: str, files) -> None:
+    """记录任务并写入配置，开始模拟训练"""
+    job_dir = _job_dir(job_name)
+    os.makedirs(job_dir, exist_ok=True)
+    with open(os.path.join(job_dir, config_name), 'w', encoding='utf-8') as f:
+        f.write(config)
+    with open(os.path.join(job_dir, "job.json"), 'w', encoding='utf-8') as f:
+        json.dump({"job_name": job_name, "files": files, "submitted_at": time.time()}, f)
+
+
+def _load_job(job_name: str):
+    try:
+        with open(os.path.join(_job_dir(job_name), "job.json"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _job_status(job_name: str) -> str:
+    job = _load_job(job_name) if _valid_name(job_name) else None
+    if job is None:
+        return "failed"
+    return "done" if time.time() - job["submitted_at"] >= STUB_TRAIN_SECONDS else "training"
+
+
+def _result_archive(job_name: str) -> str:
+    """生成（一次）训练结果压缩包：一个模拟的 LoRA 权重文件和训练配置"""
+    zip_path = os.path.join(_job_dir(job_name), "output.zip")
+    if not os.path.exists(zip_path):
+        tmp_path = zip_path + ".tmp"
+        weights = hashlib.sha256(job_name.encode('utf-8')).digest() * 4096
+        with zipfile.ZipFile(tmp_path, 'w') as zip_ref:
+            zip_ref.writestr(f"{job_name}/{job_name}.safetensors", weights, compress_type=zipfile.ZIP_STORED)
+            for name in os.listdir(_job_dir(job_name)):
+                if name.endswith(('.yaml', '.yml')):
+                    zip_ref.write(os.path.join(_job_dir(job_name), name), f"{job_name}/{name}")
+        os.replace(tmp_path, zip_path)
+    return zip_path
+
+
+async def put_jobs(request: web.Request) -> web.Response:
+    """旧协议：配置与数据集文件在一个 multipart 请求中整体上传"""
+    reader = await request.multipart()
+    staging_dir = tempfile.mkdtemp(dir=STUB_DATA_DIR)
+    try:
+        config_name, config, files = None, None, []
+        while True:
+            part = await reader.next()
+            if part is None:
+                break
+            if not _valid_name(part.filename):
+                raise web.HTTPBadRequest(text=f"invalid filename: {part.filename}")
+            target_path = os.path.join(staging_dir, part.filename)
+            sha256 = await _save_part(part, target_path)
+            if part.filename.endswith(('.yaml', '.yml')):
+                config_name = part.filename
+                with open(target_path, 'r', encoding='utf-8') as f:
+                    config = f.read()
+            else:
+                blob = _blob_path(sha256)
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                os.replace(target_path, blob)
+                files.append({"name": part.filename, "sha256": sha256})
+
+        if config is None:
+            raise web.HTTPBadRequest(text="missing yaml config")
+        job_name = yaml.safe_load(config)["config"]["name"]
+        if not _valid_name(job_name):
+            raise web.HTTPBadRequest(text=f"invalid job name: {job_name}")
+        _register_job(job_name, config_name, config, files)
+        return web.json_response({"job_name": job_name, "files": len(files)})
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+async def put_jobs_bundle(request: web.Request) -> web.Response:
+    """单流协议：配置与数据集打包为一个 tar（可 zstd 压缩），接收的同时解包"""
+    reader = await request.multipart()
+    part = await reader.next()
+    if part is None or part.name != "bundle":
+        raise web.HTTPBadRequest(text="missing bundle part")
+    compressed = (part.filename or "").endswith(".zst")
+    if compressed and zstandard is None:
+        raise web.HTTPUnsupportedMediaType(text="zstandard is not installed")
+
+    loop = asyncio.get_event_loop()
+    try:
+        manifest, config, missing = await loop.run_in_executor(
+            None, _unpack_bundle, _PartReader(part, loop), compressed
+        )
+    except (ValueError, tarfile.TarError, KeyError) as e:
+        raise web.HTTPBadRequest(text=f"invalid bundle: {e}")
+    if missing:
+        return web.json_response({"missing": missing}, status=409)
+
+    job_name = manifest.get("job_name")
+    if not _valid_name(job_name) or not _valid_name(manifest["config"]):
+        raise web.HTTPBadRequest(text=f"invalid job name or config: {job_name}, {manifest['config']}")
+    files = [{"name": f["name"], "sha256": f["sha256"]} for f in manifest["files"]]
+    _register_job(job_name, manifest["config"], config, files)
+    return web.json_response({"job_name": job_name, "files": len(files)})
+
+
+async def blobs_missing(request: web.Request) -> web.Response:
+    body = await request.json()
+    missing = [h for h in body.get("hashes", []) if not os.path.exists(_blob_path(h))]
+    return web.json_response({"missing": missing})
+
+
+async def put_blobs(request: web.Request) -> web.Response:
+    """按 SHA-256 上传文件，内容与文件名中的摘要不一致时拒绝"""
+    reader = await request.multipart()
+    stored = 0
+    while True:
+        part = await reader.next()
+        if part is None:
+            break
+        expected = (part.filename or "").lower()
+        if len(expected) != 64:
+            raise web.HTTPBadRequest(text=f"invalid blob name: {part.filename}")
+        staging_path = os.path.join(STUB_DATA_DIR, "blobs", "tmp", expected)
+        sha256 = await _save_part(part, staging_path)
+        if sha256 != expected:
+            os.remove(staging_path)
+            raise web.HTTPBadRequest(text=f"checksum mismatch for {expected}")
+        os.makedirs(os.path.dirname(_blob_path(sha256)), exist_ok=True)
+        os.replace(staging_path, _blob_path(sha256))
+        stored += 1
+    return web.json_response({"stored": stored})
+
+
+async def put_jobs_by_hash(request: web.Request) -> web.Response:
+    body = await request.json()
+    job_name = body.get("job_name")
+    if not _valid_name(job_name):
+        raise web.HTTPBadRequest(text=f"invalid job name: {job_name}")
+    files = body.get("files", [])
+    missing = sorted({f["sha256"] for f in files if not os.path.exists(_blob_path(f["sha256"]))})
+    if missing:
+        return web.json_response({"missing": missing}, status=409)
+    _register_job(job_name, body.get("config_name") or "config.yaml", body.get("config", ""), files)
+    return web.json_response({"job_name": job_name, "files": len(files)})
+
+
+async def status(request: web.Request) -> web.Response:
+    body = await request.json()
+    return web.json_response({"statuses": {name: _job_status(name) for name in body.get("job_names", [])}})
+
+
+async def capacity(request: web.Request) -> web.Response:
+    jobs_dir = os.path.join(STUB_DATA_DIR, "jobs")
+    names = os.listdir(jobs_dir) if os.path.isdir(jobs_dir) else []
+    active = sum(1 for name in names if _job_status(name) == "training")
+    return web.json_response({
+        "slots": STUB_SLOTS,
+        "running": min(active, STUB_SLOTS),
+        "queued": max(0, active - STUB_SLOTS)
+    })
+
+
+async def get_zip(request: web.Request) -> web.StreamResponse:
+    body = await request.json()
+    job_name = body.get("job_name")
+    job_status = _job_status(job_name)
+    if job_status == "training":
+        return web.Response(status=201)
+    if job_status != "done":
+        return web.Response(status=404)
+    return web.FileResponse(_result_archive(job_name), chunk_size=CHUNK_SIZE)
+
+
+def create_app() -> web.Application:
+    os.makedirs(STUB_DATA_DIR, exist_ok=True)
+    app = web.Application()
+    app.router.add_post("/put_jobs/", put_jobs)
+    app.router.add_post("/blobs/missing", blobs_missing)
+    app.router.add_post("/blobs/", put_blobs)
+    app.router.add_post("/put_jobs_by_hash/", put_jobs_by_hash)
+    app.router.add_post("/put_jobs_bundle/", put_jobs_bundle)
+    app.router.add_post("/status", status)
+    app.router.add_get("/capacity", capacity)
+    app.router.add_post("/get_zip/", get_zip)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地替身 toolkit")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=7860)
+    args = parser.parse_args()
+    web.run_app(create_app(), host=args.host, port=args.port)
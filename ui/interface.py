@@ -1,15 +1,14 @@
 import gradio as gr
 from config import Config
-from pg_db import get_task_list, get_db, Task
-import os
-from PIL import Image
-import asyncio
-import nest_asyncio
-from sqlalchemy.orm import Session
+from pg_db import get_task_page, TASK_LIST_HEADERS
+from services.task_list_broadcaster import get_broadcaster
+from services.result_cache import TaskResultCache
 
 
 def create_ui(training_manager):
     """创建 Gradio 界面"""
+    result_cache = TaskResultCache()
+
     with gr.Blocks(css="""
         .section-header h2 {
             font-size: 1.5rem;
@@ -108,10 +107,19 @@ def create_ui(training_manager):
                     # 左侧任务列表表格
                     with gr.Column(scale=2):
                         gr.Markdown("## 训练任务列表", elem_classes="section-header")
-                        task_list_data = get_task_list()
+                        monitor_status = gr.Markdown()
+                        # 分页状态：每页起始游标、当前页码、当前页数据及已同步的广播版本
+                        task_page_state = gr.State({
+                            "cursors": [None],
+                            "page": 0,
+                            "rows": None,
+                            "keys": [],
+                            "version": None
+                        })
+                        # 构建界面时不查询数据库，表格在页面加载后由 refresh_task_list 填充
                         task_list_output = gr.Dataframe(
-                            value=task_list_data["data"],
-                            headers=task_list_data["headers"],
+                            value=[],
+                            headers=TASK_LIST_HEADERS,
                             interactive=False,      # 设置为不可交互
                             wrap=True,             # 允许文本换行
                             height=550,            # 设置高度
@@ -135,6 +143,10 @@ def create_ui(training_manager):
                             line_breaks=True,      # 允许换行
                             min_width=160          # 最小宽度
                         )
+                        with gr.Row():
+                            prev_page_btn = gr.Button("上一页", size="sm", interactive=False)
+                            page_info = gr.Markdown("正在加载任务列表...")
+                            next_page_btn = gr.Button("下一页", size="sm", interactive=False)
                     
                     # 右侧图片展示区域
                     with gr.Column(scale=1):
@@ -177,23 +189,25 @@ def create_ui(training_manager):
                 traceback.print_exc()
                 return gr.update(value=None)
 
-        def view_task_results(evt: gr.SelectData):
+        def view_task_results(page_state, evt: gr.SelectData):
             """查看任务结果"""
             try:
                 row_index = evt.index[0]    # 行索引
                 col_index = evt.index[1]    # 列索引
                 print(f"选中行: {row_index}, 列: {col_index}, 值: {evt.value}")
                 
-                # 从任务列表中获取当前行的数据
-                task_list_data = get_task_list()
-                try:
-                    row_data = task_list_data["data"][row_index]
-                except IndexError:
-                    print(f"IndexError: 行索引超出范围: {row_index}")
-                    return None  # 只返回图片列表
+                # 优先使用前端回传的整行数据，行内自带任务 ID，不受刷新后行序变化影响
+                row_data = evt.row_value
+                if not row_data:
+                    try:
+                        row_data = page_state["rows"][row_index]
+                    except (IndexError, TypeError):
+                        print(f"IndexError: 行索引超出范围: {row_index}")
+                        return None  # 只返回图片列表
                 
                 task_id = int(row_data[0])      # ID 在第一列
                 result_text = row_data[3]       # Results 在第四列
+                updated = row_data[5]           # Updated 在第六列，作为缓存版本
                 
                 print(f"任务ID: {task_id}, 结果状态: {result_text}")
                 
@@ -201,15 +215,10 @@ def create_ui(training_manager):
                     print("该任务无结果可查看")
                     return None  # 只返回图片列表
 
-                db = next(get_db())
-                try:
-                    task = db.query(Task).filter(Task.id == task_id).first()
-                    if task and task.result_images:
-                        image_urls = [img["url"] for img in task.result_images]
-                        print(f"找到 {len(image_urls)} 张结果图片")
-                        return image_urls  # 只返回图片列表
-                finally:
-                    db.close()
+                image_urls = result_cache.get(task_id, updated)
+                if image_urls:
+                    print(f"找到 {len(image_urls)} 张结果图片")
+                    return image_urls  # 只返回图片列表
             except Exception as e:
                 print(f"处理任务结果时出错: {str(e)}")
                 import traceback
@@ -217,8 +226,8 @@ def create_ui(training_manager):
             return None  # 只返回图片列表
 
         # 事件处理函数
-        async def submit_training(*args):
-            """提交训练任务"""
+        async def submit_training(request: gr.Request, *args):
+            """提交训练任务，排队期间在结果框中显示排队位置和预计等待时间"""
             try:
                 print("开始处理训练提交...")
                 print(f"接收到的参数: {args}")
@@ -226,37 +235,141 @@ def create_ui(training_manager):
                 model, name, files, *advanced_args = args
                 
                 if not files:
-                    return gr.update(value="请上传文件")
+                    yield gr.update(value="请上传文件")
+                    return
                 if not name:
-                    return gr.update(value="请输入任务名称")
+                    yield gr.update(value="请输入任务名称")
+                    return
 
                 print(f"模型: {model}, 任务名: {name}, 文件数: {len(files) if files else 0}")
 
-                # 使用 nest_asyncio 确保异步调用正常工作
-                nest_asyncio.apply()
-                
-                # 调用训练管理器提交任务
-                result = await training_manager.submit_training(
-                    model, name, files, *advanced_args
-                )
+                # 按会话公平排队，一个会话的大量提交不会阻塞其他会话
+                user = getattr(request, "username", None) or getattr(request, "session_hash", None) or "anonymous"
+                result = None
+                async for result in training_manager.submit_training_queued(
+                    user, model, name, files, *advanced_args
+                ):
+                    yield gr.update(value=result)
                 
                 print(f"训练任务提交结果: {result}")
-                return gr.update(value=result)
                 
             except Exception as e:
                 print(f"提交训练失败: {str(e)}")
                 import traceback
                 traceback.print_exc()
-                return gr.update(value=f"提交失败: {str(e)}")
-
-        def refresh_task_list():
-            """刷新任务列表"""
-            task_list_data = get_task_list()
-            return gr.update(
-                value=task_list_data["data"],
-                headers=task_list_data["headers"]
+                yield gr.update(value=f"提交失败: {str(e)}")
+
+        def _task_page_outputs(page_state):
+            """根据分页状态生成表格及分页控件的更新"""
+            page = page_state["page"]
+            has_next = page + 1 < len(page_state["cursors"])
+            return (
+                gr.update(value=page_state["rows"], headers=TASK_LIST_HEADERS),
+                f"第 {page + 1} 页",
+                page_state,
+                gr.update(interactive=page > 0),
+                gr.update(interactive=has_next)
             )
 
+        def _set_task_page(page_state, version, task_list_data):
+            """将查询到的页面写入分页状态"""
+            cursors = page_state["cursors"]
+            page = page_state["page"]
+
+            # 重新记录下一页的起始游标
+            del cursors[page + 1:]
+            if task_list_data["next_cursor"] is not None:
+                cursors.append(task_list_data["next_cursor"])
+
+            page_state["rows"] = [list(row) for row in task_list_data["data"]]
+            page_state["keys"] = list(task_list_data["keys"])
+            page_state["version"] = version
+
+        def _render_task_page(page_state):
+            """按当前页游标取任务列表，并更新分页状态
+
+            第一页直接使用共享快照，其余页面按游标查询数据库。
+            共享快照尚未生成（刚启动或数据库暂不可用）时保持加载状态，下次轮询时重试。
+            """
+            broadcaster = get_broadcaster()
+            page = page_state["page"]
+            if page == 0:
+                version, task_list_data = broadcaster.first_page(timeout=Config.TASK_LIST_POLL_INTERVAL)
+                if task_list_data is None:
+                    return gr.update(), "正在加载任务列表...", page_state, gr.update(), gr.update()
+            else:
+                # 先取版本号再查询，期间的变更会在下一次刷新时重新合并
+                version = broadcaster.version
+                task_list_data = get_task_page(
+                    Config.TASK_PAGE_SIZE,
+                    page_state["cursors"][page]
+                )
+            _set_task_page(page_state, version, task_list_data)
+            return _task_page_outputs(page_state)
+
+        def _apply_task_changes(page_state, changes):
+            """将变更行原地合并到当前页，返回当前页是否发生变化"""
+            rows = page_state["rows"]
+            positions = {row[0]: i for i, row in enumerate(rows)}
+            changed = False
+            for _, row in changes:
+                i = positions.get(row[0])
+                if i is not None and rows[i] != row:
+                    rows[i] = list(row)
+                    changed = True
+            return changed
+
+        def refresh_task_list(page_state):
+            """从共享广播器增量刷新任务列表（当前页），没有变化时不下发数据"""
+            if page_state.get("rows") is None:
+                return _render_task_page(page_state)
+
+            broadcaster = get_broadcaster()
+            unchanged = (gr.update(), gr.update(), page_state, gr.update(), gr.update())
+            if broadcaster.version == page_state["version"]:
+                return unchanged
+
+            if page_state["page"] == 0:
+                version, task_list_data = broadcaster.first_page()
+                if task_list_data["data"] == page_state["rows"]:
+                    page_state["version"] = version
+                    return unchanged
+                _set_task_page(page_state, version, task_list_data)
+                return _task_page_outputs(page_state)
+
+            version, changes = broadcaster.changes_since(page_state["version"])
+            if changes is None:
+                # 变更日志已无法覆盖，重新查询当前页
+                return _render_task_page(page_state)
+
+            page_state["version"] = version
+            if not _apply_task_changes(page_state, changes):
+                return unchanged
+            return _task_page_outputs(page_state)
+
+        def refresh_monitor_status():
+            """显示任务监控进程是否在运行"""
+            status = get_broadcaster().monitor_status()
+            if status is None:
+                return "⚪ 无法查询任务监控状态"
+            if status["alive"]:
+                return f"🟢 任务监控运行中：{status['alive']} 个进程，正在监控 {status['tracked_tasks']} 个任务"
+            if status["last_seen_seconds"] is None:
+                return "🔴 没有运行中的任务监控进程，任务状态不会更新"
+            return f"🔴 没有运行中的任务监控进程（最近一次心跳在 {int(status['last_seen_seconds'])} 秒前），任务状态不会更新"
+
+        def prev_task_page(page_state):
+            """上一页"""
+            if page_state["page"] > 0:
+                page_state["page"] -= 1
+            return _render_task_page(page_state)
+
+        def next_task_page(page_state):
+            """下一页"""
+            if page_state["page"] + 1 < len(page_state["cursors"]):
+                page_state["page"] += 1
+            return _render_task_page(page_state)
+
         # 事件绑定
         image_upload.change(
             fn=process_images,
@@ -269,9 +382,32 @@ def create_ui(training_manager):
 
         task_list_output.select(
             fn=view_task_results,
+            inputs=task_page_state,
             outputs=results_gallery  # 只更新图片列表
         )
 
+        task_page_outputs = [
+            task_list_output,
+            page_info,
+            task_page_state,
+            prev_page_btn,
+            next_page_btn
+        ]
+
+        prev_page_btn.click(
+            fn=prev_task_page,
+            inputs=task_page_state,
+            outputs=task_page_outputs,
+            show_progress=False
+        )
+
+        next_page_btn.click(
+            fn=next_task_page,
+            inputs=task_page_state,
+            outputs=task_page_outputs,
+            show_progress=False
+        )
+
         # close_gallery_btn.click(
         #     fn=lambda: [gr.update(visible=False), None],
         #     outputs=[results_gallery_box, results_gallery]
@@ -288,13 +424,20 @@ def create_ui(training_manager):
             api_name="submit_training",
             show_progress=True,
             queue=True,
-            concurrency_limit=1  # 设置并发限制
+            concurrency_limit=None  # 并发由 TrainingManager 的提交调度控制
         )
 
         demo.load(
             fn=refresh_task_list,
-            outputs=task_list_output,
-            every=10  # 每10秒刷新一次
+            inputs=task_page_state,
+            outputs=task_page_outputs,
+            every=Config.TASK_LIST_POLL_INTERVAL  # 定时读取共享任务列表
+        )
+
+        demo.load(
+            fn=refresh_monitor_status,
+            outputs=monitor_status,
+            every=Config.MONITOR_INTERVAL  # 监控心跳间隔
         )
 
     return demo 
\ No newline at end of file